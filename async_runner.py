@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+外部命令的异步执行层
+所有gs/qpdf调用都在同一个后台事件循环中用asyncio.create_subprocess_exec执行，
+由全局信号量限制同时运行的子进程数量。stdout和stderr并发读取并限制保留的大小，
+每个命令有独立的超时；取消任务时子进程随之结束
+
+同步代码（引擎、GUI、批量处理）使用run_sync/run_all，异步代码可以直接
+await run()（在runner的事件循环中）或 await asyncio.wrap_future(submit(...))（在其他事件循环中）
+
+信号量只在一个进程之内有效。批量处理的进程池中每个工作进程都有自己的runner，
+由set_default_concurrency把每个进程的上限分摊下去，使子进程总数仍与单进程时相当
+"""
+
+import asyncio
+import codecs
+import locale
+import os
+import subprocess
+import threading
+from collections import deque
+
+# stderr（以及逐行处理的stdout）只保留末尾的字符数
+OUTPUT_TAIL_LIMIT = 256 * 1024
+
+# 完整收集的stdout上限，超出时结束子进程，避免异常输出占满内存
+STDOUT_LIMIT = 64 * 1024 * 1024
+
+# watch判定失败后，等待进程输出剩余错误上下文的时间（秒）
+ABORT_GRACE = 0.5
+
+# 每次从管道读取的字节数
+READ_CHUNK = 64 * 1024
+
+
+class ProcessAborted(Exception):
+    """输出中出现致命错误或输出超过上限，子进程被提前结束"""
+
+    def __init__(self, reason, cmd, stdout='', stderr=''):
+        super().__init__(reason)
+        self.cmd = cmd
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class OutputTail:
+    """只保留最后limit个字符的输出缓冲，避免大量警告信息堆积在内存中"""
+
+    def __init__(self, limit=OUTPUT_TAIL_LIMIT):
+        self.limit = limit
+        self.dropped = 0
+        self._parts = deque()
+        self._size = 0
+
+    def write(self, text):
+        if len(text) > self.limit:
+            self.dropped += len(text) - self.limit
+            text = text[-self.limit:]
+        self._parts.append(text)
+        self._size += len(text)
+        while self._size > self.limit:
+            part = self._parts.popleft()
+            self._size -= len(part)
+            self.dropped += len(part)
+
+    def getvalue(self):
+        text = ''.join(self._parts)
+        if self.dropped:
+            text = f"... (已省略前面的{self.dropped}个字符)\n" + text
+        return text
+
+
+class OutputLimit:
+    """完整保留输出，超过limit个字符时通知调用者"""
+
+    def __init__(self, limit=STDOUT_LIMIT):
+        self.limit = limit
+        self.exceeded = False
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        if self.exceeded:
+            return
+        self._size += len(text)
+        if self._size > self.limit:
+            self.exceeded = True
+            return
+        self._parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self._parts)
+
+
+class _Abort:
+    """读取协程之间共享的提前终止状态"""
+
+    def __init__(self):
+        self.reason = None
+        self.event = asyncio.Event()
+
+    def set(self, reason):
+        if self.reason is None:
+            self.reason = reason
+            self.event.set()
+
+
+async def _pump(stream, sink, on_line, watch, abort, encoding):
+    """按块读取管道并切分为行；不使用readline，超长的行不会出错"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    while True:
+        data = await stream.read(READ_CHUNK)
+        text = decoder.decode(data, final=not data)
+        if text:
+            lines = (pending + text.replace('\r\n', '\n')).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                _handle_line(line + '\n', sink, on_line, watch, abort)
+        if not data:
+            break
+    if pending:
+        _handle_line(pending, sink, on_line, watch, abort)
+
+
+def _handle_line(line, sink, on_line, watch, abort):
+    sink.write(line)
+    if getattr(sink, 'exceeded', False):
+        abort.set(f"输出超过上限 {sink.limit} 个字符")
+    if on_line:
+        on_line(line)
+    if watch:
+        # 终止后仍继续检查，让watch收集后续的错误上下文
+        reason = watch(line)
+        if reason:
+            abort.set(reason)
+
+
+async def _kill(process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+class AsyncProcessRunner:
+    """在一个后台事件循环中执行外部命令，最多max_concurrency个同时运行"""
+
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = max_concurrency or max(4, os.cpu_count() or 1)
+        self.encoding = locale.getpreferredencoding(False)
+        self._loop = None
+        self._loop_pid = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    # ----- 事件循环 -----
+
+    @property
+    def loop(self):
+        """后台事件循环，第一次使用时在守护线程中启动
+
+        fork出的子进程（进程池中的工作进程）没有父进程的事件循环线程，会重新启动一个
+        """
+        with self._lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                # Windows上只有Proactor事件循环支持子进程
+                loop = asyncio.ProactorEventLoop() if os.name == 'nt' else asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=serve, name='process-runner', daemon=True).start()
+                ready.wait()
+                self._loop = loop
+                self._loop_pid = os.getpid()
+            return self._loop
+
+    # ----- 异步接口 -----
+
+    async def run(self, cmd, timeout=None, input=None, on_stdout=None, watch=None,
+                  stdout_limit=STDOUT_LIMIT, stderr_limit=OUTPUT_TAIL_LIMIT):
+        """执行cmd并返回CompletedProcess（文本输出），必须在runner的事件循环中await
+
+        stderr只保留末尾stderr_limit个字符；传入on_stdout时每行stdout交给它，
+        stdout同样只保留末尾，否则完整收集，超过stdout_limit时结束进程。
+        watch(line)检查每一行输出，返回非空的原因时结束进程并抛出ProcessAborted。
+        超时抛出subprocess.TimeoutExpired；任务被取消时结束进程后继续传播CancelledError
+        """
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *[str(part) for part in cmd],
+                stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout = OutputTail(stderr_limit) if on_stdout else OutputLimit(stdout_limit)
+            stderr = OutputTail(stderr_limit)
+            abort = _Abort()
+            readers = asyncio.gather(
+                _pump(process.stdout, stdout, on_stdout, watch, abort, self.encoding),
+                _pump(process.stderr, stderr, None, watch, abort, self.encoding))
+            writer = asyncio.ensure_future(self._feed(process, input))
+
+            def output():
+                return stdout.getvalue(), stderr.getvalue()
+
+            try:
+                finished = asyncio.ensure_future(process.wait())
+                aborted = asyncio.ensure_future(abort.event.wait())
+                try:
+                    done, _ = await asyncio.wait({finished, aborted}, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    aborted.cancel()
+                if not done:
+                    await _kill(process)
+                    await readers
+                    raise subprocess.TimeoutExpired(cmd, timeout, *output())
+                if finished not in done:
+                    # 给进程一点时间输出剩余的错误上下文，然后强制结束
+                    try:
+                        await asyncio.wait_for(asyncio.shield(finished), ABORT_GRACE)
+                    except asyncio.TimeoutError:
+                        await _kill(process)
+                await readers
+            except asyncio.CancelledError:
+                await _kill(process)
+                readers.cancel()
+                raise
+            finally:
+                writer.cancel()
+
+            if abort.reason:
+                raise ProcessAborted(abort.reason, cmd, *output())
+            return subprocess.CompletedProcess(cmd, process.returncode, *output())
+
+    @staticmethod
+    async def _feed(process, data):
+        if data is None:
+            return
+        try:
+            process.stdin.write(data)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def _run_cancellable(self, cmd, cancel_event, **kwargs):
+        """执行run，cancel_event被设置时取消它，并等子进程结束、回收之后才抛出CancelledError"""
+        task = asyncio.ensure_future(self.run(cmd, **kwargs))
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=0.1)
+            if done:
+                return task.result()
+            if cancel_event.is_set():
+                task.cancel()
+                return await task
+
+    # ----- 线程安全的接口 -----
+
+    def submit(self, cmd, cancel_event=None, **kwargs):
+        """在后台事件循环中执行，返回concurrent.futures.Future，可从任何线程调用
+
+        要中途停止时设置cancel_event（threading.Event），不要直接cancel()返回的future：
+        后者立即返回，子进程可能还没有结束。设置cancel_event后future在子进程被回收之后
+        才以CancelledError结束
+        """
+        if cancel_event is not None:
+            coro = self._run_cancellable(cmd, cancel_event, **kwargs)
+        else:
+            coro = self.run(cmd, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run_sync(self, cmd, timeout=None, cancel_event=None, **kwargs):
+        """阻塞执行，cancel_event被设置时结束子进程并抛出concurrent.futures.CancelledError
+
+        取消时等子进程被回收之后才返回，调用者可以立即删除它使用的临时文件
+        """
+        return self.submit(cmd, cancel_event, timeout=timeout, **kwargs).result()
+
+    def run_all(self, cmds, timeout=None):
+        """并发执行多个命令，按顺序返回CompletedProcess或异常对象"""
+        futures = [self.submit(cmd, timeout=timeout) for cmd in cmds]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+_default_runner = None
+_default_lock = threading.Lock()
+
+
+def default_runner():
+    """进程内共享的AsyncProcessRunner"""
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = AsyncProcessRunner()
+        return _default_runner
+
+
+def set_default_concurrency(max_concurrency):
+    """设置本进程共享runner的并发上限
+
+    必须在本进程第一次执行命令之前调用（例如进程池的initializer中），之后信号量已经创建
+    """
+    runner = default_runner()
+    with runner._lock:
+        if runner._loop is not None and runner._loop_pid == os.getpid():
+            raise RuntimeError("AsyncProcessRunner已经启动，无法再修改并发上限")
+        runner.max_concurrency = max(1, max_concurrency)
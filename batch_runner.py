@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理
+按命名约定（book.pdf 对应 book.toc.txt）或清单文件把PDF与目录配对，
+在与CPU核数相同的进程池中执行，每个结果追加写入JSONL日志。
+中断后重新运行时，输入和参数未变化且输出仍存在的已完成文件会被跳过
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+DEFAULT_TOC_SUFFIX = '.toc.txt'
+DEFAULT_JOURNAL_NAME = 'bookmark_batch.jsonl'
+OUTPUT_SUFFIX = '_with_bookmarks'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class BatchItem:
+    """一个待处理的PDF及其目录文件"""
+
+    def __init__(self, pdf, toc, output, offset=1, encoding='utf-8'):
+        self.pdf = Path(pdf)
+        self.toc = Path(toc)
+        self.output = Path(output)
+        self.offset = offset
+        self.encoding = encoding
+
+    @property
+    def key(self):
+        return str(self.pdf.resolve())
+
+    def fingerprint(self):
+        """输入PDF和目录文件的(大小, mtime)，用于判断是否需要重新处理"""
+        pdf_stat = self.pdf.stat()
+        toc_stat = self.toc.stat()
+        return [pdf_stat.st_size, pdf_stat.st_mtime_ns, toc_stat.st_size, toc_stat.st_mtime_ns]
+
+    def to_dict(self):
+        return {'pdf': str(self.pdf), 'toc': str(self.toc), 'output': str(self.output),
+                'offset': self.offset, 'encoding': self.encoding}
+
+    def settings(self, operation):
+        """影响输出内容的参数：目录文件及其编码、输出路径、偏移和操作"""
+        return {'toc': str(self.toc.resolve()), 'encoding': self.encoding,
+                'output': str(self.output.resolve()), 'offset': self.offset, 'operation': operation}
+
+
+def output_path(pdf, output_dir=None, root=None):
+    """与generate_bookmarks相同的命名：<文件名>_with_bookmarks.pdf
+
+    指定output_dir时保持相对root的目录结构
+    """
+    pdf = Path(pdf)
+    name = f"{pdf.stem}{OUTPUT_SUFFIX}.pdf"
+    if output_dir is None:
+        return pdf.parent / name
+    relative = pdf.parent.relative_to(root) if root else Path()
+    return Path(output_dir) / relative / name
+
+
+def discover_pairs(directory, toc_suffix=DEFAULT_TOC_SUFFIX, recursive=True, offset=1, output_dir=None,
+                   encoding='utf-8'):
+    """按命名约定查找PDF和目录文件，返回(BatchItem列表, 缺少目录文件的PDF列表)"""
+    root = Path(directory)
+    pattern = '**/*' if recursive else '*'
+    items = []
+    missing = []
+    for pdf in sorted(root.glob(pattern)):
+        if pdf.suffix.lower() != '.pdf' or not pdf.is_file():
+            continue
+        # 跳过之前生成的输出文件
+        if pdf.stem.endswith(OUTPUT_SUFFIX) or pdf.stem.endswith('_no_bookmarks'):
+            continue
+        toc = pdf.with_name(pdf.stem + toc_suffix)
+        if toc.is_file():
+            items.append(BatchItem(pdf, toc, output_path(pdf, output_dir, root), offset, encoding))
+        else:
+            missing.append(pdf)
+    return items, missing
+
+
+def load_manifest(manifest_path, offset=1, output_dir=None, encoding='utf-8'):
+    """读取JSONL清单，每行 {"pdf": ..., "toc": ..., "offset": 可选, "output": 可选, "encoding": 可选}
+
+    相对路径相对于清单文件所在目录
+    """
+    manifest_path = Path(manifest_path)
+    base = manifest_path.parent
+    items = []
+    with open(manifest_path, encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+                pdf = base / entry['pdf']
+                toc = base / entry['toc']
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"清单第{line_num}行格式错误: {e}") from e
+            output = base / entry['output'] if entry.get('output') else output_path(pdf, output_dir, base)
+            items.append(BatchItem(pdf, toc, output, entry.get('offset', offset),
+                                   entry.get('encoding', encoding)))
+    return items
+
+
+class BatchJournal:
+    """JSONL格式的结果日志，每完成一个文件追加一行，同一文件以最后一行为准"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.records = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.records[record['key']] = record
+                    except (ValueError, KeyError, TypeError):
+                        # 中断时可能留下不完整的最后一行
+                        continue
+        self._file = None
+
+    def is_finished(self, item, operation):
+        """上次已用相同的参数成功处理，且输入未变化、输出仍存在"""
+        record = self.records.get(item.key)
+        if not record or record.get('status') != STATUS_DONE:
+            return False
+        try:
+            return (record.get('settings') == item.settings(operation)
+                    and record.get('fingerprint') == item.fingerprint() and item.output.exists())
+        except OSError:
+            return False
+
+    def append(self, record):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.records[record['key']] = record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# 每个工作进程一个引擎，工具探测结果和吞吐量估计在进程内复用
+_worker_engine = None
+
+
+def _init_worker(max_processes):
+    """进程池的initializer：各工作进程分摊外部命令的并发上限"""
+    from async_runner import set_default_concurrency
+    set_default_concurrency(max_processes)
+
+
+def process_item(item_dict, operation, preferred=None, timeout=None, use_cache=True, safety_factor=None):
+    """在工作进程中处理一个文件，返回结果记录（不抛出异常）"""
+    global _worker_engine
+    from bookmark_core import BookmarkTable
+    from bookmark_engine import BookmarkEngine, BookmarkJob, EngineError
+    from build_cache import BuildCache
+
+    if _worker_engine is None:
+        _worker_engine = BookmarkEngine(cache=BuildCache() if use_cache else None)
+    if safety_factor:
+        _worker_engine.safety_factor = safety_factor
+
+    item = BatchItem(**item_dict)
+    record = {'key': item.key, **item.to_dict(), 'operation': operation,
+              'settings': item.settings(operation)}
+    start = time.monotonic()
+    job = None
+    try:
+        record['fingerprint'] = item.fingerprint()
+        with open(item.toc, encoding=item.encoding, newline='') as f:
+            bookmarks = BookmarkTable.from_lines(f)
+        if not bookmarks:
+            raise ValueError("目录中没有可用的书签")
+        item.output.parent.mkdir(parents=True, exist_ok=True)
+        job = BookmarkJob(operation, item.pdf, item.output, bookmarks, item.offset, timeout=timeout)
+        result = _worker_engine.run(job, preferred=preferred)
+    except EngineError as e:
+        record.update(status=STATUS_FAILED, error=e.format_log())
+    except Exception as e:
+        record.update(status=STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+    else:
+        record.update(status=STATUS_DONE, backend=result.backend.name, count=result.count,
+                      output_size=item.output.stat().st_size, cached=result.cached)
+    if job is not None and job.time_budget is not None:
+        record['time_budget'] = round(job.time_budget, 1)
+    record['duration'] = round(time.monotonic() - start, 3)
+    record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return record
+
+
+class BatchRunner:
+    """在进程池中处理一批BatchItem，结果写入BatchJournal"""
+
+    def __init__(self, journal, operation='add', workers=None, preferred=None, timeout=None, log=None,
+                 use_cache=True, safety_factor=None):
+        self.journal = journal
+        self.operation = operation
+        self.workers = workers or os.cpu_count() or 1
+        self.preferred = preferred
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.safety_factor = safety_factor
+        self.log = log or (lambda message: None)
+
+    def run(self, items, retry_failed=True):
+        """处理items，返回统计字典；KeyboardInterrupt时等待正在处理的文件结束后再抛出"""
+        stats = {'total': len(items), 'skipped': 0, 'done': 0, 'failed': 0, 'elapsed': 0.0}
+        pending = []
+        for item in items:
+            record = self.journal.records.get(item.key)
+            if self.journal.is_finished(item, self.operation):
+                stats['skipped'] += 1
+            elif not retry_failed and record and record.get('status') == STATUS_FAILED:
+                stats['skipped'] += 1
+            else:
+                pending.append(item)
+        if not pending:
+            return stats
+
+        start = time.monotonic()
+        workers = min(self.workers, len(pending))
+        # 每个工作进程的AsyncProcessRunner各有一个信号量，分块并行的Ghostscript
+        # 在每个进程中再启动多个gs，这里把单进程时的上限分给各个工作进程
+        from async_runner import default_runner
+        max_processes = max(1, default_runner().max_concurrency // workers)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(max_processes,))
+        futures = {}
+        try:
+            for item in pending:
+                future = executor.submit(process_item, item.to_dict(), self.operation,
+                                         self.preferred, self.timeout, self.use_cache, self.safety_factor)
+                futures[future] = item
+            for finished, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                self.journal.append(record)
+                stats[record['status']] += 1
+                if record['status'] == STATUS_DONE:
+                    source = "缓存" if record.get('cached') else f"{record['duration']:.1f} 秒"
+                    self.log(f"[{finished}/{len(pending)}] ✅ {record['pdf']} ({source})")
+                else:
+                    first_line = record['error'].splitlines()[0] if record['error'] else ''
+                    self.log(f"[{finished}/{len(pending)}] ❌ {record['pdf']}: {first_line}")
+        except KeyboardInterrupt:
+            # 已排队的文件不再处理，已完成的结果都已写入日志
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self.journal.close()
+            stats['elapsed'] = time.monotonic() - start
+        return stats
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+书签核心数据结构
+Bookmark为单个书签记录，BookmarkTable按列保存整份目录（标题列表加整数数组），
+目录只解析一次，预览、验证和生成共用同一份结果。
+页码换算和pdfmarks生成也集中在这里，GUI、验证工具和各后端不再各自实现
+"""
+
+from array import array
+
+from toc_parser import LINE_ENTRY, LINE_INVALID, LINE_OFFSET, iter_lines, scan_toc_lines
+
+
+def final_page(adjusted_page, offset):
+    """书签页码换算为PDF页码（从1开始），offset为书签第1页对应的PDF页码"""
+    return adjusted_page + offset - 1
+
+
+class Bookmark:
+    """单个书签
+
+    page为已应用动态偏移的页码，offset为解析时生效的动态偏移，
+    line_num为在目录文本中的行号，level为书签层级（从1开始）
+    """
+
+    __slots__ = ('title', 'page', 'offset', 'line_num', 'level')
+
+    def __init__(self, title, page, offset=0, line_num=0, level=1):
+        self.title = title
+        self.page = page
+        self.offset = offset
+        self.line_num = line_num
+        self.level = level
+
+    def final_page(self, base_offset):
+        return final_page(self.page, base_offset)
+
+    def __iter__(self):
+        # 兼容按(标题, 调整后页码, 偏移)解包的旧代码
+        yield self.title
+        yield self.page
+        yield self.offset
+
+    def __repr__(self):
+        return f"Bookmark({self.title!r}, {self.page}, offset={self.offset}, line_num={self.line_num})"
+
+
+class BookmarkTable:
+    """按列存储的书签表
+
+    迭代时产出(标题, 调整后页码, 偏移)元组，可直接交给各写入后端；
+    需要完整信息时使用records()或下标访问得到Bookmark
+    """
+
+    def __init__(self):
+        self.titles = []
+        self.pages = array('q')
+        self.offsets = array('i')
+        self.line_nums = array('i')
+        self.levels = array('i')
+        self.invalid_lines = []    # (行号, 行内容)：缺少页码的行
+        self.offset_lines = []     # (行号, 行内容, 当前偏移)：偏移指令
+
+    @classmethod
+    def from_lines(cls, lines, log=None):
+        """从行迭代器解析目录；log用于输出偏移指令的提示信息，例如print"""
+        table = cls()
+        for kind, line_num, line, value, current_offset in scan_toc_lines(lines):
+            if kind == LINE_ENTRY:
+                title, adjusted_page = value
+                try:
+                    table.append(title, adjusted_page, current_offset, line_num)
+                except OverflowError:
+                    table.invalid_lines.append((line_num, line))
+            elif kind == LINE_OFFSET:
+                table.offset_lines.append((line_num, line, current_offset))
+                if log:
+                    log(f"第{line_num}行: 检测到偏移指令 '{line}'，当前偏移调整为: {current_offset}")
+            elif kind == LINE_INVALID:
+                table.invalid_lines.append((line_num, line))
+        return table
+
+    @classmethod
+    def from_text(cls, toc_text, log=None):
+        return cls.from_lines(iter_lines(toc_text), log)
+
+    def append(self, title, page, offset=0, line_num=0, level=1):
+        # 先写入数组，溢出时不会留下不完整的行
+        self.pages.append(page)
+        try:
+            self.offsets.append(offset)
+            self.line_nums.append(line_num)
+            self.levels.append(level)
+        except OverflowError:
+            del self.pages[len(self.titles):]
+            del self.offsets[len(self.titles):]
+            del self.line_nums[len(self.titles):]
+            del self.levels[len(self.titles):]
+            raise
+        self.titles.append(title)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __bool__(self):
+        return bool(self.titles)
+
+    def __iter__(self):
+        return zip(self.titles, self.pages, self.offsets)
+
+    def __getitem__(self, index):
+        return Bookmark(self.titles[index], self.pages[index], self.offsets[index],
+                        self.line_nums[index], self.levels[index])
+
+    def records(self):
+        """逐个产出Bookmark"""
+        for i in range(len(self.titles)):
+            yield self[i]
+
+    def final_pages(self, base_offset):
+        """逐个产出PDF页码"""
+        for page in self.pages:
+            yield final_page(page, base_offset)
+
+    def is_sorted(self):
+        """页码是否按非递减顺序排列"""
+        pages = self.pages
+        return all(pages[i] <= pages[i + 1] for i in range(len(pages) - 1))
+
+
+# ---------------------------------------------------------------------------
+# pdfmarks
+# ---------------------------------------------------------------------------
+
+def clean_title_for_postscript(title):
+    """清理标题，使其符合PostScript语法要求"""
+    # PostScript字符串中需要转义的字符: ( ) \
+    clean_title = title.replace('\\', '\\\\')  # 转义反斜杠
+    clean_title = clean_title.replace('(', '\\(')  # 转义左括号
+    clean_title = clean_title.replace(')', '\\)')  # 转义右括号
+
+    # 移除其他可能导致问题的字符
+    clean_title = clean_title.replace('\n', ' ')  # 换行符替换为空格
+    clean_title = clean_title.replace('\r', ' ')  # 回车符替换为空格
+    clean_title = clean_title.replace('\t', ' ')  # 制表符替换为空格
+
+    return clean_title.strip()
+
+
+def iter_pdfmarks(bookmarks, offset):
+    """逐行产出PDF书签格式（pdfmarks），bookmarks可以是任意可迭代对象"""
+    yield '%!PS'
+    for title, adjusted_page, _ in bookmarks:
+        # adjusted_page已经包含了动态偏移，再加上基础偏移（pdfmark的/Page从1开始）
+        yield f'[ /Title ({clean_title_for_postscript(title)}) /Page {final_page(adjusted_page, offset)} /OUT pdfmark'
+
+
+def write_pdfmarks(stream, bookmarks, offset):
+    """把pdfmarks逐行写入文本流，返回书签数量"""
+    count = -1
+    for count, line in enumerate(iter_pdfmarks(bookmarks, offset)):
+        if count:
+            stream.write('\n')
+        stream.write(line)
+    return count
+
+
+def build_pdfmarks(bookmarks, offset):
+    """生成PDF书签格式（pdfmarks）"""
+    return '\n'.join(iter_pdfmarks(bookmarks, offset))
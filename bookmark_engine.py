@@ -0,0 +1,1165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+书签处理引擎
+Ghostscript、qpdf和进程内增量写入器作为后端注册到引擎中，并声明各自的能力。
+每个任务由引擎根据输入大小和实测吞吐量选择代价最低的可用后端，
+后端缺失或执行失败时自动回退到下一个后端。
+本模块不依赖tkinter，可供GUI和命令行共同使用
+"""
+
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import (CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError,
+                                wait as wait_futures)
+from pathlib import Path
+
+from async_runner import OUTPUT_TAIL_LIMIT, ProcessAborted, default_runner
+from bookmark_core import iter_pdfmarks, write_pdfmarks
+from gs_api import GhostscriptAborted, GhostscriptAPIError, GhostscriptLibrary, find_libgs
+from pdf_outline_writer import IncrementalOutlineWriter, write_outline_incremental
+from pdf_structure import PDFStructureError, read_page_count, read_pdf_summary
+from qpdf_outline import QpdfBackendError, QpdfOutlineBackend
+from tool_discovery import (CAP_JSON_V2, CAP_PDFWRITE, default_cache_path, default_discovery,
+                            get_common_ghostscript_paths)
+from validation_rules import page_range_errors
+
+# 后端能力
+CAP_ADD_OUTLINE = 'add_outline'            # 可以添加书签
+CAP_CLEAR_OUTLINE = 'clear_outline'        # 可以清除原有书签
+CAP_REPLACE_OUTLINE = 'replace_outline'    # 可以一次完成清除旧书签和写入新书签
+CAP_PRESERVES_STREAMS = 'preserves_streams'  # 不重新编码页面内容和图像流
+CAP_NESTING = 'supports_nesting'           # 支持多级书签
+CAP_REWRITE = 'rewrites_pages'             # 用pdfwrite重新生成所有页面，可修复损坏的PDF
+
+OP_ADD = 'add'
+OP_CLEAR = 'clear'
+OP_REPLACE = 'replace'
+
+OPERATION_CAPABILITIES = {
+    OP_ADD: CAP_ADD_OUTLINE,
+    OP_CLEAR: CAP_CLEAR_OUTLINE,
+    OP_REPLACE: CAP_REPLACE_OUTLINE,
+}
+
+# 分块并行渲染：每块至少的页数
+MIN_CHUNK_PAGES = 25
+
+# 自适应超时：预计耗时乘以安全系数，且不少于MIN_TIMEOUT秒
+DEFAULT_SAFETY_FACTOR = 4.0
+MIN_TIMEOUT = 10.0
+# 读不出页数（通常是结构损坏的文件）时，逐页处理的后端无法估算，至少给这么多秒
+UNKNOWN_PAGES_TIMEOUT = 120.0
+
+# 吞吐量统计文件格式版本
+STATS_VERSION = 1
+
+# Ghostscript（不带-q时）的进度输出
+GS_PROCESSING_PATTERN = re.compile(r'Processing pages (\d+) through (\d+)')
+GS_PAGE_PATTERN = re.compile(r'Page (\d+)\s*$')
+
+# Ghostscript输出中表示任务注定失败的错误
+GS_PDFMARK_ERROR_PATTERN = re.compile(r'Error: /(\w+) in (?:--)?pdfmark')
+GS_UNRECOVERABLE_PATTERN = re.compile(r'Unrecoverable error')
+# 一次xref修复的开始（之后的 "**** Error: ... XREF table" 等说明行属于同一次修复，不单独计数）
+GS_XREF_REPAIR_PATTERN = re.compile(r'(?i)rebuilding xref table|will attempt to (?:recover|reconstruct|repair)')
+# 修复本身失败
+GS_XREF_FATAL_PATTERN = re.compile(
+    r'(?i)(?:fail(?:ed)? to|could(?:n\'t| not)|unable to|cannot) (?:repair|reconstruct|rebuild)')
+GS_POSITION_PATTERN = re.compile(r'Current file position is (\d+)')
+
+
+class BackendError(Exception):
+    """后端执行失败，附带命令和输出以便显示错误详情"""
+
+    def __init__(self, message, cmd=None, stdout='', stderr='', details=''):
+        super().__init__(message)
+        self.cmd = cmd
+        self.stdout = stdout
+        self.stderr = stderr
+        self.details = details
+        # 能定位到出错的书签时：目录中的行号和对应的pdfmark
+        self.source_line = None
+        self.source_text = ''
+
+    def format_log(self):
+        """格式化为show_error_log使用的错误详情"""
+        lines = [str(self)]
+        if self.source_text:
+            where = f"目录第{self.source_line}行" if self.source_line else "位置未知"
+            lines.append(f"\n出错的书签 ({where}):\n{self.source_text}")
+        if self.cmd:
+            lines.append(f"\n执行的命令:\n{' '.join(str(c) for c in self.cmd)}")
+        if self.stdout:
+            lines.append(f"\n标准输出:\n{self.stdout}")
+        if self.stderr:
+            lines.append(f"\n错误输出:\n{self.stderr}")
+        if self.details:
+            lines.append(f"\n{self.details}")
+        return '\n'.join(lines)
+
+
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+class EngineError(Exception):
+    """所有候选后端都无法完成任务"""
+
+    def __init__(self, message, failures=None):
+        super().__init__(message)
+        self.failures = failures or []
+
+    def format_log(self):
+        lines = [str(self), '']
+        for name, error in self.failures:
+            lines.append(f"===== 引擎: {name} =====")
+            if isinstance(error, BackendError):
+                lines.append(error.format_log())
+            else:
+                lines.append(f"{type(error).__name__}: {error}")
+            lines.append('')
+        return '\n'.join(lines)
+
+    @property
+    def source(self):
+        """第一个能定位到书签的失败，返回(目录行号, pdfmark)，没有时返回None"""
+        for _, error in self.failures:
+            if getattr(error, 'source_text', ''):
+                return error.source_line, error.source_text
+        return None
+
+
+# ---------------------------------------------------------------------------
+# pdfmarks
+# ---------------------------------------------------------------------------
+
+def _read_preview(path, limit=64 * 1024):
+    """读取文件开头用于错误详情，避免把超大的pdfmarks整个放进日志"""
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            content = f.read(limit)
+            if f.read(1):
+                content += "\n... (已截断)"
+            return content
+    except OSError:
+        return ''
+
+
+def pdfwrite_args(output_pdf, keep_existing=True, quiet=True):
+    """Ghostscript pdfwrite的公共参数，不含命令名和输入文件
+
+    quiet为False时不加-q，Ghostscript会在stdout逐页输出 "Page N" 用于进度显示
+    """
+    args = ['-dBATCH', '-dNOPAUSE']
+    if quiet:
+        args.append('-q')
+    args.append('-sDEVICE=pdfwrite')
+    if not keep_existing:
+        # 不从输入PDF复制原有书签，只保留pdfmarks中的新书签
+        args.append('-dNO_PDFMARK_OUTLINES')
+    args.append('-sOutputFile=' + str(output_pdf))
+    return args
+
+
+# ---------------------------------------------------------------------------
+# 外部命令
+# ---------------------------------------------------------------------------
+
+def run_process(cmd, timeout=None, cancel_event=None, on_stdout=None, watch=None):
+    """通过共享的AsyncProcessRunner运行外部命令并返回CompletedProcess
+
+    stdout和stderr在后台事件循环中并发读取，stderr只保留末尾部分；传入on_stdout时
+    每行stdout都会交给它（在事件循环线程中调用），stdout同样只保留末尾。
+    watch(line)返回非空的原因时结束子进程并抛出ProcessAborted；
+    cancel_event被设置时结束子进程并抛出JobCancelled
+    """
+    try:
+        return default_runner().run_sync(cmd, timeout, cancel_event, on_stdout=on_stdout, watch=watch)
+    except CancelledError:
+        raise JobCancelled("任务已取消")
+
+
+class GhostscriptErrorWatcher:
+    """逐行检查Ghostscript的输出，遇到注定失败的错误时返回原因
+
+    同时记录错误报告中的 "Current file position"，用于定位出错的pdfmark
+    """
+
+    # 同一个文件反复开始xref修复这么多次后认为文件已严重损坏
+    XREF_REPAIR_LIMIT = 3
+
+    def __init__(self):
+        self.position = None
+        self.xref_repairs = 0
+
+    def __call__(self, line):
+        # stdout和stderr都在AsyncProcessRunner的事件循环线程中读取，不需要加锁
+        match = GS_POSITION_PATTERN.search(line)
+        if match:
+            self.position = int(match.group(1))
+            return None
+        match = GS_PDFMARK_ERROR_PATTERN.search(line)
+        if match:
+            return f"pdfmark执行出错 (/{match.group(1)})"
+        if GS_UNRECOVERABLE_PATTERN.search(line):
+            return "Ghostscript遇到不可恢复的错误"
+        if GS_XREF_FATAL_PATTERN.search(line):
+            return "PDF的交叉引用表(xref)已损坏，Ghostscript无法修复"
+        if GS_XREF_REPAIR_PATTERN.search(line):
+            self.xref_repairs += 1
+            if self.xref_repairs >= self.XREF_REPAIR_LIMIT:
+                return f"PDF的交叉引用表(xref)已损坏，Ghostscript已{self.xref_repairs}次尝试修复"
+        return None
+
+
+def _check_cancelled(job, bookmarks, interval=1000):
+    """遍历书签时每隔interval个检查一次任务是否被取消"""
+    for i, bookmark in enumerate(bookmarks):
+        if i % interval == 0 and job.cancelled:
+            raise JobCancelled("任务已取消")
+        yield bookmark
+
+
+# ---------------------------------------------------------------------------
+# 外部工具查找
+# ---------------------------------------------------------------------------
+
+def find_ghostscript(refresh=False):
+    """查找可用的Ghostscript，返回(命令, 版本)，找不到时返回(None, None)"""
+    info = default_discovery().lookup('ghostscript', refresh)
+    if info and info.supports(CAP_PDFWRITE):
+        return info.path, info.version
+    return None, None
+
+
+def find_qpdf(refresh=False):
+    """查找可用的qpdf，返回(命令, 版本)，找不到时返回(None, None)"""
+    info = default_discovery().lookup('qpdf', refresh)
+    if info:
+        return info.path, info.version
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# 任务
+# ---------------------------------------------------------------------------
+
+class BookmarkJob:
+    """一次书签处理任务"""
+
+    def __init__(self, operation, input_pdf, output_pdf, bookmarks=None, offset=1,
+                 keep_existing=True, timeout=None, page_count=None):
+        """timeout为None时由引擎根据输入大小、页数和历史吞吐量为每次尝试计算时间上限；
+        已知输入的页数时可通过page_count传入，避免再次读取文件结构"""
+        self.operation = operation
+        self.input_pdf = Path(input_pdf)
+        self.output_pdf = Path(output_pdf)
+        self.bookmarks = bookmarks or []
+        self.offset = offset
+        self.keep_existing = keep_existing
+        self.timeout = timeout
+        # 当前尝试的时间上限（秒），由引擎在运行每个后端前设置
+        self.time_budget = timeout
+        self.cancel_event = threading.Event()
+        # on_progress(JobProgress)、on_budget(后端, 预计秒数, 时间上限)，由执行任务的线程调用
+        self.on_progress = None
+        self.on_budget = None
+        self._page_count = page_count if page_count is not None else False
+
+    def cancel(self):
+        """请求取消任务，正在运行的外部进程会被结束"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report_progress(self, done, total, elapsed):
+        if self.on_progress:
+            self.on_progress(JobProgress(done, total, elapsed))
+
+    def report_budget(self, backend, estimate, budget):
+        self.time_budget = budget
+        if self.on_budget:
+            self.on_budget(backend, estimate, budget)
+
+    @property
+    def input_size(self):
+        try:
+            return self.input_pdf.stat().st_size
+        except OSError:
+            return 0
+
+    @property
+    def page_count(self):
+        """输入PDF的页数，无法读取时为None；只读取一次"""
+        if self._page_count is False:
+            self._page_count = read_page_count(self.input_pdf)
+        return self._page_count
+
+
+class JobProgress:
+    """任务进度快照，total未知时为None"""
+
+    def __init__(self, done, total, elapsed):
+        self.done = done
+        self.total = total
+        self.elapsed = elapsed
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def rate(self):
+        """每秒处理的页数"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """预计剩余秒数"""
+        if not self.total or not self.rate:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+    def format(self):
+        text = f"第 {self.done}/{self.total} 页" if self.total else f"第 {self.done} 页"
+        text += f" · {self.rate:.1f} 页/秒"
+        eta = self.eta
+        if eta is not None:
+            text += f" · 剩余约 {format_seconds(eta)}"
+        return text
+
+
+def format_seconds(seconds):
+    """把秒数格式化为 3分05秒 或 42秒"""
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    return f"{minutes}分{seconds:02d}秒" if minutes else f"{seconds}秒"
+
+
+class JobResult:
+    """任务执行结果"""
+
+    def __init__(self, backend, output_pdf, count, duration, failures, cached=False):
+        self.backend = backend
+        self.output_pdf = output_pdf
+        self.count = count
+        self.duration = duration
+        self.failures = failures
+        self.cached = cached  # 结果来自构建缓存，没有实际运行后端
+
+
+# ---------------------------------------------------------------------------
+# 后端
+# ---------------------------------------------------------------------------
+
+class Backend:
+    """后端基类
+
+    default_throughput为每秒处理的MB数，default_page_rate为每秒处理的页数
+    （耗时与页数无关的后端为None），startup_cost为固定开销（秒），
+    引擎据此估算任务耗时和时间上限，并在每次成功执行后用实测值修正
+    """
+
+    name = ''
+    label = ''
+    description = ''
+    capabilities = frozenset()
+    default_throughput = 50.0
+    default_page_rate = None
+    startup_cost = 0.1
+
+    def __init__(self):
+        self._probed = False
+        self._stale = False
+        self._command = None
+        self._version = None
+
+    def probe(self):
+        """查找外部工具，返回(命令, 版本)"""
+        return self.name, None
+
+    def _ensure_probed(self):
+        if not self._probed:
+            self._command, self._version = self.probe()
+            self._probed = True
+            self._stale = False
+
+    def refresh(self):
+        """清除缓存的探测结果，下一次探测不使用磁盘缓存"""
+        self._probed = False
+        self._stale = True
+
+    @property
+    def command(self):
+        self._ensure_probed()
+        return self._command
+
+    @property
+    def version(self):
+        self._ensure_probed()
+        return self._version
+
+    def is_available(self):
+        return self.command is not None
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def run(self, job):
+        """执行任务，返回书签数量"""
+        if job.operation == OP_ADD:
+            return self.add_outline(job)
+        if job.operation == OP_CLEAR:
+            return self.clear_outline(job)
+        if job.operation == OP_REPLACE:
+            return self.replace_outline(job)
+        raise BackendError(f"不支持的操作: {job.operation}")
+
+    def add_outline(self, job):
+        raise BackendError(f"{self.label}不支持添加书签")
+
+    def clear_outline(self, job):
+        raise BackendError(f"{self.label}不支持清除书签")
+
+    def replace_outline(self, job):
+        raise BackendError(f"{self.label}不支持替换书签")
+
+    def _run_command(self, cmd, job, details='', on_stdout=None, watch=None):
+        try:
+            result = run_process(cmd, job.time_budget, job.cancel_event, on_stdout, watch)
+        except ProcessAborted as e:
+            raise BackendError(f"{self.label}已提前终止: {e}", cmd, e.stdout, e.stderr, details) from e
+        except subprocess.TimeoutExpired as e:
+            raise BackendError(f"{self.label}超过时间上限 ({e.timeout:.1f} 秒)", cmd,
+                               e.stdout or '', e.stderr or '', details) from e
+        if result.returncode != 0:
+            raise BackendError(f"{self.label}执行失败 (退出代码: {result.returncode})",
+                               cmd, result.stdout, result.stderr, details)
+        return result
+
+
+class IncrementalBackend(Backend):
+    """进程内增量更新写入器：只追加新的对象和xref段"""
+
+    name = 'incremental'
+    label = '增量更新'
+    description = '不重写页面，速度最快'
+    capabilities = frozenset({CAP_ADD_OUTLINE, CAP_CLEAR_OUTLINE, CAP_REPLACE_OUTLINE,
+                              CAP_PRESERVES_STREAMS})
+    # 只需复制原文件，几乎只受磁盘速度限制
+    default_throughput = 400.0
+    startup_cost = 0.01
+
+    def probe(self):
+        return 'builtin', 'builtin'
+
+    def add_outline(self, job):
+        writer = IncrementalOutlineWriter(job.input_pdf)
+        try:
+            return writer.write(job.output_pdf, _check_cancelled(job, job.bookmarks), job.offset,
+                                keep_existing=job.keep_existing)
+        finally:
+            writer.doc.close()
+
+    def clear_outline(self, job):
+        writer = IncrementalOutlineWriter(job.input_pdf)
+        try:
+            return writer.clear(job.output_pdf)
+        finally:
+            writer.doc.close()
+
+    def replace_outline(self, job):
+        # 新的/Outlines直接替换Catalog中的旧引用，旧书签对象不再可达
+        writer = IncrementalOutlineWriter(job.input_pdf)
+        try:
+            return writer.write(job.output_pdf, _check_cancelled(job, job.bookmarks), job.offset, keep_existing=False)
+        finally:
+            writer.doc.close()
+
+
+class QpdfBackend(Backend):
+    """qpdf：改写对象结构，流数据原样保留"""
+
+    name = 'qpdf'
+    label = 'qpdf'
+    description = '只改写对象结构，保留图像流'
+    ALL_CAPABILITIES = frozenset({CAP_ADD_OUTLINE, CAP_CLEAR_OUTLINE, CAP_REPLACE_OUTLINE,
+                                  CAP_PRESERVES_STREAMS})
+    default_throughput = 150.0
+    default_page_rate = 2000.0
+    startup_cost = 0.1
+    _json_v2 = True
+
+    def probe(self):
+        info = default_discovery().lookup('qpdf', self._stale)
+        if not info:
+            return None, None
+        self._json_v2 = info.supports(CAP_JSON_V2)
+        return info.path, info.version
+
+    @property
+    def capabilities(self):
+        # 11.0之前的qpdf没有JSON v2，只能用 --empty --pages 清除书签
+        self._ensure_probed()
+        if self._json_v2:
+            return self.ALL_CAPABILITIES
+        return frozenset({CAP_CLEAR_OUTLINE, CAP_PRESERVES_STREAMS})
+
+    def add_outline(self, job, keep_existing=None):
+        if keep_existing is None:
+            keep_existing = job.keep_existing
+        backend = QpdfOutlineBackend(
+            self.command, timeout=job.time_budget,
+            runner=lambda cmd, timeout: run_process(cmd, timeout, job.cancel_event))
+        try:
+            return backend.write(job.input_pdf, job.output_pdf, job.bookmarks, job.offset,
+                                 keep_existing=keep_existing)
+        except QpdfBackendError as e:
+            raise BackendError(str(e), e.cmd, e.stdout, e.stderr) from e
+
+    def clear_outline(self, job):
+        cmd = [
+            self.command,
+            '--empty',
+            '--pages', str(job.input_pdf), '1-z',
+            '--', str(job.output_pdf)
+        ]
+        self._run_command(cmd, job)
+        return 0
+
+    def replace_outline(self, job):
+        # qpdf只写出可达对象，旧书签树在同一次写出中被丢弃
+        return self.add_outline(job, keep_existing=False)
+
+
+class GhostscriptBackend(Backend):
+    """Ghostscript pdfwrite：重新生成整个PDF"""
+
+    name = 'ghostscript'
+    label = 'Ghostscript'
+    description = '重新生成整个PDF'
+    capabilities = frozenset({CAP_ADD_OUTLINE, CAP_REPLACE_OUTLINE, CAP_NESTING, CAP_REWRITE})
+    default_throughput = 5.0
+    default_page_rate = 25.0
+    startup_cost = 0.3
+
+    def probe(self):
+        return find_ghostscript(refresh=self._stale)
+
+    @staticmethod
+    def _progress_reporter(job):
+        """返回逐行解析Ghostscript输出并报告页进度的函数"""
+        total = job.page_count
+        first = 1
+        start = time.monotonic()
+
+        def on_line(line):
+            nonlocal total, first
+            match = GS_PAGE_PATTERN.match(line)
+            if match:
+                job.report_progress(int(match.group(1)) - first + 1, total, time.monotonic() - start)
+                return
+            match = GS_PROCESSING_PATTERN.match(line)
+            if match:
+                first = int(match.group(1))
+                total = int(match.group(2)) - first + 1
+        return on_line
+
+    def add_outline(self, job, keep_existing=None):
+        if keep_existing is None:
+            keep_existing = job.keep_existing
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.pdfmarks',
+                                         delete=False, encoding='utf-8') as f:
+            count = write_pdfmarks(f, _check_cancelled(job, job.bookmarks), job.offset)
+            pdfmarks_file = f.name
+
+        cmd = [self.command] + pdfwrite_args(job.output_pdf, keep_existing, quiet=False) + [
+            str(job.input_pdf),
+            '-f',  # 表示后面是PostScript文件
+            pdfmarks_file
+        ]
+        watcher = GhostscriptErrorWatcher()
+        try:
+            self._run_command(cmd, job, on_stdout=self._progress_reporter(job), watch=watcher)
+        except BackendError as e:
+            e.details = f"临时书签文件内容:\n{_read_preview(pdfmarks_file)}"
+            if watcher.position is not None:
+                self._locate_source(e, job, pdfmarks_file, watcher.position)
+            raise
+        finally:
+            try:
+                os.unlink(pdfmarks_file)
+            except OSError:
+                pass
+        return count
+
+    def replace_outline(self, job):
+        return self.add_outline(job, keep_existing=False)
+
+    @staticmethod
+    def _locate_source(error, job, pdfmarks_file, position):
+        """把Ghostscript报告的pdfmarks文件位置换算为出错的书签及其目录行号"""
+        try:
+            with open(pdfmarks_file, 'rb') as f:
+                head = f.read(position)
+                rest = f.readline()
+        except OSError:
+            return
+        if head.endswith(b'\n'):
+            # 报告的位置已越过pdfmark后面的换行符
+            rest = b'\n'
+            head = head[:-1]
+        line_start = head.rfind(b'\n') + 1
+        index = head.count(b'\n') - 1  # 第一行是 %!PS
+        if index < 0:
+            return
+        error.source_text = (head[line_start:] + rest).decode('utf-8', errors='replace').rstrip('\r\n')
+        line_nums = getattr(job.bookmarks, 'line_nums', None)
+        if line_nums is not None and index < len(line_nums):
+            error.source_line = line_nums[index]
+
+
+class GhostscriptAPIBackend(GhostscriptBackend):
+    """通过libgs在进程内运行Ghostscript：没有进程启动开销，pdfmarks经stdin送入
+
+    与Ghostscript进程一样逐行检查输出中的致命错误并遵守时间上限，
+    两者都通过让回调返回负值来中止
+    """
+
+    name = 'gsapi'
+    label = 'Ghostscript (libgs)'
+    description = '进程内调用Ghostscript，无需启动进程'
+    startup_cost = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self._library = None
+
+    def probe(self):
+        search_dirs = {os.path.dirname(p) for p in get_common_ghostscript_paths()}
+        path = find_libgs(sorted(search_dirs))
+        if not path:
+            return None, None
+        try:
+            self._library = GhostscriptLibrary(path)
+        except GhostscriptAPIError:
+            return None, None
+        return path, self._library.revision()
+
+    def add_outline(self, job, keep_existing=None):
+        if keep_existing is None:
+            keep_existing = job.keep_existing
+        self._ensure_probed()
+        count = -1
+
+        def pdfmarks_chunks():
+            # 由stdin回调按需拉取，pdfmarks不会整体驻留内存
+            nonlocal count
+            for line in iter_pdfmarks(_check_cancelled(job, job.bookmarks), job.offset):
+                count += 1
+                yield line.encode('utf-8') + b'\n'
+
+        args = pdfwrite_args(job.output_pdf, keep_existing, quiet=False) + [
+            str(job.input_pdf),
+            '-f',
+            '-',  # 从stdin回调读取pdfmarks
+        ]
+        deadline = time.monotonic() + job.time_budget if job.time_budget else None
+        watcher = GhostscriptErrorWatcher()
+        report_progress = self._progress_reporter(job)
+
+        def poll():
+            if job.cancelled:
+                raise JobCancelled("任务已取消")
+            if deadline is not None and time.monotonic() > deadline:
+                raise GhostscriptAborted(f"{self.label}超过时间上限 ({job.time_budget:.1f} 秒)")
+
+        def watch(line):
+            reason = watcher(line)
+            if reason:
+                raise GhostscriptAborted(f"{self.label}已提前终止: {reason}")
+
+        def on_stdout(line):
+            report_progress(line)
+            watch(line)
+
+        try:
+            self._library.run(args, pdfmarks_chunks(), on_stdout=on_stdout, on_stderr=watch,
+                              output_limit=OUTPUT_TAIL_LIMIT, poll=poll)
+        except GhostscriptAPIError as e:
+            raise BackendError(str(e), ['gs'] + args, e.stdout, e.stderr,
+                               f"已送入的书签数量: {max(count, 0)}") from e
+        # 最后一次回调之后才取消时，Ghostscript已经正常结束，输出的书签可能不完整
+        if job.cancelled:
+            raise JobCancelled("任务已取消")
+        return count
+
+
+def page_ranges(pages, chunks):
+    """把1..pages平均分为chunks段，返回[(起始页, 结束页)]"""
+    if pages < 1:
+        raise ValueError(f"无法把{pages}页分段")
+    chunks = max(1, min(chunks, pages))
+    size, extra = divmod(pages, chunks)
+    ranges = []
+    first = 1
+    for i in range(chunks):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+class ChunkedGhostscriptBackend(GhostscriptBackend):
+    """按页分块并行运行Ghostscript，用qpdf按顺序拼接后一次性写入书签
+
+    拼接结果的页序与原文件相同，书签页码不需要换算。各块不复制原有书签，
+    因此追加模式下原文件已有书签时交给下一个后端处理
+    """
+
+    name = 'gs_chunked'
+    label = 'Ghostscript (分块并行)'
+    description = '多个Ghostscript进程并行重新生成，适合页数很多的大文件'
+    capabilities = frozenset({CAP_ADD_OUTLINE, CAP_REPLACE_OUTLINE, CAP_NESTING, CAP_REWRITE})
+    # 拼接和多次启动的固定开销较大，小文件仍由单进程Ghostscript处理
+    startup_cost = 1.0
+
+    def __init__(self, workers=None):
+        super().__init__()
+        self.workers = workers or default_runner().max_concurrency
+        self.default_throughput = GhostscriptBackend.default_throughput * self.workers
+        self.default_page_rate = GhostscriptBackend.default_page_rate * self.workers
+        self._qpdf = None
+
+    def probe(self):
+        self._qpdf, _ = find_qpdf(refresh=self._stale)
+        if not self._qpdf:
+            return None, None
+        return super().probe()
+
+    def _page_count(self, job):
+        """返回页数，qpdf也无法确定时返回None"""
+        if job.page_count:
+            return job.page_count
+        # 结构损坏、自带解析器读不出页数时由qpdf修复后统计
+        try:
+            result = self._run_command([self._qpdf, '--show-npages', str(job.input_pdf)], job)
+            return int(result.stdout.strip())
+        except (BackendError, ValueError):
+            return None
+
+    def add_outline(self, job, keep_existing=None):
+        if keep_existing is None:
+            keep_existing = job.keep_existing
+        self._ensure_probed()
+        pages = self._page_count(job)
+        if pages is None or pages < 2:
+            # 页数未知或不足两页时无法分块，按单进程Ghostscript处理
+            return super().add_outline(job, keep_existing)
+        if keep_existing:
+            try:
+                outline_count = read_pdf_summary(job.input_pdf)['outline_count']
+            except (OSError, PDFStructureError):
+                outline_count = None
+            if outline_count != 0:
+                raise BackendError(f"{self.label}不能保留原有书签")
+
+        chunks = min(self.workers * 2, -(-pages // MIN_CHUNK_PAGES))
+        with tempfile.TemporaryDirectory(prefix='gs-chunks-', dir=job.output_pdf.parent) as work_dir:
+            parts = self._render_chunks(job, page_ranges(pages, chunks), work_dir)
+            merged = os.path.join(work_dir, 'merged.pdf')
+            self._run_command([self._qpdf, '--empty', '--pages', *parts, '--', merged], job)
+            return write_outline_incremental(merged, job.output_pdf, _check_cancelled(job, job.bookmarks),
+                                             job.offset, keep_existing=False)
+
+    def _render_chunks(self, job, ranges, work_dir):
+        """通过共享的AsyncProcessRunner并行渲染各页段，返回按页序排列的输出文件"""
+        runner = default_runner()
+        total = ranges[-1][1]
+        done = 0
+        start = time.monotonic()
+
+        def on_line(line):
+            # 在事件循环线程中调用，各块的进度累加即可
+            nonlocal done
+            if GS_PAGE_PATTERN.match(line):
+                done += 1
+                job.report_progress(done, total, time.monotonic() - start)
+
+        parts = []
+        futures = []
+        # 出错或取消时通知其余仍在运行的块结束
+        stop = threading.Event()
+        for first, last in ranges:
+            part = os.path.join(work_dir, f'part_{first:06d}.pdf')
+            cmd = [self.command] + pdfwrite_args(part, keep_existing=False, quiet=False) + [
+                f'-dFirstPage={first}', f'-dLastPage={last}', str(job.input_pdf)]
+            parts.append(part)
+            futures.append((cmd, runner.submit(cmd, stop, timeout=job.time_budget, on_stdout=on_line,
+                                               watch=GhostscriptErrorWatcher())))
+        try:
+            for cmd, future in futures:
+                while True:
+                    try:
+                        result = future.result(timeout=0.1)
+                        break
+                    except FutureTimeoutError:
+                        if job.cancelled:
+                            raise JobCancelled("任务已取消")
+                if result.returncode != 0:
+                    raise BackendError(f"{self.label}执行失败 (退出代码: {result.returncode})",
+                                       cmd, result.stdout, result.stderr)
+        except ProcessAborted as e:
+            raise BackendError(f"{self.label}已提前终止: {e}", e.cmd, e.stdout, e.stderr) from e
+        except subprocess.TimeoutExpired as e:
+            raise BackendError(f"{self.label}超过时间上限 ({e.timeout:.1f} 秒)", e.cmd,
+                               e.stdout or '', e.stderr or '') from e
+        finally:
+            # 等所有gs进程结束并被回收，之后调用方才能删除临时目录
+            stop.set()
+            wait_futures([future for _, future in futures])
+        return parts
+
+
+# ---------------------------------------------------------------------------
+# 引擎
+# ---------------------------------------------------------------------------
+
+def default_stats_path():
+    """吞吐量统计文件的默认位置，与工具缓存放在同一目录"""
+    return os.path.join(os.path.dirname(default_cache_path()), 'throughput.json')
+
+
+class BookmarkEngine:
+    """后端注册表与调度器
+
+    各后端的吞吐量（MB/秒、页/秒）和固定开销按指数滑动平均更新，并保存到stats_path，
+    下次启动时继续使用本机的实测值；stats_path为False时不保存。
+    设置了cache时，重写页面的后端先生成规范化副本并缓存，书签在副本上增量写入，
+    同一输入只修改目录再次生成时不再重写页面
+    """
+
+    # 指数滑动平均的权重
+    SMOOTHING = 0.3
+
+    # 页数少于此值时不更新页速度，避免固定开销被当作逐页耗时
+    MIN_PAGES_FOR_RATE = 20
+
+    def __init__(self, backends=None, cache=None, stats_path=None, safety_factor=None):
+        self.backends = {}
+        self.throughput = {}
+        self.page_rate = {}
+        self.startup = {}
+        self.cache = cache  # 可选的build_cache.BuildCache
+        self.safety_factor = safety_factor or DEFAULT_SAFETY_FACTOR
+        self.stats_path = default_stats_path() if stats_path is None else stats_path
+        self._lock = threading.Lock()
+        self._saved_stats = self._load_stats()
+        for backend in backends if backends is not None else default_backends():
+            self.register(backend)
+
+    def probe_all(self):
+        """并发探测所有后端，返回可用的后端列表"""
+        backends = list(self.backends.values())
+        with ThreadPoolExecutor(max_workers=len(backends) or 1) as pool:
+            available = list(pool.map(lambda backend: backend.is_available(), backends))
+        return [backend for backend, ok in zip(backends, available) if ok]
+
+    def register(self, backend):
+        self.backends[backend.name] = backend
+        saved = self._saved_stats.get(backend.name, {})
+        self.throughput.setdefault(backend.name, saved.get('throughput', backend.default_throughput))
+        self.startup.setdefault(backend.name, saved.get('startup', backend.startup_cost))
+        if backend.default_page_rate is not None:
+            self.page_rate.setdefault(backend.name, saved.get('page_rate', backend.default_page_rate))
+
+    def estimate(self, backend, size, pages=None):
+        """估算处理size字节、pages页所需的秒数，取按大小和按页数估算中较慢的一个"""
+        size_mb = size / (1024 * 1024)
+        seconds = size_mb / self.throughput[backend.name]
+        page_rate = self.page_rate.get(backend.name)
+        if pages and page_rate:
+            seconds = max(seconds, pages / page_rate)
+        return self.startup[backend.name] + seconds
+
+    def time_budget(self, backend, job):
+        """本次尝试的时间上限（秒）：任务指定了timeout时使用它，否则由预计耗时乘以安全系数"""
+        if job.timeout is not None:
+            return job.timeout
+        pages = job.page_count
+        estimate = self.estimate(backend, job.input_size, pages)
+        floor = UNKNOWN_PAGES_TIMEOUT if pages is None and backend.name in self.page_rate else MIN_TIMEOUT
+        return max(floor, estimate * self.safety_factor)
+
+    def record(self, backend, size, duration, pages=None):
+        """用实测耗时修正吞吐量/页速度/固定开销估计，并保存到统计文件"""
+        size_mb = size / (1024 * 1024)
+        alpha = self.SMOOTHING
+        name = backend.name
+        # 后台任务可能在多个线程中同时完成
+        with self._lock:
+            # 固定开销估计偏大时实测速度会被夸大，进而把时间上限算得过小，这里至少按一半耗时计
+            work_time = max(duration - self.startup[name], duration / 2, 1e-3)
+            if size_mb >= 1:
+                measured = size_mb / work_time
+                self.throughput[name] = (1 - alpha) * self.throughput[name] + alpha * measured
+            else:
+                self.startup[name] = (1 - alpha) * self.startup[name] + alpha * duration
+            if name in self.page_rate and pages and pages >= self.MIN_PAGES_FOR_RATE:
+                measured = pages / work_time
+                self.page_rate[name] = (1 - alpha) * self.page_rate[name] + alpha * measured
+            self._save_stats()
+
+    def _load_stats(self):
+        if not self.stats_path:
+            return {}
+        try:
+            with open(self.stats_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != STATS_VERSION:
+                return {}
+            return dict(data.get('backends', {}))
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save_stats(self):
+        if not self.stats_path:
+            return
+        stats = self._saved_stats
+        for name in self.backends:
+            entry = {'throughput': self.throughput[name], 'startup': self.startup[name]}
+            if name in self.page_rate:
+                entry['page_rate'] = self.page_rate[name]
+            stats[name] = entry
+        tmp_path = f"{self.stats_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': STATS_VERSION, 'backends': stats}, f, indent=2)
+            os.replace(tmp_path, self.stats_path)
+        except OSError:
+            # 统计只用于估算，写入失败不影响任务
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def candidates(self, job, preferred=None, required=()):
+        """返回能完成任务的可用后端，按估算耗时从低到高排列；preferred排在最前"""
+        needed = {OPERATION_CAPABILITIES[job.operation], *required}
+        capable = [b for b in self.backends.values()
+                   if needed <= b.capabilities and b.is_available()]
+        size = job.input_size
+        pages = job.page_count
+        capable.sort(key=lambda b: (b.name != preferred, self.estimate(b, size, pages)))
+        return capable
+
+    def run(self, job, preferred=None, required=(), log=None):
+        """依次尝试候选后端，返回JobResult
+
+        输出先写入同目录下的临时文件，成功后才替换job.output_pdf，失败或取消时原有的输出文件保持不变。
+        全部失败时抛出EngineError；任务被取消时抛出JobCancelled
+        """
+        log = log or (lambda message: None)
+        candidates = self.candidates(job, preferred, required)
+        if not candidates:
+            raise EngineError("没有可用的引擎能完成此操作，请安装Ghostscript或qpdf")
+        self._check_page_range(job)
+
+        job_digest = self._cache_digest(job, log)
+        if job_digest:
+            start = time.monotonic()
+            # 明确选择的后端只复用它自己生成的结果；它不可用时由其他后端完成，才查找其他后端的结果
+            cached = [b for b in candidates if b.name == preferred] or candidates
+            for backend in cached:
+                meta = self.cache.lookup(self.cache.key(job_digest, backend), job.output_pdf)
+                if meta:
+                    log(f"输入和书签均未变化，复用{backend.label}之前生成的结果")
+                    return JobResult(backend, job.output_pdf, meta['count'],
+                                     time.monotonic() - start, [], cached=True)
+
+        output_pdf = job.output_pdf
+        output_pdf.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix='pdf-output-', dir=output_pdf.parent) as work_dir:
+            job.output_pdf = Path(work_dir) / output_pdf.name
+            try:
+                result = self._run_candidates(job, candidates, preferred, log)
+                os.replace(job.output_pdf, output_pdf)
+            finally:
+                job.output_pdf = output_pdf
+        result.output_pdf = output_pdf
+        if job_digest:
+            self.cache.store(self.cache.key(job_digest, result.backend), output_pdf, result)
+        return result
+
+    def _run_candidates(self, job, candidates, preferred, log):
+        """依次运行候选后端直到成功，输出写入job.output_pdf"""
+        failures = []
+        size = job.input_size
+        pages = job.page_count
+        input_digest = None
+        for backend in candidates:
+            if job.cancelled:
+                raise JobCancelled("任务已取消")
+            if self._uses_base(job, backend, preferred) and input_digest is None:
+                # 第一次轮到重写页面的后端时查找之前生成的规范化副本
+                input_digest = self._input_digest(job, log)
+                result = input_digest and self._reuse_base(job, candidates, preferred, input_digest, log)
+                if result:
+                    return result
+            estimate = self.estimate(backend, size, pages)
+            budget = self.time_budget(backend, job)
+            job.report_budget(backend, estimate, budget)
+            log(f"使用引擎: {backend.label} (预计 {estimate:.2f} 秒，时间上限 {budget:.1f} 秒)")
+            start = time.monotonic()
+            try:
+                if input_digest and self._uses_base(job, backend, preferred):
+                    count = self._run_with_base(backend, job, input_digest)
+                else:
+                    count = backend.run(job)
+                self._check_output(backend, job)
+                if job.cancelled:
+                    # 后端没有及时响应取消时，结果可能不完整
+                    raise JobCancelled("任务已取消")
+            except JobCancelled:
+                log(f"引擎 {backend.label} 已取消")
+                self._remove_partial_output(job)
+                raise
+            except Exception as e:
+                log(f"引擎 {backend.label} 失败: {e}")
+                failures.append((backend.label, e))
+                self._remove_partial_output(job)
+                continue
+            duration = time.monotonic() - start
+            self.record(backend, size, duration, pages)
+            return JobResult(backend, job.output_pdf, count, duration, failures)
+
+        raise EngineError("所有可用引擎均执行失败", failures)
+
+    # 页码超出范围时在错误信息中列出的书签数量
+    MAX_REPORTED_PAGE_ERRORS = 10
+
+    def _check_page_range(self, job):
+        """书签指向不存在的页面时在运行任何后端之前抛出EngineError；页数未知时不检查"""
+        if job.operation == OP_CLEAR or not hasattr(job.bookmarks, 'records'):
+            return
+        page_count = job.page_count
+        if page_count is None:
+            return
+        errors = page_range_errors(job.bookmarks, job.offset, page_count)
+        if errors:
+            lines = [f"有{len(errors)}个书签指向PDF中不存在的页面 (共{page_count}页):"]
+            lines += [f"  {issue}" for issue in errors[:self.MAX_REPORTED_PAGE_ERRORS]]
+            if len(errors) > self.MAX_REPORTED_PAGE_ERRORS:
+                lines.append(f"  ... 另有{len(errors) - self.MAX_REPORTED_PAGE_ERRORS}个")
+            raise EngineError('\n'.join(lines))
+
+    def _cache_digest(self, job, log):
+        """计算任务的缓存键（不含后端部分），没有缓存或无法读取输入时返回None"""
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.job_digest(job)
+        except OSError as e:
+            log(f"无法计算缓存键，跳过缓存: {e}")
+            return None
+
+    # ----- 规范化副本 -----
+
+    def _uses_base(self, job, backend, preferred=None):
+        """是否先用backend生成不含新书签的规范化副本，再在副本上增量写入书签
+
+        用户明确选择的后端仍按原方式运行：Ghostscript解释pdfmarks，
+        出错时可以分类错误并定位到目录中的行
+        """
+        return (self.cache is not None and CAP_REWRITE in backend.capabilities
+                and backend.name != preferred and job.operation in (OP_ADD, OP_REPLACE))
+
+    def _input_digest(self, job, log):
+        try:
+            return self.cache.input_digest(job.input_pdf)
+        except OSError as e:
+            log(f"无法计算输入文件的哈希，不使用规范化副本缓存: {e}")
+            return ''
+
+    @staticmethod
+    def _keeps_outline(job):
+        return job.operation == OP_ADD and job.keep_existing
+
+    def _reuse_base(self, job, candidates, preferred, input_digest, log):
+        """在缓存的规范化副本上写入书签，返回JobResult；没有可用的副本时返回None
+
+        需要保留原有书签时只能使用保留了原有书签的副本，否则两种副本都可以
+        """
+        variants = (True,) if self._keeps_outline(job) else (False, True)
+        start = time.monotonic()
+        for keep_outline in variants:
+            for backend in candidates:
+                if not self._uses_base(job, backend, preferred):
+                    continue
+                base = self.cache.lookup_base(self.cache.base_key(input_digest, keep_outline, backend))
+                if base is None:
+                    continue
+                log(f"输入未变化，在{backend.label}之前生成的规范化副本上写入书签")
+                try:
+                    count = self._apply_outline(base, job)
+                    self._check_output(backend, job)
+                except JobCancelled:
+                    self._remove_partial_output(job)
+                    raise
+                except Exception as e:
+                    log(f"无法使用规范化副本: {e}")
+                    self._remove_partial_output(job)
+                    continue
+                return JobResult(backend, job.output_pdf, count, time.monotonic() - start, [])
+        return None
+
+    def _run_with_base(self, backend, job, input_digest):
+        """用backend生成规范化副本并存入缓存，然后在副本上增量写入书签"""
+        keep_outline = self._keeps_outline(job)
+        with tempfile.TemporaryDirectory(prefix='pdf-base-', dir=job.output_pdf.parent) as work_dir:
+            base_job = BookmarkJob(OP_ADD, job.input_pdf, os.path.join(work_dir, 'base.pdf'),
+                                   keep_existing=keep_outline, timeout=job.timeout, page_count=job.page_count)
+            # 共用取消、进度和本次尝试的时间上限
+            base_job.cancel_event = job.cancel_event
+            base_job.on_progress = job.on_progress
+            base_job.time_budget = job.time_budget
+            start = time.monotonic()
+            backend.run(base_job)
+            self._check_output(backend, base_job)
+            self.cache.store_base(self.cache.base_key(input_digest, keep_outline, backend),
+                                  base_job.output_pdf, backend, time.monotonic() - start)
+            return self._apply_outline(base_job.output_pdf, job)
+
+    def _apply_outline(self, base_pdf, job):
+        return write_outline_incremental(base_pdf, job.output_pdf, _check_cancelled(job, job.bookmarks),
+                                         job.offset, keep_existing=self._keeps_outline(job))
+
+    @staticmethod
+    def _check_output(backend, job):
+        """后端报告成功但没有生成输出文件时按失败处理"""
+        if not job.output_pdf.is_file():
+            raise BackendError(f"{backend.label}没有生成输出文件: {job.output_pdf}")
+
+    @staticmethod
+    def _remove_partial_output(job):
+        """删除失败的尝试留在临时位置的输出，避免下一个后端的输出检查误判"""
+        try:
+            job.output_pdf.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def default_backends():
+    """按默认顺序创建所有内置后端"""
+    return [IncrementalBackend(), QpdfBackend(), GhostscriptAPIBackend(), GhostscriptBackend(),
+            ChunkedGhostscriptBackend()]
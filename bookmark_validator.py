@@ -5,22 +5,42 @@
 用于验证书签格式、预览内容和标记潜在问题
 """
 
-import re
 import sys
 from pathlib import Path
 
+from pdf_structure import PDFStructureError, read_pdf_summary
+from bookmark_core import BookmarkTable, build_pdfmarks, clean_title_for_postscript
+from validation_rules import ERROR, SPECIAL_CHARACTERS, Rule, default_rules, validate_bookmarks
+
+
+class _ListingRule(Rule):
+    """不检查问题，只在遍历中输出每个书签的页码换算"""
+
+    def begin(self, table, context):
+        self.index = 0
+        return ()
+
+    def check(self, bookmark, final_page, context):
+        self.index += 1
+        offset_info = f" (偏移:{bookmark.offset:+d})" if bookmark.offset != 0 else ""
+        print(f"书签 {self.index}: {bookmark.title} (调整后第{bookmark.page}页 -> PDF第{final_page}页){offset_info}")
+        return ()
+
+
 class BookmarkValidator:
     def __init__(self):
         self.issues = []
         self.warnings = []
         self.info = []
         
-    def validate_toc_text(self, toc_text, offset=1):
-        """验证目录文本"""
+    def validate_toc_text(self, toc_text, offset=1, pdf_path=None, preview=True):
+        """验证目录文本，可选地读取目标PDF的结构信息；preview为False时不显示预览"""
         print("=" * 60)
         print("书签验证和预览")
         print("=" * 60)
         
+        summary = self.check_pdf_structure(pdf_path) if pdf_path else None
+        
         # 解析目录
         bookmarks = self.parse_toc(toc_text)
         if not bookmarks:
@@ -32,92 +52,44 @@ class BookmarkValidator:
         print()
         
         # 验证书签
-        self.validate_bookmarks(bookmarks, offset)
+        self.validate_bookmarks(bookmarks, offset, summary['page_count'] if summary else None)
         
         # 显示预览
-        self.show_preview(bookmarks, offset)
+        if preview:
+            self.show_preview(bookmarks, offset)
         
         # 显示问题总结
         self.show_validation_summary()
         
         return len(self.issues) == 0
         
-    def parse_toc(self, toc_text):
-        """解析目录文本，支持动态偏移指令"""
-        lines = toc_text.strip().split('\n')
-        bookmarks = []
-        current_offset = 0  # 当前偏移值
+    def check_pdf_structure(self, pdf_path):
+        """读取PDF的页数和原有书签信息（不渲染页面）"""
+        try:
+            summary = read_pdf_summary(pdf_path)
+        except (OSError, PDFStructureError) as e:
+            self.warnings.append(f"无法读取PDF结构: {e}")
+            return None
+        self.info.append(f"PDF文件: {pdf_path} (版本 {summary['version']}, 共{summary['page_count']}页)")
+        if summary['outline_count']:
+            self.info.append(f"PDF已有{summary['outline_count']}个顶层书签，新书签将追加在其后")
+        return summary
         
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line:
-                continue
-                
-            # 检查是否是偏移指令 - 使用HTML注释风格格式
-            # 格式: <!---offset +/-数字--->
-            offset_match = re.search(r'<!---\s*offset\s*([+-]?\d+)\s*--->', line)
-            if offset_match:
-                offset_change = int(offset_match.group(1))
-                current_offset += offset_change
-                print(f"第{line_num}行: 检测到偏移指令 '{line.strip()}'，当前偏移调整为: {current_offset}")
-                continue
-                
-            # 匹配包含点线的格式：标题 ......................... 页码
-            # 或者简单的格式：标题 页码（支持负数）
-            match = re.search(r'(.*?)\s*[\.\s]*(-?\d+)\s*$', line)
-            if match:
-                title = match.group(1).strip()
-                page = int(match.group(2))
-                # 应用当前偏移
-                adjusted_page = page + current_offset
-                bookmarks.append((title, adjusted_page, line_num, current_offset))
-            else:
-                self.warnings.append(f"第{line_num}行无法解析: '{line}' (缺少页码)")
-                
-        return bookmarks
+    def parse_toc(self, toc_text):
+        """解析目录文本，支持动态偏移指令；无法解析的行在验证时报告"""
+        return BookmarkTable.from_text(toc_text, log=print)
         
-    def validate_bookmarks(self, bookmarks, offset):
-        """验证书签内容"""
+    def validate_bookmarks(self, bookmarks, offset, page_count=None):
+        """验证书签内容：逐个列出书签，同一次遍历中由validation_rules检查"""
         print("🔍 验证书签内容...")
         print("-" * 40)
         
-        for i, (title, adjusted_page, line_num, bookmark_offset) in enumerate(bookmarks):
-            # 计算实际的PDF页码 (adjusted_page已经包含了动态偏移)
-            final_page = adjusted_page + offset - 1
-            offset_info = f" (偏移:{bookmark_offset:+d})" if bookmark_offset != 0 else ""
-            print(f"书签 {i+1}: {title} (调整后第{adjusted_page}页 -> PDF第{final_page}页){offset_info}")
-            
-            # 验证页码
-            if adjusted_page == 0:
-                self.issues.append(f"第{line_num}行: 页码为0 ({adjusted_page})")
-            elif final_page < 0:
-                self.issues.append(f"第{line_num}行: 页码为负 ({adjusted_page} -> {final_page})")
-            elif final_page > 1000:
-                self.warnings.append(f"第{line_num}行: 页码过大 ({adjusted_page} -> {final_page})")
-                
-            # 验证标题
-            if not title.strip():
-                self.issues.append(f"第{line_num}行: 标题为空")
-            elif len(title) > 100:
-                self.warnings.append(f"第{line_num}行: 标题过长 ({len(title)}字符)")
-                
-            # 检查特殊字符
-            special_chars = self.check_special_characters(title)
-            if special_chars:
-                self.warnings.append(f"第{line_num}行: 包含特殊字符 {special_chars}")
-                
-        # 验证页码连续性
-        pages = [adjusted_page for _, adjusted_page, _, _ in bookmarks]
-        if len(pages) > 1:
-            sorted_pages = sorted(pages)
-            if pages != sorted_pages:
-                self.warnings.append("页码顺序不正确，建议按页码排序")
-                
-        # 验证偏移设置
-        if offset < 1:
-            self.issues.append("页面偏移小于1，可能导致页码错误")
-        elif offset > 1000:
-            self.warnings.append("页面偏移过大，请检查设置")
+        rules = default_rules() + [_ListingRule()]
+        for issue in validate_bookmarks(bookmarks, offset, page_count, rules):
+            if issue.severity == ERROR:
+                self.issues.append(str(issue))
+            else:
+                self.warnings.append(str(issue))
             
         print()
         
@@ -125,7 +97,7 @@ class BookmarkValidator:
         """检查特殊字符"""
         special_chars = []
         for char in title:
-            if char in '()\\':
+            if char in SPECIAL_CHARACTERS:
                 special_chars.append(char)
         return special_chars if special_chars else None
         
@@ -134,10 +106,9 @@ class BookmarkValidator:
         print("📋 书签预览:")
         print("-" * 40)
         
-        for i, (title, adjusted_page, _, bookmark_offset) in enumerate(bookmarks, 1):
-            final_page = adjusted_page + offset - 1
-            offset_info = f" (偏移:{bookmark_offset:+d})" if bookmark_offset != 0 else ""
-            print(f"{i:2d}. {title:<40} (调整后第{adjusted_page:2d}页 -> PDF第{final_page:2d}页){offset_info}")
+        for i, bookmark in enumerate(bookmarks.records(), 1):
+            offset_info = f" (偏移:{bookmark.offset:+d})" if bookmark.offset != 0 else ""
+            print(f"{i:2d}. {bookmark.title:<40} (调整后第{bookmark.page:2d}页 -> PDF第{bookmark.final_page(offset):2d}页){offset_info}")
             
         print()
         print("📄 生成的pdfmarks内容:")
@@ -149,27 +120,11 @@ class BookmarkValidator:
         
     def generate_pdfmarks(self, bookmarks, offset):
         """生成pdfmarks内容"""
-        pdfmarks = ['%!PS']
-        
-        for title, adjusted_page, _, bookmark_offset in bookmarks:  # bookmarks包含(title, adjusted_page, line_num, bookmark_offset)
-            # 计算最终的PDF页码（Ghostscript从0开始计数）
-            # adjusted_page已经包含了动态偏移，现在加上基础偏移
-            final_page = adjusted_page + offset - 1
-            clean_title = self.clean_title_for_postscript(title)
-            pdfmark = f'[ /Title ({clean_title}) /Page {final_page} /OUT pdfmark'
-            pdfmarks.append(pdfmark)
-            
-        return '\n'.join(pdfmarks)
+        return build_pdfmarks(bookmarks, offset)
         
     def clean_title_for_postscript(self, title):
         """清理标题，使其符合PostScript语法"""
-        clean_title = title.replace('\\', '\\\\')
-        clean_title = clean_title.replace('(', '\\(')
-        clean_title = clean_title.replace(')', '\\)')
-        clean_title = clean_title.replace('\n', ' ')
-        clean_title = clean_title.replace('\r', ' ')
-        clean_title = clean_title.replace('\t', ' ')
-        return clean_title.strip()
+        return clean_title_for_postscript(title)
         
     def show_validation_summary(self):
         """显示验证总结"""
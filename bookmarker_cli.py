@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF书签生成器命令行入口
+不导入tkinter和界面样式，可在无图形界面的服务器上批量使用；
+引擎等较重的模块只在需要处理PDF的子命令中导入
+
+用法:
+    pdf-bookmarker add book.pdf toc.txt --offset 12
+    pdf-bookmarker replace book.pdf toc.txt -o out.pdf
+    pdf-bookmarker clear book.pdf
+    pdf-bookmarker validate toc.txt --offset 12 [--pdf book.pdf]
+    pdf-bookmarker preview toc.txt --offset 12 [--pdfmarks]
+    pdf-bookmarker batch library/ [--manifest list.jsonl] [--workers 8]
+    pdf-bookmarker serve --port 8765 [--workers 4] [--max-queue 16]
+    cat toc.txt | pdf-bookmarker add book.pdf -
+    pdf-bookmarker            # 不带子命令时启动图形界面
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from bookmark_core import BookmarkTable, write_pdfmarks
+
+# 退出代码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CANCELLED = 130
+
+
+def _log(message):
+    print(message, file=sys.stderr)
+
+
+def load_table(toc_path, encoding='utf-8', verbose=False):
+    """从目录文件（'-'表示标准输入）解析书签表，无法解析的行输出到stderr"""
+    log = _log if verbose else None
+    if toc_path == '-':
+        table = BookmarkTable.from_lines(sys.stdin, log)
+    else:
+        with open(toc_path, encoding=encoding, newline='') as f:
+            table = BookmarkTable.from_lines(f, log)
+    for line_num, line in table.invalid_lines:
+        _log(f"⚠️ 第{line_num}行无法解析，已跳过: '{line}' (缺少页码)")
+    return table
+
+
+def default_output(input_pdf, operation):
+    input_pdf = Path(input_pdf)
+    suffix = '_no_bookmarks' if operation == 'clear' else '_with_bookmarks'
+    return input_pdf.parent / f"{input_pdf.stem}{suffix}.pdf"
+
+
+def _show_progress(progress):
+    if sys.stderr.isatty():
+        print(f"\r{progress.format()}\033[K", end='', file=sys.stderr, flush=True)
+
+
+def run_job(args):
+    """add / clear / replace"""
+    from bookmark_engine import CAP_REWRITE, OP_ADD, OP_CLEAR, OP_REPLACE, BookmarkEngine, BookmarkJob, EngineError
+    from job_runner import EVENT_LOG, EVENT_PROGRESS, JobRunner
+
+    operation = {'add': OP_ADD, 'clear': OP_CLEAR, 'replace': OP_REPLACE}[args.command]
+    if not Path(args.pdf).is_file():
+        _log(f"❌ PDF文件不存在: {args.pdf}")
+        return EXIT_FAILED
+
+    bookmarks = None
+    if operation != OP_CLEAR:
+        bookmarks = load_table(args.toc, args.encoding, args.verbose)
+        if not bookmarks:
+            _log("❌ 目录中没有可用的书签")
+            return EXIT_FAILED
+
+    output_pdf = args.output or default_output(args.pdf, args.command)
+    job = BookmarkJob(operation, args.pdf, output_pdf, bookmarks, args.offset, timeout=args.timeout)
+
+    # 在后台线程执行，主线程负责输出进度并响应Ctrl+C
+    cache = None
+    if not args.no_cache:
+        from build_cache import BuildCache
+        cache = BuildCache()
+    runner = JobRunner(BookmarkEngine(cache=cache, safety_factor=args.safety_factor))
+    outcome = {}
+    required = (CAP_REWRITE,) if getattr(args, 'rewrite', False) else ()
+    runner.submit(job, preferred=args.backend, required=required,
+                  on_done=lambda result: outcome.update(result=result),
+                  on_error=lambda error: outcome.update(error=error),
+                  on_cancel=lambda job: outcome.update(cancelled=True))
+    try:
+        while not outcome:
+            for kind, _, payload in runner.poll():
+                if kind == EVENT_PROGRESS:
+                    _show_progress(payload)
+                elif kind == EVENT_LOG and args.verbose:
+                    _log(payload)
+            if not outcome:
+                time.sleep(0.05)
+    except KeyboardInterrupt:
+        runner.cancel()
+        while not outcome:
+            runner.poll()
+            time.sleep(0.05)
+    finally:
+        if sys.stderr.isatty():
+            print("\r\033[K", end='', file=sys.stderr)
+
+    if 'cancelled' in outcome:
+        _log("⏹️ 任务已取消，未完成的输出文件已删除")
+        return EXIT_CANCELLED
+    error = outcome.get('error')
+    if error is not None:
+        _log(error.format_log() if isinstance(error, EngineError) else f"❌ {error}")
+        return EXIT_FAILED
+
+    result = outcome['result']
+    for name, failure in result.failures:
+        _log(f"⚠️ {name}执行失败，已自动改用{result.backend.label}: {failure}")
+    if result.cached:
+        print(f"♻️ 输入未变化，复用缓存的结果: {result.output_pdf}")
+    elif operation == OP_CLEAR:
+        print(f"✅ 已清除原始书签: {result.output_pdf}")
+    else:
+        print(f"✅ 已写入 {result.count} 个书签: {result.output_pdf}")
+    if args.verbose:
+        _log(f"用时 {result.duration:.2f} 秒")
+    return EXIT_OK
+
+
+def run_validate(args):
+    from bookmark_validator import BookmarkValidator
+
+    if args.toc == '-':
+        toc_text = sys.stdin.read()
+    else:
+        with open(args.toc, encoding=args.encoding) as f:
+            toc_text = f.read()
+    validator = BookmarkValidator()
+    ok = validator.validate_toc_text(toc_text, args.offset, args.pdf, preview=False)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def run_preview(args):
+    table = load_table(args.toc, args.encoding, args.verbose)
+    out = sys.stdout
+    if args.pdfmarks:
+        write_pdfmarks(out, table, args.offset)
+        out.write('\n')
+        return EXIT_OK
+    for i, bookmark in enumerate(table.records(), 1):
+        offset_info = f" (偏移:{bookmark.offset:+d})" if bookmark.offset != 0 else ""
+        out.write(f"{i:4d}. {bookmark.title}  -> PDF第{bookmark.final_page(args.offset)}页{offset_info}\n")
+    return EXIT_OK
+
+
+def run_batch(args):
+    from batch_runner import DEFAULT_JOURNAL_NAME, BatchJournal, BatchRunner, discover_pairs, load_manifest
+
+    directory = Path(args.directory)
+    if args.manifest:
+        items = load_manifest(args.manifest, args.offset, args.output_dir, args.encoding)
+    else:
+        items, missing = discover_pairs(directory, args.toc_suffix, not args.no_recursive,
+                                        args.offset, args.output_dir, args.encoding)
+        for pdf in missing:
+            if args.verbose:
+                _log(f"⚠️ 缺少目录文件，已跳过: {pdf}")
+        if missing:
+            _log(f"⚠️ {len(missing)} 个PDF没有对应的{args.toc_suffix}文件")
+    if not items:
+        _log("❌ 没有找到需要处理的PDF")
+        return EXIT_FAILED
+
+    journal = BatchJournal(args.journal or directory / DEFAULT_JOURNAL_NAME)
+    runner = BatchRunner(journal, 'replace' if args.replace else 'add', args.workers,
+                         args.backend, args.timeout, log=print, use_cache=not args.no_cache,
+                         safety_factor=args.safety_factor)
+    try:
+        stats = runner.run(items, retry_failed=not args.skip_failed)
+    except KeyboardInterrupt:
+        _log(f"⏹️ 已中断，已完成的结果保存在 {journal.path}，重新运行即可继续")
+        return EXIT_CANCELLED
+
+    rate = stats['done'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    print(f"共 {stats['total']} 个文件: 完成 {stats['done']}，失败 {stats['failed']}，"
+          f"跳过 {stats['skipped']}，用时 {stats['elapsed']:.1f} 秒 ({rate:.1f} 个/秒)")
+    print(f"结果日志: {journal.path}")
+    return EXIT_FAILED if stats['failed'] else EXIT_OK
+
+
+def run_serve(args):
+    from bookmarker_server import run_from_args
+    return run_from_args(args)
+
+
+def run_gui(args):
+    from pdf_bookmarker_gs import main as gui_main
+    gui_main()
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pdf-bookmarker',
+        description='根据目录文本为PDF添加书签；不带子命令时启动图形界面')
+    commands = parser.add_subparsers(dest='command', metavar='命令')
+
+    def add_toc_options(sub):
+        sub.add_argument('--offset', type=int, default=1,
+                         help='书签第1页对应的PDF页码 (默认: 1)')
+        sub.add_argument('--encoding', default='utf-8', help='目录文件编码 (默认: utf-8)')
+        sub.add_argument('-v', '--verbose', action='store_true', help='输出详细执行信息')
+
+    def add_timeout_options(sub):
+        sub.add_argument('--timeout', type=float,
+                         help='固定的超时秒数 (默认根据文件大小、页数和本机的历史吞吐量计算)')
+        sub.add_argument('--safety-factor', type=float,
+                         help='自动超时 = 预计耗时 × 安全系数 (默认: 4)')
+
+    def add_job_options(sub):
+        sub.add_argument('-o', '--output', help='输出PDF路径 (默认在原文件旁生成)')
+        sub.add_argument('--backend', choices=['incremental', 'qpdf', 'gsapi', 'ghostscript', 'gs_chunked'],
+                         help='优先使用的引擎 (默认自动选择)')
+        add_timeout_options(sub)
+        sub.add_argument('--no-cache', action='store_true', help='不使用构建缓存，总是重新生成')
+
+    for name, help_text in [('add', '添加书签，保留原有书签'),
+                            ('replace', '替换书签，去掉原有书签')]:
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument('pdf', help='输入PDF')
+        sub.add_argument('toc', help="目录文件，'-' 表示标准输入")
+        sub.add_argument('--rewrite', action='store_true',
+                         help='用Ghostscript重新生成所有页面（可修复损坏的PDF），页数多时自动分块并行')
+        add_toc_options(sub)
+        add_job_options(sub)
+        sub.set_defaults(func=run_job)
+
+    sub = commands.add_parser('clear', help='清除PDF原有书签')
+    sub.add_argument('pdf', help='输入PDF')
+    sub.add_argument('-v', '--verbose', action='store_true', help='输出详细执行信息')
+    add_job_options(sub)
+    sub.set_defaults(func=run_job, toc=None, offset=1, encoding='utf-8')
+
+    sub = commands.add_parser('validate', help='验证目录格式，发现错误时以非零状态退出')
+    sub.add_argument('toc', help="目录文件，'-' 表示标准输入")
+    sub.add_argument('--pdf', help='同时读取目标PDF的结构信息')
+    add_toc_options(sub)
+    sub.set_defaults(func=run_validate)
+
+    sub = commands.add_parser('preview', help='预览解析后的书签')
+    sub.add_argument('toc', help="目录文件，'-' 表示标准输入")
+    sub.add_argument('--pdfmarks', action='store_true', help='输出pdfmarks而不是书签列表')
+    add_toc_options(sub)
+    sub.set_defaults(func=run_preview)
+
+    sub = commands.add_parser('batch', help='批量处理目录中的PDF，可中断后继续')
+    sub.add_argument('directory', help='PDF所在目录，book.pdf 对应的目录文件为 book.toc.txt')
+    sub.add_argument('--manifest', help='JSONL清单，每行 {"pdf": ..., "toc": ..., "offset": ...}')
+    sub.add_argument('--toc-suffix', default='.toc.txt', help='目录文件后缀 (默认: .toc.txt)')
+    sub.add_argument('--no-recursive', action='store_true', help='不处理子目录')
+    sub.add_argument('--output-dir', help='输出目录 (默认在原文件旁生成)')
+    sub.add_argument('--journal', help='结果日志路径 (默认: <目录>/bookmark_batch.jsonl)')
+    sub.add_argument('--workers', type=int, help='并行进程数 (默认: CPU核数)')
+    sub.add_argument('--replace', action='store_true', help='替换原有书签而不是追加')
+    sub.add_argument('--skip-failed', action='store_true', help='不重试日志中失败的文件')
+    sub.add_argument('--backend', choices=['incremental', 'qpdf', 'gsapi', 'ghostscript', 'gs_chunked'],
+                     help='优先使用的引擎 (默认自动选择)')
+    add_timeout_options(sub)
+    sub.add_argument('--no-cache', action='store_true', help='不使用构建缓存，总是重新生成')
+    add_toc_options(sub)
+    sub.set_defaults(func=run_batch)
+
+    sub = commands.add_parser('serve', help='启动本地HTTP服务')
+    sub.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    sub.add_argument('--port', type=int, default=8765, help='端口 (默认: 8765)')
+    sub.add_argument('--workers', type=int, help='并行任务数 (默认: CPU核数)')
+    sub.add_argument('--max-queue', type=int, default=16, help='排队任务上限，超出时返回429 (默认: 16)')
+    sub.add_argument('--max-upload', type=int, default=1024 ** 3, help='请求体字节数上限 (默认: 1GB)')
+    add_timeout_options(sub)
+    sub.add_argument('--no-cache', action='store_true', help='不使用构建缓存，总是重新生成')
+    sub.set_defaults(func=run_serve)
+
+    sub = commands.add_parser('gui', help='启动图形界面')
+    sub.set_defaults(func=run_gui)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        return run_gui(args)
+    try:
+        return args.func(args)
+    except OSError as e:
+        _log(f"❌ {e}")
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        return EXIT_CANCELLED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
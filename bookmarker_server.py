@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地HTTP服务
+基于asyncio，只使用标准库。请求体边接收边写入临时文件，结果PDF分块发回，
+任何时候都不把整个文件放进内存。任务在有界线程池中由与GUI相同的BookmarkEngine执行，
+排队的请求超过上限时直接返回429
+
+接口:
+    POST /add?offset=12        请求体 = 目录文本 + PDF，X-Toc-Length头给出目录部分的字节数
+    POST /replace?offset=12    同上，去掉原有书签
+    POST /clear                请求体 = PDF
+    POST /validate?offset=12   请求体 = 目录文本，返回JSON
+    GET  /health               返回JSON状态
+
+示例:
+    pdf-bookmarker serve --port 8765        (或 python bookmarker_server.py --port 8765)
+    curl -s --data-binary @<(cat toc.txt book.pdf) -H "X-Toc-Length: $(wc -c < toc.txt)" \\
+         "http://127.0.0.1:8765/add?offset=12" -o out.pdf
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from bookmark_core import BookmarkTable
+from bookmark_engine import OP_ADD, OP_CLEAR, OP_REPLACE, BookmarkEngine, BookmarkJob, EngineError
+from validation_rules import ERROR, validate_bookmarks
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_MAX_UPLOAD = 1024 * 1024 * 1024
+MAX_TOC_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+OPERATIONS = {'/add': OP_ADD, '/replace': OP_REPLACE, '/clear': OP_CLEAR}
+
+REASONS = {
+    100: 'Continue', 200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 422: 'Unprocessable Entity',
+    429: 'Too Many Requests', 500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, details=''):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class Request:
+    def __init__(self, method, path, query, headers, reader):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.reader = reader
+
+    def param(self, name, default=None, convert=str):
+        values = self.query.get(name)
+        if not values:
+            return default
+        try:
+            return convert(values[0])
+        except ValueError:
+            raise HTTPError(400, f"参数{name}无效: {values[0]}")
+
+    def content_length(self):
+        value = self.headers.get('content-length')
+        if value is None:
+            raise HTTPError(411, "需要Content-Length头")
+        try:
+            length = int(value)
+        except ValueError:
+            raise HTTPError(400, "Content-Length无效")
+        if length < 0:
+            raise HTTPError(400, "Content-Length无效")
+        return length
+
+
+async def read_request(reader):
+    """读取请求行和请求头，请求体留在reader中"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "请求头过长")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "请求行格式错误")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, parse_qs(url.query), headers, reader)
+
+
+async def copy_body(reader, length, f):
+    """把请求体的length字节分块写入文件"""
+    remaining = length
+    while remaining:
+        chunk = await reader.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise HTTPError(400, "请求体不完整")
+        f.write(chunk)
+        remaining -= len(chunk)
+
+
+def _response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def send_json(writer, status, data, extra_headers=None):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    headers = {'Content-Type': 'application/json; charset=utf-8', 'Content-Length': len(body),
+               'Connection': 'close'}
+    headers.update(extra_headers or {})
+    writer.write(_response_head(status, headers) + body)
+    await writer.drain()
+
+
+async def send_file(writer, path, headers):
+    """分块发送文件，等待客户端读取后再发送下一块"""
+    size = os.path.getsize(path)
+    headers = {'Content-Type': 'application/pdf', 'Content-Length': size, 'Connection': 'close', **headers}
+    writer.write(_response_head(200, headers))
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+
+
+def validate_toc(toc_path, offset):
+    """用validation_rules验证目录文件，返回JSON结果
+
+    在工作线程中执行，不向stdout打印任何内容，多个请求可以并发验证
+    """
+    with open(toc_path, encoding='utf-8', errors='replace', newline='') as f:
+        info = []
+        bookmarks = BookmarkTable.from_lines(f, log=info.append)
+    if not bookmarks:
+        return {'ok': False, 'count': 0, 'issues': ["无法解析目录内容"], 'warnings': [], 'info': info,
+                'details': []}
+    found = validate_bookmarks(bookmarks, offset)
+    issues = [str(issue) for issue in found if issue.severity == ERROR]
+    return {
+        'ok': not issues,
+        'count': len(bookmarks),
+        'issues': issues,
+        'warnings': [str(issue) for issue in found if issue.severity != ERROR],
+        'info': info,
+        'details': [{'severity': issue.severity, 'message': issue.message, 'line': issue.line_num}
+                    for issue in found],
+    }
+
+
+class BookmarkServer:
+    """HTTP服务：workers个任务并行执行，最多再排队max_queue个"""
+
+    def __init__(self, engine=None, workers=None, max_queue=DEFAULT_MAX_QUEUE,
+                 max_upload=DEFAULT_MAX_UPLOAD, timeout=None, log=None):
+        self.engine = engine or BookmarkEngine()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_upload = max_upload
+        self.timeout = timeout
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bookmark-http')
+        self.active = 0   # 已接受、尚未完成的任务（执行中+排队中）
+        self.server = None
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is not None:
+                await self.dispatch(request, writer)
+        except HTTPError as e:
+            await self._send_error(writer, e)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.log(f"处理请求时发生错误: {type(e).__name__}: {e}")
+            await self._send_error(writer, HTTPError(500, str(e)))
+        finally:
+            with contextlib.suppress(Exception):
+                writer.close()
+
+    async def _send_error(self, writer, error):
+        data = {'error': str(error)}
+        if error.details:
+            data['details'] = error.details
+        headers = {'Retry-After': 1} if error.status == 429 else None
+        with contextlib.suppress(Exception):
+            await send_json(writer, error.status, data, headers)
+
+    async def dispatch(self, request, writer):
+        if request.path == '/health':
+            await send_json(writer, 200, {'status': 'ok', 'active': self.active,
+                                          'workers': self.workers, 'max_queue': self.max_queue})
+            return
+        if request.path != '/validate' and request.path not in OPERATIONS:
+            raise HTTPError(404, f"未知的接口: {request.path}")
+        if request.method != 'POST':
+            raise HTTPError(405, "只支持POST")
+
+        length = request.content_length()
+        if length > self.max_upload:
+            raise HTTPError(413, f"请求体超过上限 {self.max_upload} 字节")
+        # 在读取请求体之前判断是否饱和，被拒绝的客户端不必上传文件
+        if self.active >= self.capacity:
+            raise HTTPError(429, "服务繁忙，请稍后重试")
+
+        self.active += 1
+        try:
+            if request.headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                await writer.drain()
+            with tempfile.TemporaryDirectory(prefix='pdf-bookmarker-') as work_dir:
+                if request.path == '/validate':
+                    await self._validate(request, writer, length, Path(work_dir))
+                else:
+                    await self._run_operation(request, writer, length, Path(work_dir))
+        finally:
+            self.active -= 1
+
+    async def _receive(self, request, length, work_dir, with_toc):
+        """把请求体保存为 toc.txt / input.pdf，返回(目录路径, PDF路径)"""
+        toc_length = 0
+        if with_toc:
+            toc_length = request.param('toc_length', None, int)
+            if toc_length is None:
+                try:
+                    toc_length = int(request.headers.get('x-toc-length', ''))
+                except ValueError:
+                    raise HTTPError(400, "需要X-Toc-Length头给出目录部分的字节数")
+            if not 0 < toc_length <= min(length, MAX_TOC_BYTES):
+                raise HTTPError(400, "X-Toc-Length超出范围")
+
+        toc_path = work_dir / 'toc.txt'
+        pdf_path = work_dir / 'input.pdf'
+        if with_toc:
+            with open(toc_path, 'wb') as f:
+                await copy_body(request.reader, toc_length, f)
+        with open(pdf_path, 'wb') as f:
+            await copy_body(request.reader, length - toc_length, f)
+        return toc_path, pdf_path
+
+    async def _validate(self, request, writer, length, work_dir):
+        offset = request.param('offset', 1, int)
+        if length > MAX_TOC_BYTES:
+            raise HTTPError(413, "目录文本过大")
+        toc_path = work_dir / 'toc.txt'
+        with open(toc_path, 'wb') as f:
+            await copy_body(request.reader, length, f)
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(self.executor, validate_toc, toc_path, offset)
+        await send_json(writer, 200, result)
+
+    async def _run_operation(self, request, writer, length, work_dir):
+        operation = OPERATIONS[request.path]
+        offset = request.param('offset', 1, int)
+        preferred = request.param('backend')
+        timeout = request.param('timeout', self.timeout, float)
+
+        toc_path, pdf_path = await self._receive(request, length, work_dir, operation != OP_CLEAR)
+        if operation != OP_CLEAR:
+            with open(toc_path, encoding='utf-8', errors='replace', newline='') as f:
+                bookmarks = BookmarkTable.from_lines(f)
+            if not bookmarks:
+                raise HTTPError(422, "目录中没有可用的书签")
+        else:
+            bookmarks = None
+
+        output_path = work_dir / 'output.pdf'
+        job = BookmarkJob(operation, pdf_path, output_path, bookmarks, offset, timeout=timeout)
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(self.executor, lambda: self.engine.run(job, preferred=preferred))
+        try:
+            result = await future
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        except EngineError as e:
+            raise HTTPError(422, str(e), e.format_log())
+
+        count = f"{result.count} 个书签, " if operation != OP_CLEAR else ''
+        self.log(f"{request.path} 完成: {count}{result.backend.label}, {result.duration:.2f} 秒")
+        headers = {
+            'X-Bookmark-Count': result.count,
+            'X-Backend': result.backend.name,
+            'X-Duration': f"{result.duration:.3f}",
+            'X-Time-Budget': f"{job.time_budget:.1f}",
+            'Content-Disposition': 'attachment; filename="output.pdf"',
+        }
+        await send_file(writer, output_path, headers)
+
+
+async def serve(host, port, **options):
+    server = BookmarkServer(**options)
+    await server.start(host, port)
+    server.log(f"PDF书签服务已启动: http://{host}:{port} "
+               f"(并行 {server.workers}，排队上限 {server.max_queue})")
+    try:
+        await server.server.serve_forever()
+    finally:
+        server.close()
+
+
+def run_from_args(args):
+    cache = None
+    if not args.no_cache:
+        from build_cache import BuildCache
+        cache = BuildCache()
+    engine = BookmarkEngine(cache=cache, safety_factor=args.safety_factor)
+    try:
+        asyncio.run(serve(args.host, args.port, engine=engine, workers=args.workers,
+                          max_queue=args.max_queue, max_upload=args.max_upload, timeout=args.timeout))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    from bookmarker_cli import main as cli_main
+    return cli_main(['serve'] + list(sys.argv[1:] if argv is None else argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+构建缓存
+以输入PDF内容、规范化后的书签、偏移、操作以及后端名称和版本的哈希为键，
+保存已生成的输出PDF。相同的任务再次执行时直接复用：输出文件仍在且未被修改时
+只需几次stat，否则从缓存复制。缓存总大小超过上限时按最近使用时间淘汰。
+输入PDF的内容哈希按(路径, 大小, mtime)缓存，未变化的大文件不会重复读取。
+每个输入文件的哈希是hashes目录中一个单独的小文件，批量处理的多个进程写入时互不覆盖
+
+同一目录中还保存重写页面的后端生成的规范化副本（不含新书签），以输入内容、
+是否保留原有书签以及后端名称和版本为键。只修改目录重新生成时，
+引擎在副本上增量写入书签，不再重新运行Ghostscript
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+# 缓存格式或输出逻辑变化时修改，旧的缓存条目自动失效
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# 读取文件计算哈希时的块大小
+HASH_CHUNK = 1024 * 1024
+
+
+def default_cache_dir():
+    from tool_discovery import default_cache_path
+    return os.path.join(os.path.dirname(default_cache_path()), 'builds')
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_digest(path):
+    """文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bookmarks_digest(bookmarks):
+    """规范化书签的sha256：只包含解析后的标题和页码，空行、空白和注释写法不影响结果"""
+    digest = hashlib.sha256()
+    for title, page, _ in bookmarks or ():
+        digest.update(title.encode('utf-8'))
+        digest.update(b'\0%d\n' % page)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class BuildCache:
+    """内容寻址的输出缓存
+
+    每个条目是 <键>.pdf 和 <键>.json 两个文件，多个进程可以共用同一个缓存目录；
+    .pdf的mtime记录最近使用时间，用于LRU淘汰
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or default_cache_dir())
+        self.max_bytes = max_bytes
+        # 本进程已确认过的 {路径: [大小, mtime, 哈希]}
+        self._hashes = {}
+        # 缓存总大小的估计值：第一次保存时扫描一次，之后只累加新保存的条目
+        self._total = None
+        self._lock = threading.Lock()
+
+    # ----- 键 -----
+
+    def input_digest(self, path):
+        """输入文件的内容哈希，文件大小和mtime未变化时使用缓存的结果"""
+        path = str(Path(path).resolve())
+        stat_key = _stat_key(path)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if not cached or cached[:2] != stat_key:
+            cached = self._read_hash(path)
+        if not cached or cached[:2] != stat_key:
+            cached = stat_key + [file_digest(path)]
+            hash_path = self._hash_path(path)
+            try:
+                hash_path.parent.mkdir(parents=True, exist_ok=True)
+                _write_json(hash_path, {'path': path, 'entry': cached})
+            except OSError:
+                pass
+        with self._lock:
+            self._hashes[path] = cached
+        return cached[2]
+
+    def _hash_path(self, path):
+        name = hashlib.sha256(path.encode('utf-8')).hexdigest()
+        return self.cache_dir / 'hashes' / f"{name}.json"
+
+    def _read_hash(self, path):
+        """读取path的哈希记录[大小, mtime, 哈希]，不存在或格式错误时返回None"""
+        try:
+            with open(self._hash_path(path), encoding='utf-8') as f:
+                data = json.load(f)
+            if data['path'] == path and len(data['entry']) == 3:
+                return data['entry']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def job_digest(self, job):
+        """与后端无关的部分：输入内容、书签、偏移和操作"""
+        parts = [
+            str(CACHE_VERSION),
+            job.operation,
+            self.input_digest(job.input_pdf),
+            bookmarks_digest(job.bookmarks),
+            str(job.offset),
+            str(job.keep_existing),
+        ]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(job_digest, backend):
+        parts = [job_digest, backend.name, str(backend.version)]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def base_key(input_digest, keep_outline, backend):
+        """规范化副本的键；keep_outline表示副本中保留了原有书签"""
+        parts = [str(CACHE_VERSION), 'base', input_digest, str(bool(keep_outline)),
+                 backend.name, str(backend.version)]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    # ----- 查找与保存 -----
+
+    def _paths(self, key):
+        directory = self.cache_dir / key[:2]
+        return directory / f"{key}.pdf", directory / f"{key}.json"
+
+    def lookup(self, key, output_pdf):
+        """命中时把结果放到output_pdf并返回条目信息，否则返回None"""
+        blob, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        output = str(Path(output_pdf).resolve())
+        try:
+            # 上次生成的输出文件仍然存在且未被修改：不需要复制
+            if meta.get('outputs', {}).get(output) == _stat_key(output):
+                self._touch(blob)
+                return meta
+        except OSError:
+            pass
+
+        try:
+            Path(output_pdf).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(blob, output_pdf)
+        except OSError:
+            return None
+        self._touch(blob)
+        self._remember_output(meta_path, meta, output)
+        return meta
+
+    def store(self, key, output_pdf, result):
+        """保存成功生成的输出"""
+        blob, meta_path = self._paths(key)
+        output = str(Path(output_pdf).resolve())
+        try:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp_blob = blob.with_name(f"{blob.name}.{os.getpid()}.tmp")
+            shutil.copyfile(output_pdf, tmp_blob)
+            os.replace(tmp_blob, blob)
+            meta = {
+                'count': result.count,
+                'backend': result.backend.name,
+                'duration': result.duration,
+                'size': blob.stat().st_size,
+                'outputs': {},
+            }
+            self._remember_output(meta_path, meta, output)
+        except OSError:
+            return
+        self._added(meta['size'])
+
+    def lookup_base(self, key):
+        """返回缓存的规范化副本路径，不存在时返回None"""
+        blob, _ = self._paths(key)
+        if not blob.is_file():
+            return None
+        self._touch(blob)
+        return blob
+
+    def store_base(self, key, base_pdf, backend, duration):
+        """保存后端生成的规范化副本"""
+        blob, meta_path = self._paths(key)
+        try:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp_blob = blob.with_name(f"{blob.name}.{os.getpid()}.tmp")
+            shutil.copyfile(base_pdf, tmp_blob)
+            os.replace(tmp_blob, blob)
+            size = blob.stat().st_size
+            _write_json(meta_path, {
+                'base': True,
+                'backend': backend.name,
+                'duration': duration,
+                'size': size,
+            })
+        except OSError:
+            return
+        self._added(size)
+
+    def _remember_output(self, meta_path, meta, output):
+        try:
+            meta.setdefault('outputs', {})[output] = _stat_key(output)
+            _write_json(meta_path, meta)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _touch(blob):
+        try:
+            os.utime(blob)
+        except OSError:
+            pass
+
+    # ----- 淘汰 -----
+
+    def entries(self):
+        """返回[(最近使用时间, 大小, 缓存的PDF路径)]"""
+        entries = []
+        if not self.cache_dir.is_dir():
+            return entries
+        for blob in self.cache_dir.glob('*/*.pdf'):
+            try:
+                stat = blob.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, blob))
+        return entries
+
+    def _added(self, size):
+        """记录新保存的条目，估计的总大小超过上限时才扫描目录淘汰
+
+        每次保存都扫描整个目录时，批量处理n个文件需要O(n²)次文件系统操作
+        """
+        with self._lock:
+            if self._total is None:
+                self._total = sum(entry_size for _, entry_size, _ in self.entries())
+            else:
+                self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """总大小超过max_bytes时删除最久未使用的条目，返回删除的数量
+
+        同时删除输入文件已不存在或已被修改的哈希记录
+        """
+        self.prune_hashes()
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, blob in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (blob, blob.with_suffix('.json')):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._total = total
+        return removed
+
+    def prune_hashes(self):
+        """删除对应的输入文件已不存在或大小、mtime已变化的哈希记录，返回删除的数量"""
+        removed = 0
+        for hash_path in (self.cache_dir / 'hashes').glob('*.json'):
+            try:
+                with open(hash_path, encoding='utf-8') as f:
+                    data = json.load(f)
+                if _stat_key(data['path']) == data['entry'][:2]:
+                    continue
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            try:
+                hash_path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        with self._lock:
+            self._hashes.clear()
+            self._total = None
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通过ctypes调用Ghostscript共享库（libgs / gsdll）
+在当前进程内运行pdfwrite，省去启动gs进程和探测命令的开销。
+pdfmarks通过stdin回调送入，stdout/stderr通过回调收集，不需要临时文件
+"""
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import sys
+import threading
+from collections import deque
+
+# gsapi_set_arg_encoding的编码常量
+GS_ARG_ENCODING_UTF8 = 1
+
+# 正常结束时gsapi_init_with_args/gsapi_exit返回的错误码
+GS_ERROR_QUIT = -101
+
+# Windows上的gsdll使用stdcall调用约定
+if sys.platform == 'win32':
+    _CALLBACK = ctypes.WINFUNCTYPE
+else:
+    _CALLBACK = ctypes.CFUNCTYPE
+
+_STDIN_FUNC = _CALLBACK(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_char), ctypes.c_int)
+_OUTPUT_FUNC = _CALLBACK(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_char), ctypes.c_int)
+_POLL_FUNC = _CALLBACK(ctypes.c_int, ctypes.c_void_p)
+
+# 回调返回负值时Ghostscript中止执行
+_ABORT = -1
+
+# 旧版本的Ghostscript每个进程只允许一个实例
+_instance_lock = threading.Lock()
+
+
+class GhostscriptAPIError(Exception):
+    """libgs加载或执行失败"""
+
+    def __init__(self, message, code=None, stdout='', stderr=''):
+        super().__init__(message)
+        self.code = code
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class GhostscriptAborted(GhostscriptAPIError):
+    """回调要求中止执行（例如超时或输出中出现致命错误）"""
+
+
+class _Revision(ctypes.Structure):
+    _fields_ = [
+        ('product', ctypes.c_char_p),
+        ('copyright', ctypes.c_char_p),
+        ('revision', ctypes.c_long),
+        ('revisiondate', ctypes.c_long),
+    ]
+
+
+def _library_names():
+    if sys.platform == 'win32':
+        return ['gsdll64.dll', 'gsdll32.dll']
+    if sys.platform == 'darwin':
+        return ['libgs.dylib', 'libgs.10.dylib', 'libgs.9.dylib']
+    return ['libgs.so.10', 'libgs.so.9', 'libgs.so']
+
+
+def find_libgs(search_dirs=()):
+    """查找Ghostscript共享库，返回可加载的路径或名称，找不到时返回None
+
+    search_dirs为额外的搜索目录（例如gs可执行文件所在的bin目录）
+    """
+    candidates = []
+    for directory in search_dirs:
+        for name in _library_names():
+            candidates.extend(glob.glob(os.path.join(directory, name)))
+    if sys.platform == 'darwin':
+        for directory in ['/opt/homebrew/lib', '/usr/local/lib']:
+            for name in _library_names():
+                candidates.append(os.path.join(directory, name))
+    candidates.extend(_library_names())
+    found = ctypes.util.find_library('gs') or ctypes.util.find_library('gsdll64')
+    if found:
+        candidates.append(found)
+
+    for candidate in candidates:
+        if os.path.isabs(candidate) and not os.path.exists(candidate):
+            continue
+        try:
+            _load_library(candidate)
+        except OSError:
+            continue
+        return candidate
+    return None
+
+
+def _load_library(path):
+    if sys.platform == 'win32':
+        return ctypes.WinDLL(path)
+    return ctypes.CDLL(path)
+
+
+class _OutputBuffer:
+    """收集回调输出；设置limit时只保留最后约limit字节"""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.truncated = False
+        self._parts = deque()
+        self._size = 0
+
+    def write(self, data):
+        self._parts.append(data)
+        self._size += len(data)
+        while self.limit and self._size > self.limit and len(self._parts) > 1:
+            self._size -= len(self._parts.popleft())
+            self.truncated = True
+
+    def getvalue(self):
+        text = b''.join(self._parts).decode('utf-8', errors='replace')
+        if self.truncated:
+            text = "... (已截断)\n" + text
+        return text
+
+
+class GhostscriptLibrary:
+    """已加载的Ghostscript共享库"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            lib = _load_library(path)
+        except OSError as e:
+            raise GhostscriptAPIError(f"无法加载Ghostscript共享库 {path}: {e}") from e
+
+        try:
+            lib.gsapi_revision.argtypes = [ctypes.POINTER(_Revision), ctypes.c_int]
+            lib.gsapi_revision.restype = ctypes.c_int
+            lib.gsapi_new_instance.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p]
+            lib.gsapi_new_instance.restype = ctypes.c_int
+            lib.gsapi_delete_instance.argtypes = [ctypes.c_void_p]
+            lib.gsapi_delete_instance.restype = None
+            lib.gsapi_set_stdio.argtypes = [ctypes.c_void_p, _STDIN_FUNC, _OUTPUT_FUNC, _OUTPUT_FUNC]
+            lib.gsapi_set_stdio.restype = ctypes.c_int
+            lib.gsapi_set_arg_encoding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            lib.gsapi_set_arg_encoding.restype = ctypes.c_int
+            lib.gsapi_init_with_args.argtypes = [ctypes.c_void_p, ctypes.c_int,
+                                                 ctypes.POINTER(ctypes.c_char_p)]
+            lib.gsapi_init_with_args.restype = ctypes.c_int
+            lib.gsapi_exit.argtypes = [ctypes.c_void_p]
+            lib.gsapi_exit.restype = ctypes.c_int
+        except AttributeError as e:
+            raise GhostscriptAPIError(f"{path} 不是有效的Ghostscript共享库: {e}") from e
+        # 轮询回调是可选的，只有部分构建会在解释过程中定期调用
+        try:
+            lib.gsapi_set_poll.argtypes = [ctypes.c_void_p, _POLL_FUNC]
+            lib.gsapi_set_poll.restype = ctypes.c_int
+            self.has_poll = True
+        except AttributeError:
+            self.has_poll = False
+        self.lib = lib
+
+    def revision(self):
+        """返回版本字符串，例如 10.02.1"""
+        rev = _Revision()
+        if self.lib.gsapi_revision(ctypes.byref(rev), ctypes.sizeof(rev)) != 0:
+            return None
+        number = rev.revision
+        return f"{number // 1000}.{number // 10 % 100:02d}.{number % 10}"
+
+    def run(self, args, stdin_data=b'', on_stdout=None, output_limit=None, poll=None, on_stderr=None):
+        """以args运行Ghostscript，返回(stdout, stderr)，失败时抛出GhostscriptAPIError
+
+        args不含程序名；参数 '-' 表示从stdin_data读取PostScript。
+        stdin_data可以是bytes，也可以是逐块产出bytes的迭代器，后者按需读取。
+        on_stdout/on_stderr为每行stdout/stderr文本的回调；output_limit限制保留的输出字节数，
+        超出时只保留末尾。poll在每次回调时调用，用于检查取消和超时。
+        ctypes会吞掉回调中的异常，因此回调（包括stdin_data迭代器）抛出的异常先被记录，
+        回调返回负值使Ghostscript中止，结束后再重新抛出该异常；GhostscriptAPIError会附带已收集的输出。
+        Ghostscript只在输出、读取stdin和轮询时调用回调，中止要等到下一次回调才生效
+        """
+        if isinstance(stdin_data, (bytes, bytearray)):
+            stdin_data = [bytes(stdin_data)]
+        chunks = iter(stdin_data)
+        pending = b''
+        stdout_buffer = _OutputBuffer(output_limit)
+        stderr_buffer = _OutputBuffer(output_limit)
+        raised = []
+
+        def guarded(callback, buffer=None):
+            def wrapper(handle, *args):
+                if raised:
+                    # 已经要求中止：输出仍然收集，作为错误上下文
+                    if buffer is not None:
+                        buffer.write(ctypes.string_at(*args))
+                    return _ABORT
+                try:
+                    if poll:
+                        poll()
+                    return callback(*args)
+                except BaseException as e:
+                    raised.append(e)
+                    return _ABORT
+            return wrapper
+
+        def read_stdin(buf, length):
+            nonlocal pending
+            while len(pending) < length:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending += chunk
+            data, pending = pending[:length], pending[length:]
+            ctypes.memmove(buf, data, len(data))
+            return len(data)
+
+        def writer(buffer, on_line):
+            partial_line = b''
+
+            def write(buf, length):
+                nonlocal partial_line
+                data = ctypes.string_at(buf, length)
+                buffer.write(data)
+                if on_line:
+                    *lines, partial_line = (partial_line + data).split(b'\n')
+                    for line in lines:
+                        on_line(line.decode('utf-8', errors='replace') + '\n')
+                return length
+            return write
+
+        # 回调对象必须在调用期间保持引用，否则会被回收
+        callbacks = (_STDIN_FUNC(guarded(read_stdin)),
+                     _OUTPUT_FUNC(guarded(writer(stdout_buffer, on_stdout), stdout_buffer)),
+                     _OUTPUT_FUNC(guarded(writer(stderr_buffer, on_stderr), stderr_buffer)))
+        poll_callback = _POLL_FUNC(guarded(lambda: 0))
+        argv = [b'gs'] + [str(a).encode('utf-8') for a in args]
+        c_argv = (ctypes.c_char_p * len(argv))(*argv)
+
+        lib = self.lib
+        with _instance_lock:
+            instance = ctypes.c_void_p()
+            code = lib.gsapi_new_instance(ctypes.byref(instance), None)
+            if code < 0:
+                raise GhostscriptAPIError(f"无法创建Ghostscript实例 (错误码: {code})", code)
+            try:
+                lib.gsapi_set_stdio(instance, *callbacks)
+                if poll and self.has_poll:
+                    lib.gsapi_set_poll(instance, poll_callback)
+                lib.gsapi_set_arg_encoding(instance, GS_ARG_ENCODING_UTF8)
+                code = lib.gsapi_init_with_args(instance, len(argv), c_argv)
+                exit_code = lib.gsapi_exit(instance)
+                if code in (0, GS_ERROR_QUIT):
+                    code = exit_code
+            finally:
+                lib.gsapi_delete_instance(instance)
+
+        stdout = stdout_buffer.getvalue()
+        stderr = stderr_buffer.getvalue()
+        if raised:
+            if isinstance(raised[0], GhostscriptAPIError):
+                raised[0].stdout, raised[0].stderr = stdout, stderr
+            raise raised[0]
+        if code not in (0, GS_ERROR_QUIT):
+            raise GhostscriptAPIError(f"Ghostscript执行失败 (错误码: {code})", code, stdout, stderr)
+        return stdout, stderr
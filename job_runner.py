@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务执行器
+工作线程从队列中取出书签任务交给引擎执行，进度和结果放入事件队列，
+由UI线程定期调用poll()取出并在UI线程中执行回调。
+本模块不依赖tkinter，GUI用root.after定时调用poll()即可保持界面响应
+"""
+
+import queue
+import threading
+
+from bookmark_engine import JobCancelled
+
+# 事件类型
+EVENT_STARTED = 'started'
+EVENT_LOG = 'log'
+EVENT_PROGRESS = 'progress'
+EVENT_BUDGET = 'budget'
+EVENT_DONE = 'done'
+EVENT_FAILED = 'failed'
+EVENT_CANCELLED = 'cancelled'
+
+
+class _Ticket:
+    """已提交的任务及其回调"""
+
+    def __init__(self, job, preferred, required, on_done, on_error, on_cancel):
+        self.job = job
+        self.preferred = preferred
+        self.required = required
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+
+
+class JobRunner:
+    """在后台线程中执行BookmarkJob"""
+
+    def __init__(self, engine, workers=1, log=None):
+        self.engine = engine
+        self.log = log
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = []
+        self._running = []
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"bookmark-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job, preferred=None, required=(), on_done=None, on_error=None, on_cancel=None):
+        """提交任务；回调在调用poll()的线程中执行
+
+        on_done(result)、on_error(exception)、on_cancel(job)
+        """
+        ticket = _Ticket(job, preferred, required, on_done, on_error, on_cancel)
+        with self._lock:
+            self._queued.append(ticket)
+        self._jobs.put(ticket)
+        return job
+
+    def cancel(self, job=None):
+        """取消指定任务；job为None时取消所有排队和正在执行的任务"""
+        with self._lock:
+            tickets = self._queued + self._running
+        for ticket in tickets:
+            if job is None or ticket.job is job:
+                ticket.job.cancel()
+
+    @property
+    def queued_count(self):
+        with self._lock:
+            return len(self._queued)
+
+    @property
+    def running_jobs(self):
+        with self._lock:
+            return [ticket.job for ticket in self._running]
+
+    @property
+    def busy(self):
+        with self._lock:
+            return bool(self._queued or self._running)
+
+    def poll(self):
+        """取出所有待处理的事件并执行回调，返回(事件类型, 任务, 数据)列表
+
+        同一任务连续的进度事件只保留最新的一个
+        """
+        events = []
+        while True:
+            try:
+                kind, ticket, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == EVENT_PROGRESS and events and events[-1][:2] == (EVENT_PROGRESS, ticket.job):
+                events[-1] = (kind, ticket.job, payload)
+                continue
+            events.append((kind, ticket.job, payload))
+            if kind == EVENT_DONE and ticket.on_done:
+                ticket.on_done(payload)
+            elif kind == EVENT_FAILED and ticket.on_error:
+                ticket.on_error(payload)
+            elif kind == EVENT_CANCELLED and ticket.on_cancel:
+                ticket.on_cancel(ticket.job)
+            elif kind == EVENT_LOG and self.log:
+                self.log(payload)
+        return events
+
+    def shutdown(self, cancel=True, timeout=5):
+        """停止工作线程；cancel为True时先取消所有任务"""
+        if cancel:
+            self.cancel()
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            ticket = self._jobs.get()
+            if ticket is None:
+                break
+            with self._lock:
+                self._queued.remove(ticket)
+                self._running.append(ticket)
+            try:
+                self._execute(ticket)
+            finally:
+                with self._lock:
+                    self._running.remove(ticket)
+
+    def _execute(self, ticket):
+        job = ticket.job
+        if job.cancelled:
+            self._events.put((EVENT_CANCELLED, ticket, None))
+            return
+
+        self._events.put((EVENT_STARTED, ticket, None))
+        job.on_progress = lambda progress: self._events.put((EVENT_PROGRESS, ticket, progress))
+        job.on_budget = lambda backend, estimate, budget: self._events.put(
+            (EVENT_BUDGET, ticket, (backend, estimate, budget)))
+        try:
+            result = self.engine.run(
+                job, preferred=ticket.preferred, required=ticket.required,
+                log=lambda message: self._events.put((EVENT_LOG, ticket, message)))
+        except JobCancelled:
+            self._events.put((EVENT_CANCELLED, ticket, None))
+        except Exception as e:
+            self._events.put((EVENT_FAILED, ticket, e))
+        else:
+            self._events.put((EVENT_DONE, ticket, result))
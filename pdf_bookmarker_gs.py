@@ -1,12 +1,22 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import subprocess
+import threading
 import os
 import sys
-import tempfile
-import re
 from pathlib import Path
 
+from async_runner import default_runner
+from bookmark_core import (BookmarkTable, build_pdfmarks, clean_title_for_postscript,
+                           write_pdfmarks)
+from bookmark_engine import (OP_ADD, OP_CLEAR, OP_REPLACE, BookmarkEngine, BookmarkJob, EngineError,
+                             format_seconds, get_common_ghostscript_paths)
+from build_cache import BuildCache
+from job_runner import (EVENT_BUDGET, EVENT_CANCELLED, EVENT_DONE, EVENT_FAILED, EVENT_PROGRESS, EVENT_STARTED,
+                        JobRunner)
+from pdf_prep import PdfPreparer
+from pdf_structure import PDFStructureError, read_page_count, read_pdf_summary
+from validation_rules import validate_bookmarks
+
 # 导入图标配置
 try:
     from assets.icons.icon_config import icon_config
@@ -24,6 +34,21 @@ class PDFBookmarkerApp:
         # 设置窗口图标
         self.setup_window_icon()
         
+        # 书签处理引擎（Ghostscript、qpdf、增量更新等后端）
+        # 构建缓存同时保存规范化副本，反复修改目录重新生成时不必重写页面
+        self.engine = BookmarkEngine(cache=BuildCache())
+        
+        # 最近一次解析的目录，文本框未修改时复用
+        self.bookmark_table = None
+        
+        # 后台任务执行器，界面通过poll_jobs定时获取结果
+        self.job_runner = JobRunner(self.engine, log=self.log_job_message)
+        self.job_status = {}
+        
+        # 选择PDF后在后台预处理，输入目录期间完成与目录无关的工作
+        self.preparer = PdfPreparer(self.engine)
+        self.prepare_after_id = None
+        
         # 设置样式和主题
         self.setup_styles()
         self.setup_ui()
@@ -31,6 +56,10 @@ class PDFBookmarkerApp:
         # 设置窗口居中
         self.center_window()
         
+        # 关闭窗口时先结束后台任务，然后开始轮询任务事件
+        self.root.protocol("WM_DELETE_WINDOW", self.on_exit)
+        self.root.after(100, self.poll_jobs)
+        
     def setup_styles(self):
         """设置现代化的样式"""
         style = ttk.Style()
@@ -223,6 +252,7 @@ class PDFBookmarkerApp:
         self.placeholder_text = "/Users/vanabel/Zotero/storage/RIPGDEB6/DonaldsonKronheimer_1990_The_geometry_of_four-manifolds.pdf"
         self.is_placeholder = True
         self.setup_placeholder()
+        self.pdf_path_var.trace_add('write', self.on_pdf_path_changed)
         
         # 启用粘贴功能
         self.pdf_entry.bind('<Control-v>', self.paste_pdf_path)
@@ -264,6 +294,19 @@ class PDFBookmarkerApp:
                               style='Info.TLabel')
         debug_desc.grid(row=1, column=2, padx=(30, 0), pady=(0, 10))
         
+        # 生成引擎选择
+        backend_label = ttk.Label(settings_frame, text="生成引擎:", style='Header.TLabel')
+        backend_label.grid(row=1, column=0, sticky=tk.W, pady=(0, 10))
+        
+        self.backend_choices = {"自动选择 (最快的可用引擎)": None}
+        for backend in self.engine.backends.values():
+            self.backend_choices[f"{backend.label} ({backend.description})"] = backend.name
+        self.backend_var = tk.StringVar(value=next(iter(self.backend_choices)))
+        backend_combo = ttk.Combobox(settings_frame, textvariable=self.backend_var,
+                                     values=list(self.backend_choices), state='readonly',
+                                     width=32, font=('Arial', 12))
+        backend_combo.grid(row=1, column=1, sticky=tk.W, pady=(0, 10))
+        
         # 配置列权重
         settings_frame.columnconfigure(1, weight=1)
         
@@ -331,6 +374,15 @@ class PDFBookmarkerApp:
                                 padx=30, pady=10)
         generate_btn.grid(row=0, column=1, padx=(0, 20), pady=10)
         
+        # 替换书签按钮：一次写出，去掉旧书签并写入新书签
+        replace_btn = tk.Button(action_frame, text="🔁 替换书签", 
+                               command=lambda: self.generate_bookmarks(OP_REPLACE), 
+                               font=('Arial', 14, 'bold'),
+                               bg='#9b59b6', fg='black',
+                               relief='raised', bd=3,
+                               padx=30, pady=10)
+        replace_btn.grid(row=0, column=2, padx=(0, 20), pady=10)
+        
         # 测试工具按钮
         test_btn = tk.Button(action_frame, text="🧪 测试工具", 
                             command=self.test_all_tools, 
@@ -338,22 +390,34 @@ class PDFBookmarkerApp:
                             bg='#3498db', fg='black',
                             relief='raised', bd=3,
                             padx=30, pady=10)
-        test_btn.grid(row=0, column=2, padx=(0, 20), pady=10)
+        test_btn.grid(row=0, column=3, padx=(0, 20), pady=10)
+        
+        # 取消任务按钮：结束正在运行的外部进程并删除不完整的输出
+        self.cancel_btn = tk.Button(action_frame, text="⏹️ 取消任务", 
+                                   command=self.cancel_jobs, 
+                                   font=('Arial', 14, 'bold'),
+                                   bg='#95a5a6', fg='black',
+                                   relief='raised', bd=3,
+                                   padx=30, pady=10,
+                                   state=tk.DISABLED)
+        self.cancel_btn.grid(row=0, column=4, padx=(0, 20), pady=10)
         
         # 退出按钮
         exit_btn = tk.Button(action_frame, text="❌ 退出", 
-                            command=self.root.quit, 
+                            command=self.on_exit, 
                             font=('Arial', 14, 'bold'),
                             bg='#e74c3c', fg='black',
                             relief='raised', bd=3,
                             padx=30, pady=10)
-        exit_btn.grid(row=0, column=3, padx=(0, 0), pady=10)
+        exit_btn.grid(row=0, column=5, padx=(0, 0), pady=10)
         
         # 配置列权重
         action_frame.columnconfigure(0, weight=1)
         action_frame.columnconfigure(1, weight=1)
         action_frame.columnconfigure(2, weight=1)
         action_frame.columnconfigure(3, weight=1)
+        action_frame.columnconfigure(4, weight=1)
+        action_frame.columnconfigure(5, weight=1)
         
         # 等待布局完成后再获取位置信息
         self.root.after(200, self.show_button_positions, action_frame, clear_bookmarks_btn, generate_btn, test_btn, exit_btn)
@@ -375,6 +439,10 @@ class PDFBookmarkerApp:
                                 style='Info.TLabel')
         status_label.pack(side=tk.LEFT)
         
+        # 任务进度条：Ghostscript报告页进度时为确定模式，否则为滚动模式
+        self.progress_bar = ttk.Progressbar(status_container, mode='determinate',
+                                            length=160, maximum=1.0)
+        
         # 右侧Ghostscript状态
         self.gs_status_var = tk.StringVar(value="")
         gs_status_label = ttk.Label(status_container, textvariable=self.gs_status_var, 
@@ -444,194 +512,74 @@ Exercises 42
         
     def parse_toc(self, toc_text):
         """解析目录文本，提取标题和页码，支持动态偏移指令"""
-        lines = toc_text.strip().split('\n')
-        bookmarks = []
-        current_offset = 0  # 当前偏移值
-        
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line:
-                continue
-                
-            # 检查是否是偏移指令 - 使用HTML注释风格格式
-            # 格式: <!---offset +/-数字--->
-            offset_match = re.search(r'<!---\s*offset\s*([+-]?\d+)\s*--->', line)
-            if offset_match:
-                offset_change = int(offset_match.group(1))
-                current_offset += offset_change
-                print(f"第{line_num}行: 检测到偏移指令 '{line.strip()}'，当前偏移调整为: {current_offset}")
-                continue
-                
-            # 匹配包含点线的格式：标题 ......................... 页码
-            # 或者简单的格式：标题 页码（支持负数）
-            match = re.search(r'(.*?)\s*[\.\s]*(-?\d+)\s*$', line)
-            if match:
-                title = match.group(1).strip()
-                page = int(match.group(2))
-                # 应用当前偏移
-                adjusted_page = page + current_offset
-                bookmarks.append((title, adjusted_page, current_offset))
-                
-        return bookmarks
+        return BookmarkTable.from_text(toc_text, log=print)
+        
+    def get_bookmark_table(self):
+        """解析目录文本框，文本未修改时直接复用上次的结果"""
+        if self.bookmark_table is None or self.toc_text.edit_modified():
+            self.bookmark_table = BookmarkTable.from_lines(self.iter_toc_lines(), log=print)
+            self.toc_text.edit_modified(False)
+        return self.bookmark_table
+        
+    def iter_toc_lines(self, chunk_lines=1000):
+        """分块读取目录文本框，逐行产出内容"""
+        last_line = int(self.toc_text.index('end-1c').split('.')[0])
+        for start in range(1, last_line + 1, chunk_lines):
+            end = min(start + chunk_lines, last_line + 1)
+            chunk = self.toc_text.get(f"{start}.0", f"{end}.0")
+            lines = chunk.split('\n')
+            # 块以换行结尾时最后一个元素是空串，不是真正的行
+            if chunk.endswith('\n'):
+                lines.pop()
+            yield from lines
+            
+    def highlight_toc_line(self, line_num):
+        """在目录文本框中标出第line_num行（从第一个非空行开始计数，与解析器一致）"""
+        self.toc_text.tag_remove("engine_error", "1.0", tk.END)
+        self.toc_text.tag_configure("engine_error", background="lightcoral", foreground="darkred")
+        first = None
+        for index, line in enumerate(self.iter_toc_lines(), start=1):
+            if first is None and line.strip():
+                first = index
+            if first is not None and index - first + 1 == line_num:
+                self.toc_text.tag_add("engine_error", f"{index}.0", f"{index}.end")
+                self.toc_text.see(f"{index}.0")
+                return
+        
+    def has_toc_content(self):
+        """目录文本框中是否有非空白内容"""
+        return bool(self.toc_text.search(r'\S', '1.0', tk.END, regexp=True))
         
     def generate_pdfmarks(self, bookmarks, offset):
         """生成PDF书签格式"""
-        # 添加PostScript头部
-        pdfmarks = ['%!PS']
-        
-        for title, adjusted_page, bookmark_offset in bookmarks:
-            # 计算最终的PDF页码（Ghostscript从0开始计数）
-            # adjusted_page已经包含了动态偏移，现在加上基础偏移
-            final_page = adjusted_page + offset - 1
-            
-            # 清理标题中的特殊字符，避免PostScript语法错误
-            clean_title = self.clean_title_for_postscript(title)
-            
-            pdfmark = f'[ /Title ({clean_title}) /Page {final_page} /OUT pdfmark'
-            pdfmarks.append(pdfmark)
-            
-        return '\n'.join(pdfmarks)
+        return build_pdfmarks(bookmarks, offset)
         
     def clean_title_for_postscript(self, title):
         """清理标题，使其符合PostScript语法要求"""
-        # 移除或转义可能导致PostScript语法错误的字符
-        # PostScript字符串中需要转义的字符: ( ) \ 
-        clean_title = title.replace('\\', '\\\\')  # 转义反斜杠
-        clean_title = clean_title.replace('(', '\\(')  # 转义左括号
-        clean_title = clean_title.replace(')', '\\)')  # 转义右括号
-        
-        # 移除其他可能导致问题的字符
-        clean_title = clean_title.replace('\n', ' ')  # 换行符替换为空格
-        clean_title = clean_title.replace('\r', ' ')  # 回车符替换为空格
-        clean_title = clean_title.replace('\t', ' ')  # 制表符替换为空格
-        
-        # 移除首尾空格
-        clean_title = clean_title.strip()
-        
-        return clean_title
+        return clean_title_for_postscript(title)
         
     def check_ghostscript(self):
         """检查Ghostscript是否可用"""
-        # 首先检查系统PATH中的命令
-        try:
-            # 尝试运行ghostscript命令
-            result = subprocess.run(['gs', '--version'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-            
-        # 尝试其他可能的命令名
-        for cmd in ['gswin64c', 'gswin32c', 'gs']:
-            try:
-                result = subprocess.run([cmd, '--version'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    return True, result.stdout.strip()
-            except (subprocess.TimeoutExpired, FileNotFoundError):
-                continue
-        
-        # 检查常见的安装路径
-        common_paths = self.get_common_ghostscript_paths()
-        for path in common_paths:
-            if os.path.exists(path):
-                try:
-                    result = subprocess.run([path, '--version'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        return True, result.stdout.strip()
-                except:
-                    continue
-                
-        return False, None
+        backend = self.engine.backends['ghostscript']
+        return backend.is_available(), backend.version
     
     def check_qpdf(self):
         """检查qpdf是否可用"""
-        try:
-            # 尝试运行qpdf命令
-            result = subprocess.run(['qpdf', '--version'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-            
-        # 尝试其他可能的命令名
-        for cmd in ['qpdf', 'qpdf.exe']:
-            try:
-                result = subprocess.run([cmd, '--version'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    return True, result.stdout.strip()
-            except (subprocess.TimeoutExpired, FileNotFoundError):
-                continue
-                
-        return False, None
+        backend = self.engine.backends['qpdf']
+        return backend.is_available(), backend.version
     
     def get_common_ghostscript_paths(self):
         """获取常见的Ghostscript安装路径"""
-        paths = []
+        return get_common_ghostscript_paths()
         
-        # 获取当前脚本所在目录
-        if getattr(sys, 'frozen', False):
-            # 打包后的可执行文件
-            base_path = os.path.dirname(sys.executable)
-        else:
-            # 开发环境
-            base_path = os.path.dirname(os.path.abspath(__file__))
-        
-        # 检查当前目录和子目录
-        for root, dirs, files in os.walk(base_path):
-            for file in files:
-                if file.lower() in ['gs', 'gswin64c', 'gswin32c']:
-                    paths.append(os.path.join(root, file))
-        
-        # Windows常见路径
-        if os.name == 'nt':
-            program_files = os.environ.get('PROGRAMFILES', 'C:\\Program Files')
-            program_files_x86 = os.environ.get('PROGRAMFILES(X86)', 'C:\\Program Files (x86)')
-            
-            gs_paths = [
-                os.path.join(program_files, 'gs', 'gs*', 'bin', 'gswin64c.exe'),
-                os.path.join(program_files_x86, 'gs', 'gs*', 'bin', 'gswin32c.exe'),
-                os.path.join(program_files, 'gs', 'gs*', 'bin', 'gs.exe'),
-                os.path.join(program_files_x86, 'gs', 'gs*', 'bin', 'gs.exe'),
-            ]
-            
-            for pattern in gs_paths:
-                import glob
-                matches = glob.glob(pattern)
-                paths.extend(matches)
-        
-        # macOS常见路径
-        elif sys.platform == 'darwin':
-            mac_paths = [
-                '/usr/local/bin/gs',
-                '/opt/homebrew/bin/gs',
-                '/usr/bin/gs'
-            ]
-            paths.extend(mac_paths)
-        
-        # Linux常见路径
-        elif sys.platform.startswith('linux'):
-            linux_paths = [
-                '/usr/bin/gs',
-                '/usr/local/bin/gs',
-                '/opt/gs/bin/gs'
-            ]
-            paths.extend(linux_paths)
-        
-        return paths
-        
-    def generate_bookmarks(self):
-        """生成PDF书签"""
+    def generate_bookmarks(self, operation=OP_ADD):
+        """生成PDF书签；operation为OP_REPLACE时同时去掉原有书签"""
         # 检查输入
         if not self.pdf_path_var.get() or self.is_placeholder:
             messagebox.showerror("错误", "请选择PDF文件")
             return
             
-        if not self.toc_text.get(1.0, tk.END).strip():
+        if not self.has_toc_content():
             messagebox.showerror("错误", "请输入目录内容")
             return
             
@@ -657,6 +605,16 @@ Exercises 42
             print(f"  大小: {file_size} 字节")
             print(f"  存在: {input_pdf_path.exists()}")
             print(f"  可读: {os.access(input_pdf_path, os.R_OK)}")
+            prepared = self.preparer.get(input_pdf_path)
+            try:
+                summary = prepared.summary if prepared and prepared.summary else read_pdf_summary(input_pdf_path)
+                print(f"  PDF版本: {summary['version']}")
+                print(f"  页数: {summary['page_count']}")
+                print(f"  原有书签(顶层): {summary['outline_count']}")
+            except PDFStructureError as e:
+                print(f"  结构读取失败: {e}")
+            if prepared and prepared.base_pdf:
+                print(f"  规范化副本: {prepared.base_pdf}")
             
         try:
             offset = int(self.offset_var.get())
@@ -664,148 +622,177 @@ Exercises 42
             messagebox.showerror("错误", "页面偏移必须是数字")
             return
             
-        # 检查Ghostscript
-        gs_available, gs_version = self.check_ghostscript()
-        if not gs_available:
-            messagebox.showerror("错误", 
-                "未找到Ghostscript。请安装Ghostscript并确保它在系统PATH中。\n\n"
-                "安装说明:\n"
-                "Windows: 下载并安装Ghostscript\n"
-                "macOS: brew install ghostscript\n"
-                "Linux: sudo apt-get install ghostscript")
-            self.update_ghostscript_status()  # 更新状态栏
-            return
-            
-        self.status_var.set(f"✅ 使用Ghostscript版本: {gs_version}")
-        self.update_ghostscript_status()  # 更新状态栏
-        
         try:
-            # 解析目录
-            toc_text = self.toc_text.get(1.0, tk.END)
-            bookmarks = self.parse_toc(toc_text)
+            # 分块读取文本框并逐行解析目录，不复制整个文本
+            bookmarks = self.get_bookmark_table()
             
             if not bookmarks:
                 messagebox.showerror("错误", "无法解析目录内容，请检查格式")
                 return
                 
-            # 生成PDF书签
-            pdfmarks_content = self.generate_pdfmarks(bookmarks, offset)
-            
             if self.debug_var.get():
                 print(f"生成的pdfmarks内容:")
-                print(pdfmarks_content)
+                write_pdfmarks(sys.stdout, bookmarks, offset)
+                print()
                 print(f"书签数量: {len(bookmarks)}")
-            
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.pdfmarks', 
-                                           delete=False, encoding='utf-8') as f:
-                f.write(pdfmarks_content)
-                pdfmarks_file = f.name
                 
             # 生成输出文件名
-            input_pdf = Path(self.pdf_path_var.get())
-            output_pdf = input_pdf.parent / f"{input_pdf.stem}_with_bookmarks.pdf"
+            output_pdf = input_pdf_path.parent / f"{input_pdf_path.stem}_with_bookmarks.pdf"
             
             # 检查输出目录权限
-            if not os.access(input_pdf.parent, os.W_OK):
-                messagebox.showerror("错误", f"没有输出目录的写入权限:\n{input_pdf.parent}")
+            if not os.access(input_pdf_path.parent, os.W_OK):
+                messagebox.showerror("错误", f"没有输出目录的写入权限:\n{input_pdf_path.parent}")
                 return
                 
             if self.debug_var.get():
                 print(f"输出文件信息:")
                 print(f"  路径: {output_pdf}")
-                print(f"  目录: {input_pdf.parent}")
-                print(f"  目录可写: {os.access(input_pdf.parent, os.W_OK)}")
+                print(f"  目录: {input_pdf_path.parent}")
+                print(f"  目录可写: {os.access(input_pdf_path.parent, os.W_OK)}")
                 print(f"  输出文件已存在: {output_pdf.exists()}")
             
-            # 运行Ghostscript命令
-            gs_cmd = self.get_ghostscript_command()
-            cmd = [
-                gs_cmd,
-                '-dBATCH',
-                '-dNOPAUSE',
-                '-q',
-                '-sDEVICE=pdfwrite',
-                '-sOutputFile=' + str(output_pdf),
-                str(input_pdf),
-                '-f',  # 表示后面是PostScript文件
-                pdfmarks_file
-            ]
-            
-            self.status_var.set("🔄 正在生成PDF书签...")
-            self.root.update()
-            
-            # 执行命令
-            self.status_var.set("⚙️ 正在执行Ghostscript命令...")
-            self.root.update()
-            
-            # 显示执行的命令
-            cmd_str = ' '.join(cmd)
-            if self.debug_var.get():
-                print(f"执行命令: {cmd_str}")
-                print(f"工作目录: {os.getcwd()}")
-                print(f"输入PDF: {input_pdf}")
-                print(f"输出PDF: {output_pdf}")
-                print(f"书签文件: {pdfmarks_file}")
-            
-            # 执行命令并捕获详细输出
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            action = '替换' if operation == OP_REPLACE else '生成'
             
-            # 清理临时文件
-            try:
-                os.unlink(pdfmarks_file)
-            except:
-                pass
-                
-            if result.returncode == 0:
+            def on_success(result):
                 messagebox.showinfo("成功", 
-                    f"PDF书签已生成成功！\n\n"
-                    f"输出文件: {output_pdf}\n"
-                    f"书签数量: {len(bookmarks)}")
+                    f"PDF书签已{action}成功！\n\n"
+                    f"输出文件: {result.output_pdf}\n"
+                    f"书签数量: {result.count}\n"
+                    f"使用引擎: {result.backend.label} ({result.duration:.1f} 秒)")
                 self.status_var.set("🎉 书签生成完成！输出文件已保存")
-            else:
-                # 显示详细的错误信息
-                error_msg = f"Ghostscript执行失败 (退出代码: {result.returncode})\n\n"
-                error_msg += f"执行的命令:\n{cmd_str}\n\n"
-                error_msg += f"标准输出:\n{result.stdout}\n\n"
-                error_msg += f"错误输出:\n{result.stderr}\n\n"
-                error_msg += f"临时书签文件内容:\n{pdfmarks_content}"
-                
-                # 创建详细的错误日志窗口
-                self.show_error_log(error_msg)
-                self.status_var.set("❌ 书签生成失败，请查看错误详情")
                 
+            # 预处理已完成时使用其结果：结构损坏的文件直接在规范化副本上写入书签
+            prepared = self.preparer.get(input_pdf_path)
+            if prepared:
+                job = BookmarkJob(operation, prepared.base_pdf or input_pdf_path, output_pdf, bookmarks, offset,
+                                  page_count=prepared.page_count)
+            else:
+                job = BookmarkJob(operation, input_pdf_path, output_pdf, bookmarks, offset)
+            self.run_engine_job(job, f"🔄 正在{action}PDF书签...", on_success,
+                                "❌ 书签生成失败，请查看错误详情")
+            
         except Exception as e:
             messagebox.showerror("❌ 错误", f"生成过程中发生错误:\n{str(e)}")
             self.status_var.set("❌ 书签生成失败，请查看错误详情")
             
-    def get_ghostscript_command(self):
-        """获取可用的Ghostscript命令"""
-        # 首先检查系统PATH中的命令
-        for cmd in ['gs', 'gswin64c', 'gswin32c']:
-            try:
-                subprocess.run([cmd, '--version'], 
-                              capture_output=True, timeout=5)
-                return cmd
-            except:
-                continue
+    def run_engine_job(self, job, status_text, on_success, failure_text):
+        """把任务交给后台线程执行，完成后在UI线程中调用on_success(result)"""
+        preferred = self.backend_choices.get(self.backend_var.get())
+        
+        def on_done(result):
+            if result.failures:
+                failed = "、".join(name for name, _ in result.failures)
+                self.status_var.set(f"⚠️ {failed}执行失败，已自动改用{result.backend.label}")
+            on_success(result)
+            
+        def on_error(error):
+            if isinstance(error, EngineError):
+                # 所有引擎均失败时才显示详细的错误日志，能定位时标出出错的书签
+                source = error.source
+                if source:
+                    line_num, source_text = source
+                    if line_num:
+                        self.highlight_toc_line(line_num)
+                    self.show_error_log(error.format_log(), highlight=source_text)
+                else:
+                    self.show_error_log(error.format_log())
+            else:
+                messagebox.showerror("❌ 错误", f"处理过程中发生错误:\n{str(error)}")
+            self.status_var.set(failure_text)
+            
+        def on_cancel(job):
+            self.status_var.set("⏹️ 任务已取消，未完成的输出文件已删除")
+            
+        self.job_status[job] = status_text
+        self.job_runner.submit(job, preferred=preferred, on_done=on_done,
+                               on_error=on_error, on_cancel=on_cancel)
+        queued = self.job_runner.queued_count
+        if self.job_runner.running_jobs and queued:
+            self.status_var.set(f"⏳ 已加入队列，前面还有{queued - 1 + len(self.job_runner.running_jobs)}个任务")
+        else:
+            self.status_var.set(status_text)
+        self.update_job_controls()
         
-        # 检查常见安装路径
-        common_paths = self.get_common_ghostscript_paths()
-        for path in common_paths:
-            if os.path.exists(path):
-                try:
-                    subprocess.run([path, '--version'], 
-                                  capture_output=True, timeout=5)
-                    return path
-                except:
-                    continue
+    def log_job_message(self, message):
+        """调试模式下输出后台任务的日志"""
+        if self.debug_var.get():
+            print(message)
+            
+    def poll_jobs(self):
+        """定时处理后台任务的事件，保持界面响应"""
+        for kind, job, payload in self.job_runner.poll():
+            if kind == EVENT_STARTED:
+                remaining = self.job_runner.queued_count
+                status = self.job_status.get(job, "🔄 正在处理...")
+                if remaining:
+                    status += f" (队列中还有{remaining}个任务)"
+                self.status_var.set(status)
+                self.show_progress(None)
+            elif kind == EVENT_BUDGET:
+                backend, estimate, budget = payload
+                self.log_job_message(f"{backend.label}: 预计 {estimate:.1f} 秒，时间上限 {budget:.0f} 秒")
+                self.status_var.set(f"{self.job_status.get(job, '🔄 正在处理...')} "
+                                    f"({backend.label}，时间上限 {format_seconds(budget)})")
+            elif kind == EVENT_PROGRESS:
+                self.show_progress(payload)
+                self.status_var.set(f"{self.job_status.get(job, '🔄 正在处理...')} {payload.format()} · "
+                                    f"上限 {format_seconds(job.time_budget)}")
+            elif kind in (EVENT_DONE, EVENT_FAILED, EVENT_CANCELLED):
+                self.job_status.pop(job, None)
+        if not self.job_runner.running_jobs:
+            self.hide_progress()
+        self.update_job_controls()
+        self.root.after(100, self.poll_jobs)
+        
+    def show_progress(self, progress):
+        """显示进度条；progress为None或总页数未知时使用滚动模式"""
+        if not self.progress_bar.winfo_manager():
+            self.progress_bar.pack(side=tk.LEFT, padx=(10, 0))
+        fraction = progress.fraction if progress is not None else None
+        if fraction is None:
+            if str(self.progress_bar['mode']) != 'indeterminate':
+                self.progress_bar.config(mode='indeterminate', maximum=100)
+                self.progress_bar.start(50)
+        else:
+            if str(self.progress_bar['mode']) != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate', maximum=1.0)
+            self.progress_bar['value'] = fraction
+            
+    def hide_progress(self):
+        if self.progress_bar.winfo_manager():
+            self.progress_bar.stop()
+            self.progress_bar['value'] = 0
+            self.progress_bar.pack_forget()
+            
+    def update_job_controls(self):
+        """有任务排队或执行时才允许取消"""
+        state = tk.NORMAL if self.job_runner.busy else tk.DISABLED
+        if str(self.cancel_btn['state']) != state:
+            self.cancel_btn.config(state=state)
+            
+    def cancel_jobs(self):
+        """取消所有排队和正在执行的任务"""
+        if self.job_runner.busy:
+            self.job_runner.cancel()
+            self.status_var.set("⏹️ 正在取消任务...")
+            
+    def on_exit(self):
+        """退出程序，先结束后台任务"""
+        if self.job_runner.busy:
+            if not messagebox.askyesno("退出", "还有任务正在执行，确定要取消任务并退出吗？"):
+                return
+            self.job_runner.shutdown(cancel=True)
+        self.preparer.close()
+        self.root.quit()
         
+    def get_ghostscript_command(self):
+        """获取可用的Ghostscript命令"""
         # 如果都找不到，返回默认命令
-        return 'gs'
+        return self.engine.backends['ghostscript'].command or 'gs'
         
-    def show_error_log(self, error_msg):
-        """显示美化的错误日志窗口"""
+    def show_error_log(self, error_msg, highlight=None):
+        """显示美化的错误日志窗口，highlight为需要突出显示的文本（例如出错的书签）"""
         # 创建新窗口
         error_window = tk.Toplevel(self.root)
         error_window.title("🚨 Ghostscript错误详情")
@@ -857,6 +844,17 @@ Exercises 42
         
         # 插入错误信息
         text_widget.insert(tk.END, error_msg)
+        
+        # 突出显示出错的书签并滚动到第一次出现的位置
+        if highlight:
+            text_widget.tag_configure("highlight", background="lightcoral", foreground="darkred")
+            start = text_widget.search(highlight, "1.0", stopindex=tk.END)
+            if start:
+                text_widget.see(start)
+            while start:
+                end = f"{start}+{len(highlight)}c"
+                text_widget.tag_add("highlight", start, end)
+                start = text_widget.search(highlight, end, stopindex=tk.END)
         text_widget.config(state=tk.DISABLED)  # 设置为只读
         
         # 按钮区域
@@ -910,6 +908,10 @@ Exercises 42
             test_results.append("=" * 60)
             test_results.append("")
             
+            # 重新探测所有引擎
+            for backend in self.engine.backends.values():
+                backend.refresh()
+            
             # 测试Ghostscript
             test_results.append("🔧 Ghostscript 测试")
             test_results.append("-" * 30)
@@ -920,27 +922,22 @@ Exercises 42
                 test_results.append(f"  版本: {gs_version}")
                 test_results.append(f"  命令: {gs_cmd}")
                 
-                # 测试版本信息
-                try:
-                    result = subprocess.run([gs_cmd, '--version'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        test_results.append(f"  版本测试: ✓ 成功")
-                    else:
-                        test_results.append(f"  版本测试: ✗ 失败 (退出代码: {result.returncode})")
-                except Exception as e:
-                    test_results.append(f"  版本测试: ✗ 异常: {str(e)}")
+                # 版本信息和pdfwrite设备同时测试
+                version_result, help_result = default_runner().run_all(
+                    [[gs_cmd, '--version'], [gs_cmd, '-h']], timeout=10)
+                if isinstance(version_result, Exception):
+                    test_results.append(f"  版本测试: ✗ 异常: {str(version_result)}")
+                elif version_result.returncode == 0:
+                    test_results.append(f"  版本测试: ✓ 成功")
+                else:
+                    test_results.append(f"  版本测试: ✗ 失败 (退出代码: {version_result.returncode})")
                 
-                # 测试pdfwrite设备
-                try:
-                    result = subprocess.run([gs_cmd, '-h'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0 and 'pdfwrite' in result.stdout:
-                        test_results.append("  pdfwrite设备: ✓ 支持")
-                    else:
-                        test_results.append("  pdfwrite设备: ✗ 不支持")
-                except Exception:
+                if isinstance(help_result, Exception):
                     test_results.append("  pdfwrite设备: ✗ 测试失败")
+                elif help_result.returncode == 0 and 'pdfwrite' in help_result.stdout:
+                    test_results.append("  pdfwrite设备: ✓ 支持")
+                else:
+                    test_results.append("  pdfwrite设备: ✗ 不支持")
             else:
                 test_results.append("✗ Ghostscript未找到")
                 test_results.append("  状态: 无法检测到Ghostscript")
@@ -957,27 +954,22 @@ Exercises 42
                 test_results.append(f"  版本: {qpdf_version}")
                 test_results.append(f"  命令: qpdf")
                 
-                # 测试版本信息
-                try:
-                    result = subprocess.run(['qpdf', '--version'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        test_results.append(f"  版本测试: ✓ 成功")
-                    else:
-                        test_results.append(f"  版本测试: ✗ 失败 (退出代码: {result.returncode})")
-                except Exception as e:
-                    test_results.append(f"  版本测试: ✗ 异常: {str(e)}")
+                # 版本信息和帮助信息同时测试
+                version_result, help_result = default_runner().run_all(
+                    [['qpdf', '--version'], ['qpdf', '--help']], timeout=10)
+                if isinstance(version_result, Exception):
+                    test_results.append(f"  版本测试: ✗ 异常: {str(version_result)}")
+                elif version_result.returncode == 0:
+                    test_results.append(f"  版本测试: ✓ 成功")
+                else:
+                    test_results.append(f"  版本测试: ✗ 失败 (退出代码: {version_result.returncode})")
                 
-                # 测试帮助信息
-                try:
-                    result = subprocess.run(['qpdf', '--help'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        test_results.append("  帮助测试: ✓ 成功")
-                    else:
-                        test_results.append("  帮助测试: ✗ 失败")
-                except Exception:
+                if isinstance(help_result, Exception):
                     test_results.append("  帮助测试: ✗ 测试失败")
+                elif help_result.returncode == 0:
+                    test_results.append("  帮助测试: ✓ 成功")
+                else:
+                    test_results.append("  帮助测试: ✗ 失败")
                     
             else:
                 test_results.append("✗ qpdf未找到")
@@ -986,29 +978,36 @@ Exercises 42
             
             test_results.append("")
             
+            # 书签引擎
+            test_results.append("⚙️ 书签引擎")
+            test_results.append("-" * 30)
+            for backend in self.engine.backends.values():
+                mark = "✓" if backend.is_available() else "✗"
+                test_results.append(f"{mark} {backend.label}: {backend.description}")
+                test_results.append(f"  能力: {', '.join(sorted(backend.capabilities))}")
+            
+            test_results.append("")
+            
             # 功能可用性总结
             test_results.append("📊 功能可用性总结")
             test_results.append("-" * 30)
-            if gs_available and qpdf_available:
-                test_results.append("✓ 所有功能完全可用")
-                test_results.append("  🚀 生成书签: 可用 (需要Ghostscript)")
-                test_results.append("  🧹 清除原始书签: 可用 (需要qpdf)")
-                test_results.append("  📝 建议: 您可以使用所有功能")
-            elif gs_available and not qpdf_available:
-                test_results.append("⚠️ 部分功能可用")
-                test_results.append("  🚀 生成书签: 可用 (Ghostscript已安装)")
-                test_results.append("  🧹 清除原始书签: 不可用 (缺少qpdf)")
-                test_results.append("  📝 建议: 安装qpdf以使用清除书签功能")
-            elif not gs_available and qpdf_available:
-                test_results.append("⚠️ 部分功能可用")
-                test_results.append("  🚀 生成书签: 不可用 (缺少Ghostscript)")
-                test_results.append("  🧹 清除原始书签: 可用 (qpdf已安装)")
-                test_results.append("  📝 建议: 安装Ghostscript以使用生成书签功能")
+            add_backends = [b.label for b in self.engine.candidates(BookmarkJob(OP_ADD, '', ''))]
+            clear_backends = [b.label for b in self.engine.candidates(BookmarkJob(OP_CLEAR, '', ''))]
+            if add_backends:
+                test_results.append(f"  🚀 生成书签: 可用 ({'、'.join(add_backends)})")
+            else:
+                test_results.append("  🚀 生成书签: 不可用")
+            if clear_backends:
+                test_results.append(f"  🧹 清除原始书签: 可用 ({'、'.join(clear_backends)})")
             else:
-                test_results.append("✗ 无法使用主要功能")
-                test_results.append("  🚀 生成书签: 不可用 (缺少Ghostscript)")
-                test_results.append("  🧹 清除原始书签: 不可用 (缺少qpdf)")
-                test_results.append("  📝 建议: 请安装Ghostscript和qpdf")
+                test_results.append("  🧹 清除原始书签: 不可用")
+            replace_backends = [b.label for b in self.engine.candidates(BookmarkJob(OP_REPLACE, '', ''))]
+            if replace_backends:
+                test_results.append(f"  🔁 替换书签: 可用 ({'、'.join(replace_backends)})")
+            else:
+                test_results.append("  🔁 替换书签: 不可用")
+            if not (gs_available and qpdf_available):
+                test_results.append("  📝 建议: 安装Ghostscript和qpdf以启用全部引擎")
             
             test_results.append("")
             test_results.append("=" * 60)
@@ -1036,44 +1035,39 @@ Exercises 42
             test_results.append(f"Ghostscript版本: {gs_version}")
             test_results.append(f"使用命令: {gs_cmd}")
             
+            # 版本信息、帮助信息和设备列表同时测试
+            version_result, help_result, devices_result = default_runner().run_all(
+                [[gs_cmd, '--version'], [gs_cmd, '--help'], [gs_cmd, '-h']], timeout=10)
+            
             # 测试版本信息
-            try:
-                result = subprocess.run([gs_cmd, '--version'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    test_results.append(f"版本测试: ✓ 成功")
-                    test_results.append(f"版本输出: {result.stdout.strip()}")
-                else:
-                    test_results.append(f"版本测试: ✗ 失败 (退出代码: {result.returncode})")
-            except Exception as e:
-                test_results.append(f"版本测试: ✗ 异常: {str(e)}")
+            if isinstance(version_result, Exception):
+                test_results.append(f"版本测试: ✗ 异常: {str(version_result)}")
+            elif version_result.returncode == 0:
+                test_results.append(f"版本测试: ✓ 成功")
+                test_results.append(f"版本输出: {version_result.stdout.strip()}")
+            else:
+                test_results.append(f"版本测试: ✗ 失败 (退出代码: {version_result.returncode})")
             
             # 测试帮助信息
-            try:
-                result = subprocess.run([gs_cmd, '--help'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    test_results.append(f"帮助测试: ✓ 成功")
-                else:
-                    test_results.append(f"帮助测试: ✗ 失败 (退出代码: {result.returncode})")
-            except Exception as e:
-                test_results.append(f"帮助测试: ✗ 异常: {str(e)}")
+            if isinstance(help_result, Exception):
+                test_results.append(f"帮助测试: ✗ 异常: {str(help_result)}")
+            elif help_result.returncode == 0:
+                test_results.append(f"帮助测试: ✓ 成功")
+            else:
+                test_results.append(f"帮助测试: ✗ 失败 (退出代码: {help_result.returncode})")
             
             # 测试设备列表
-            try:
-                result = subprocess.run([gs_cmd, '-h'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    test_results.append(f"设备测试: ✓ 成功")
-                    # 检查是否支持pdfwrite
-                    if 'pdfwrite' in result.stdout:
-                        test_results.append("pdfwrite设备: ✓ 支持")
-                    else:
-                        test_results.append("pdfwrite设备: ✗ 不支持")
+            if isinstance(devices_result, Exception):
+                test_results.append(f"设备测试: ✗ 异常: {str(devices_result)}")
+            elif devices_result.returncode == 0:
+                test_results.append(f"设备测试: ✓ 成功")
+                # 检查是否支持pdfwrite
+                if 'pdfwrite' in devices_result.stdout:
+                    test_results.append("pdfwrite设备: ✓ 支持")
                 else:
-                    test_results.append(f"设备测试: ✗ 失败 (退出代码: {result.returncode})")
-            except Exception as e:
-                test_results.append(f"设备测试: ✗ 异常: {str(e)}")
+                    test_results.append("pdfwrite设备: ✗ 不支持")
+            else:
+                test_results.append(f"设备测试: ✗ 失败 (退出代码: {devices_result.returncode})")
             
             # 显示美化的测试结果窗口
             self.show_test_results_window(test_results, gs_cmd)
@@ -1354,9 +1348,7 @@ Exercises 42
     def preview_bookmarks(self):
         """预览书签内容"""
         try:
-            # 获取目录文本
-            toc_text = self.toc_text.get(1.0, tk.END).strip()
-            if not toc_text:
+            if not self.has_toc_content():
                 messagebox.showwarning("警告", "请先输入目录内容")
                 return
             
@@ -1368,7 +1360,7 @@ Exercises 42
                 return
             
             # 解析目录
-            bookmarks = self.parse_toc(toc_text)
+            bookmarks = self.get_bookmark_table()
             if not bookmarks:
                 messagebox.showerror("错误", "无法解析目录内容")
                 return
@@ -1396,10 +1388,9 @@ Exercises 42
         preview_lines.append("书签列表:")
         preview_lines.append("-" * 40)
         
-        for i, (title, adjusted_page, bookmark_offset) in enumerate(bookmarks, 1):
-            final_page = adjusted_page + offset - 1
-            offset_info = f" (偏移:{bookmark_offset:+d})" if bookmark_offset != 0 else ""
-            preview_lines.append(f"{i:2d}. {title:<40} (调整后第{adjusted_page:2d}页 -> PDF第{final_page:2d}页){offset_info}")
+        for i, bookmark in enumerate(bookmarks.records(), 1):
+            offset_info = f" (偏移:{bookmark.offset:+d})" if bookmark.offset != 0 else ""
+            preview_lines.append(f"{i:2d}. {bookmark.title:<40} (调整后第{bookmark.page:2d}页 -> PDF第{bookmark.final_page(offset):2d}页){offset_info}")
         
         preview_lines.append("")
         preview_lines.append("=" * 60)
@@ -1516,40 +1507,10 @@ Exercises 42
         text_widget.tag_configure("warning", background="lightyellow", foreground="darkorange")
         text_widget.tag_configure("info", background="lightblue", foreground="darkblue")
         
-        # 检查潜在问题
-        issues = []
-        
-        # 检查页码问题
-        for i, (title, adjusted_page, bookmark_offset) in enumerate(bookmarks):
-            # 计算实际的PDF页码 (adjusted_page已经包含了动态偏移)
-            final_page = adjusted_page + offset - 1
-            
-            if adjusted_page == 0:
-                issues.append((f"第{i+1}个书签页码为0: {title}", "error"))
-            elif final_page < 0:
-                issues.append((f"第{i+1}个书签: {title} (调整后第{adjusted_page}页 -> PDF第{final_page}页, 页码为负)", "error"))
-            elif final_page > 1000:
-                issues.append((f"第{i+1}个书签: {title} (调整后第{adjusted_page}页 -> PDF第{final_page}页, 页码过大)", "warning"))
-        
-        # 检查标题长度
-        for i, (title, adjusted_page, bookmark_offset) in enumerate(bookmarks):
-            if len(title) > 100:
-                issues.append((f"第{i+1}个书签标题过长: {title[:50]}...", "warning"))
-            elif len(title.strip()) == 0:
-                issues.append((f"第{i+1}个书签标题为空", "error"))
-        
-        # 检查页码连续性
-        pages = [adjusted_page for _, adjusted_page, _ in bookmarks]
-        if len(pages) > 1:
-            sorted_pages = sorted(pages)
-            if pages != sorted_pages:
-                issues.append(("书签页码顺序不正确，建议按页码排序", "warning"))
-        
-        # 检查偏移设置
-        if offset < 1:
-            issues.append(("页面偏移小于1，可能导致页码错误", "error"))
-        elif offset > 1000:
-            issues.append(("页面偏移过大，请检查设置", "warning"))
+        # 所有规则在一次遍历中检查，每个问题带有目录中的行号；已选择PDF时按实际页数检查页码范围
+        page_count = self.current_page_count()
+        issues = [(str(issue), issue.severity)
+                  for issue in validate_bookmarks(bookmarks, offset, page_count)]
         
         # 在文本末尾添加问题列表
         if issues:
@@ -1565,7 +1526,17 @@ Exercises 42
             text_widget.insert(tk.END, "=" * 60 + "\n")
 
     def update_ghostscript_status(self):
-        """更新Ghostscript状态栏信息"""
+        """在后台线程中探测所有引擎，完成后更新Ghostscript状态栏信息"""
+        self.gs_status_var.set("🔍 正在检测Ghostscript和qpdf...")
+        probe_thread = threading.Thread(target=self.engine.probe_all, daemon=True)
+        probe_thread.start()
+        self.root.after(100, self.show_ghostscript_status, probe_thread)
+        
+    def show_ghostscript_status(self, probe_thread):
+        """探测结束后显示结果，未结束时稍后再检查"""
+        if probe_thread.is_alive():
+            self.root.after(100, self.show_ghostscript_status, probe_thread)
+            return
         gs_available, gs_version = self.check_ghostscript()
         if gs_available:
             self.gs_status_var.set(f"✅ 已找到Ghostscript: {gs_version}")
@@ -1605,6 +1576,31 @@ Exercises 42
             self.pdf_entry.config(foreground='black')
             self.is_placeholder = False
     
+    def on_pdf_path_changed(self, *args):
+        """路径变化后稍等片刻再开始预处理，逐字输入路径时不会反复启动"""
+        if self.prepare_after_id is not None:
+            self.root.after_cancel(self.prepare_after_id)
+        self.prepare_after_id = self.root.after(300, self.start_preparation)
+    
+    def start_preparation(self):
+        """路径指向一个PDF文件时开始预处理，否则丢弃之前的结果"""
+        self.prepare_after_id = None
+        path = self.pdf_path_var.get().strip()
+        if self.is_placeholder or not path.lower().endswith('.pdf') or not os.path.isfile(path):
+            self.preparer.discard()
+            return
+        self.preparer.prepare(path)
+    
+    def current_page_count(self):
+        """当前选择的PDF的页数，优先使用预处理的结果；没有选择文件或无法读取时返回None"""
+        path = self.pdf_path_var.get().strip()
+        if self.is_placeholder or not path or not os.path.isfile(path):
+            return None
+        prepared = self.preparer.get(path)
+        if prepared and prepared.page_count:
+            return prepared.page_count
+        return read_page_count(path)
+    
     def paste_pdf_path(self, event):
         """处理粘贴PDF路径"""
         try:
@@ -1664,59 +1660,39 @@ Exercises 42
             messagebox.showerror("错误", "PDF文件大小为0，可能已损坏")
             return
         
-        # 检查qpdf是否可用
-        qpdf_available, qpdf_version = self.check_qpdf()
-        if not qpdf_available:
-            messagebox.showerror("错误", 
-                "未找到qpdf。请安装qpdf并确保它在系统PATH中。\n\n"
-                "安装说明:\n"
-                "Windows: 下载并安装qpdf\n"
-                "macOS: brew install qpdf\n"
-                "Linux: sudo apt-get install qpdf")
-            return
-            
-        self.status_var.set(f"✅ 使用qpdf版本: {qpdf_version}")
-        
+        # 直接读取PDF结构，没有原始书签时无需调用qpdf重写整个文件
         try:
-            # 生成输出文件名
-            output_pdf = input_pdf_path.parent / f"{input_pdf_path.stem}_no_bookmarks.pdf"
-            
-            # 检查输出目录权限
-            if not os.access(input_pdf_path.parent, os.W_OK):
-                messagebox.showerror("错误", f"没有输出目录的写入权限:\n{input_pdf_path.parent}")
+            prepared = self.preparer.get(input_pdf_path)
+            summary = prepared.summary if prepared and prepared.summary else read_pdf_summary(input_pdf_path)
+            if summary['outline_count'] == 0:
+                messagebox.showinfo("提示", f"该PDF没有原始书签，无需清除:\n{input_pdf_path}")
+                self.status_var.set("ℹ️ 该PDF没有原始书签")
                 return
-                
-            if self.debug_var.get():
-                print(f"清除书签信息:")
-                print(f"  输入PDF: {input_pdf_path}")
-                print(f"  输出PDF: {output_pdf}")
-                print(f"  使用qpdf: {qpdf_version}")
-            
-            # 运行qpdf命令清除书签
-            cmd = [
-                'qpdf',
-                '--empty',
-                '--pages', str(input_pdf_path), '1-z',
-                '--', str(output_pdf)
-            ]
-            
-            self.status_var.set("🔄 正在清除原始书签...")
-            self.root.update()
-            
-            # 显示执行的命令
-            cmd_str = ' '.join(cmd)
+        except PDFStructureError as e:
+            # 结构无法直接读取时交给qpdf处理
             if self.debug_var.get():
-                print(f"执行命令: {cmd_str}")
-                print(f"工作目录: {os.getcwd()}")
-            
-            # 执行命令并捕获详细输出
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+                print(f"PDF结构读取失败，继续使用qpdf: {e}")
+        
+        # 生成输出文件名
+        output_pdf = input_pdf_path.parent / f"{input_pdf_path.stem}_no_bookmarks.pdf"
+        
+        # 检查输出目录权限
+        if not os.access(input_pdf_path.parent, os.W_OK):
+            messagebox.showerror("错误", f"没有输出目录的写入权限:\n{input_pdf_path.parent}")
+            return
             
-            if result.returncode == 0:
+        if self.debug_var.get():
+            print(f"清除书签信息:")
+            print(f"  输入PDF: {input_pdf_path}")
+            print(f"  输出PDF: {output_pdf}")
+        
+        try:
+            def on_success(result):
                 messagebox.showinfo("成功", 
                     f"PDF原始书签已清除成功！\n\n"
                     f"输出文件: {output_pdf}\n"
-                    f"原文件: {input_pdf_path}")
+                    f"原文件: {input_pdf_path}\n"
+                    f"使用引擎: {result.backend.label} ({result.duration:.1f} 秒)")
                 self.status_var.set("🎉 原始书签清除完成！输出文件已保存")
                 
                 # 询问是否要更新输入路径为清理后的文件
@@ -1726,16 +1702,11 @@ Exercises 42
                     if self.is_placeholder:
                         self.is_placeholder = False
                         self.pdf_entry.config(foreground='black')
-            else:
-                # 显示详细的错误信息
-                error_msg = f"qpdf执行失败 (退出代码: {result.returncode})\n\n"
-                error_msg += f"执行的命令:\n{cmd_str}\n\n"
-                error_msg += f"标准输出:\n{result.stdout}\n\n"
-                error_msg += f"错误输出:\n{result.stderr}"
-                
-                messagebox.showerror("❌ 错误", error_msg)
-                self.status_var.set("❌ 原始书签清除失败，请查看错误详情")
-                
+                        
+            job = BookmarkJob(OP_CLEAR, input_pdf_path, output_pdf)
+            self.run_engine_job(job, "🔄 正在清除原始书签...", on_success,
+                                "❌ 原始书签清除失败，请查看错误详情")
+                    
         except Exception as e:
             messagebox.showerror("❌ 错误", f"清除过程中发生错误:\n{str(e)}")
             self.status_var.set("❌ 原始书签清除失败，请查看错误详情")
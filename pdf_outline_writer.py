@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF增量更新书签写入器
+不经过Ghostscript重新渲染页面，而是在原PDF字节之后追加一个增量更新段
+（新的/Outlines树、修改后的/Catalog以及新的xref段），
+耗时只与书签数量有关，与文档大小无关
+"""
+
+import shutil
+from array import array
+from pathlib import Path
+
+from bookmark_core import final_page
+from pdf_structure import DELIMITERS, PDFName, PDFRef, PDFStructure
+
+# ---------------------------------------------------------------------------
+# 序列化
+# ---------------------------------------------------------------------------
+
+def serialize(value):
+    """将解析得到的Python对象序列化为PDF语法"""
+    if isinstance(value, PDFName):
+        return b'/' + _encode_name(value)
+    if isinstance(value, PDFRef):
+        return b'%d %d R' % (value.num, value.gen)
+    if value is True:
+        return b'true'
+    if value is False:
+        return b'false'
+    if value is None:
+        return b'null'
+    if isinstance(value, int):
+        return b'%d' % value
+    if isinstance(value, float):
+        return (b'%.6f' % value).rstrip(b'0').rstrip(b'.') or b'0'
+    if isinstance(value, (bytes, bytearray)):
+        return _serialize_string(bytes(value))
+    if isinstance(value, str):
+        return _serialize_string(encode_text_string(value))
+    if isinstance(value, (list, tuple)):
+        return b'[' + b' '.join(serialize(v) for v in value) + b']'
+    if isinstance(value, dict):
+        parts = [b'<<']
+        for key, item in value.items():
+            parts.append(b'/' + _encode_name(key) + b' ' + serialize(item))
+        parts.append(b'>>')
+        return b'\n'.join(parts)
+    raise TypeError(f"无法序列化的对象类型: {type(value).__name__}")
+
+
+def _encode_name(name):
+    out = bytearray()
+    for c in name.encode('latin-1'):
+        if c < 0x21 or c > 0x7E or c in DELIMITERS or c == 0x23:
+            out += b'#%02X' % c
+        else:
+            out.append(c)
+    return bytes(out)
+
+
+def _serialize_string(data):
+    if all(0x20 <= c < 0x7F for c in data):
+        escaped = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+        return b'(' + escaped + b')'
+    return b'<' + data.hex().upper().encode('ascii') + b'>'
+
+
+def encode_text_string(text):
+    """将标题编码为PDF文本字符串：纯ASCII直接使用，否则使用带BOM的UTF-16BE"""
+    if all(0x20 <= ord(ch) < 0x7F for ch in text):
+        return text.encode('ascii')
+    return b'\xfe\xff' + text.encode('utf-16-be')
+
+
+# ---------------------------------------------------------------------------
+# 书签目标
+# ---------------------------------------------------------------------------
+
+def clean_title(title):
+    """去除标题中的换行和制表符"""
+    return title.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ').strip()
+
+
+def outline_targets(bookmarks, offset, page_count):
+    """将parse_toc的结果转换为(标题, 页面下标或None)
+
+    最终页码的计算方式与generate_pdfmarks一致（pdfmark的/Page从1开始计数），
+    超出文档范围的书签返回None，不设置跳转目标
+    """
+    for title, adjusted_page, _ in bookmarks:
+        page = final_page(adjusted_page, offset)
+        index = page - 1 if 1 <= page <= page_count else None
+        yield clean_title(title), index
+
+
+# ---------------------------------------------------------------------------
+# 增量写入
+# ---------------------------------------------------------------------------
+
+class _UpdateWriter:
+    """把增量更新段直接写入输出文件
+
+    对象偏移按连续对象号分段保存在数组中，
+    写入大量书签时内存占用只有每个对象约10字节
+    """
+
+    def __init__(self, doc, output_pdf):
+        self.doc = doc
+        self.sections = []   # (起始对象号, 偏移数组, 代号数组)
+        shutil.copyfile(doc.path, output_pdf)
+        self.file = open(output_pdf, 'ab')
+        if doc.data[-1:] not in (b'\n', b'\r'):
+            self.file.write(b'\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+
+    def _record(self, num, pos, gen):
+        if self.sections:
+            start, positions, gens = self.sections[-1]
+            if start + len(positions) == num:
+                positions.append(pos)
+                gens.append(gen)
+                return
+        self.sections.append((num, array('Q', [pos]), array('H', [gen])))
+
+    def write_object(self, num, gen, value):
+        f = self.file
+        self._record(num, f.tell(), gen)
+        f.write(b'%d %d obj\n' % (num, gen))
+        f.write(serialize(value))
+        f.write(b'\nendobj\n')
+
+    def subsections(self):
+        """按对象号排序并合并相邻的段"""
+        merged = []
+        for start, positions, gens in sorted(self.sections, key=lambda section: section[0]):
+            if merged and merged[-1][0] + len(merged[-1][1]) == start:
+                merged[-1][1].extend(positions)
+                merged[-1][2].extend(gens)
+            else:
+                merged.append((start, positions, gens))
+        return merged
+
+    def finish(self, size):
+        """写入xref段和trailer，size为更新后的对象总数"""
+        doc = self.doc
+        trailer = {k: v for k, v in doc.trailer.items()
+                   if k in ('Root', 'Info', 'ID')}
+        trailer[PDFName('Prev')] = doc.startxref
+
+        if doc.xref_is_stream:
+            self._write_xref_stream(trailer, size)
+        else:
+            self._write_xref_table(trailer, size)
+
+    def _write_xref_table(self, trailer, size):
+        f = self.file
+        xref_pos = f.tell()
+        f.write(b'xref\n0 1\n0000000000 65535 f\r\n')
+        for start, positions, gens in self.subsections():
+            f.write(b'%d %d\n' % (start, len(positions)))
+            for pos, gen in zip(positions, gens):
+                f.write(b'%010d %05d n\r\n' % (pos, gen))
+        trailer[PDFName('Size')] = size
+        f.write(b'trailer\n' + serialize(trailer) + b'\n')
+        f.write(b'startxref\n%d\n%%%%EOF\n' % xref_pos)
+
+    def _write_xref_stream(self, trailer, size):
+        f = self.file
+        xref_num = size
+        xref_pos = f.tell()
+        self._record(xref_num, xref_pos, 0)
+        width = max(4, (xref_pos.bit_length() + 7) // 8)
+
+        subsections = self.subsections()
+        index = []
+        rows = 0
+        for start, positions, _ in subsections:
+            index += [start, len(positions)]
+            rows += len(positions)
+
+        stream_dict = {PDFName('Type'): PDFName('XRef'), PDFName('Size'): size + 1,
+                       PDFName('Index'): index, PDFName('W'): [1, width, 2]}
+        stream_dict.update(trailer)
+        stream_dict[PDFName('Length')] = rows * (3 + width)
+        f.write(b'%d 0 obj\n' % xref_num)
+        f.write(serialize(stream_dict))
+        f.write(b'\nstream\n')
+        for _, positions, gens in subsections:
+            for pos, gen in zip(positions, gens):
+                f.write(b'\x01' + pos.to_bytes(width, 'big') + gen.to_bytes(2, 'big'))
+        f.write(b'\nendstream\nendobj\n')
+        f.write(b'startxref\n%d\n%%%%EOF\n' % xref_pos)
+
+
+class IncrementalOutlineWriter:
+    """在原PDF后追加增量更新以写入书签"""
+
+    def __init__(self, input_pdf):
+        self.input_pdf = Path(input_pdf)
+        self.doc = PDFStructure(self.input_pdf)
+
+    def write(self, output_pdf, bookmarks, offset, keep_existing=True):
+        """写入书签并返回书签数量
+
+        bookmarks为parse_toc返回的(title, adjusted_page, bookmark_offset)元组，
+        可以是任意可迭代对象；书签对象边生成边写入输出文件，
+        最终页码的计算方式与generate_pdfmarks一致。
+        没有书签时同样生成输出：保留原有书签时输出与输入相同，否则移除原有书签
+        """
+        doc = self.doc
+        page_refs = doc.page_index
+        targets = outline_targets(bookmarks, offset, len(page_refs))
+        current = next(targets, None)
+        if current is None:
+            if keep_existing:
+                shutil.copyfile(doc.path, output_pdf)
+            else:
+                self.clear(output_pdf)
+            return 0
+
+        catalog = dict(doc.catalog())
+        root_ref = doc.root_ref
+        size = doc.trailer['Size']
+
+        outlines_ref = catalog.get('Outlines') if keep_existing else None
+        outlines = doc.resolve(outlines_ref) if isinstance(outlines_ref, PDFRef) else None
+        if outlines:
+            # 追加到原有书签之后
+            outlines = dict(outlines)
+            parent = outlines_ref
+            old_last = outlines.get('Last')
+            if not isinstance(old_last, PDFRef):
+                old_last = None
+            first_num = size
+        else:
+            outlines = None
+            parent = PDFRef(size, 0)
+            old_last = None
+            first_num = size + 1
+
+        with _UpdateWriter(doc, output_pdf) as update:
+            num = first_num
+            prev = old_last
+            while current is not None:
+                following = next(targets, None)
+                title, page_index = current
+                item = {PDFName('Title'): encode_text_string(title)}
+                if page_index is not None:
+                    item[PDFName('Dest')] = [page_refs[page_index], PDFName('XYZ'), None, None, None]
+                item[PDFName('Parent')] = parent
+                if prev is not None:
+                    item[PDFName('Prev')] = prev
+                if following is not None:
+                    item[PDFName('Next')] = PDFRef(num + 1, 0)
+                update.write_object(num, 0, item)
+                prev = PDFRef(num, 0)
+                num += 1
+                current = following
+            count = num - first_num
+            first_ref, last_ref = PDFRef(first_num, 0), prev
+
+            if outlines is not None:
+                if old_last is not None:
+                    last_item = dict(doc.resolve(old_last))
+                    last_item[PDFName('Next')] = first_ref
+                    update.write_object(old_last.num, old_last.gen, last_item)
+                else:
+                    outlines[PDFName('First')] = first_ref
+                old_count = outlines.get('Count', 0)
+                outlines[PDFName('Count')] = max(old_count if isinstance(old_count, int) else 0, 0) + count
+                outlines[PDFName('Last')] = last_ref
+            else:
+                outlines = {
+                    PDFName('Type'): PDFName('Outlines'),
+                    PDFName('First'): first_ref,
+                    PDFName('Last'): last_ref,
+                    PDFName('Count'): count,
+                }
+            update.write_object(parent.num, parent.gen, outlines)
+
+            catalog[PDFName('Outlines')] = parent
+            update.write_object(root_ref.num, root_ref.gen, catalog)
+            update.finish(num)
+        return count
+
+    def clear(self, output_pdf):
+        """以增量更新方式移除Catalog中的/Outlines，返回被移除的顶层书签数量"""
+        doc = self.doc
+        removed = doc.outline_count()
+        catalog = dict(doc.catalog())
+        catalog.pop('Outlines', None)
+        if catalog.get('PageMode') == 'UseOutlines':
+            catalog[PDFName('PageMode')] = PDFName('UseNone')
+        root_ref = doc.root_ref
+        with _UpdateWriter(doc, output_pdf) as update:
+            update.write_object(root_ref.num, root_ref.gen, catalog)
+            update.finish(doc.trailer['Size'])
+        return removed
+
+
+def write_outline_incremental(input_pdf, output_pdf, bookmarks, offset, keep_existing=True):
+    """便捷函数：以增量更新方式为PDF写入书签，返回书签数量"""
+    writer = IncrementalOutlineWriter(input_pdf)
+    try:
+        return writer.write(output_pdf, bookmarks, offset, keep_existing=keep_existing)
+    finally:
+        writer.doc.close()
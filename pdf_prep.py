@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF预处理
+选择PDF后在后台完成与目录无关的准备工作：读取文件结构和页数、探测可用的引擎。
+文件结构无法直接读取（损坏或不规范）时，预先用Ghostscript生成规范化的副本，
+之后生成书签只需在副本上增量写入。路径改变或文件被修改时丢弃之前的结果
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from bookmark_engine import CAP_REWRITE, OP_ADD, BookmarkJob, JobCancelled
+from pdf_structure import PDFStructureError, read_pdf_summary
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PreparedPDF:
+    """一个PDF的预处理结果"""
+
+    def __init__(self, path, stat_key):
+        self.path = path
+        self.stat_key = stat_key
+        self.summary = None     # read_pdf_summary的结果，结构无法读取时为None
+        self.error = None       # 结构读取失败的原因
+        self.base_pdf = None    # 规范化副本（保留原有书签），不需要或无法生成时为None
+        self.done = False
+
+    @property
+    def page_count(self):
+        if self.summary:
+            return self.summary['page_count']
+        return None
+
+    def is_current(self):
+        """文件自预处理以来没有被修改"""
+        try:
+            return _stat_key(self.path) == self.stat_key
+        except OSError:
+            return False
+
+
+class PdfPreparer:
+    """在后台线程中预处理当前选择的PDF，同一时间只保留一个文件的结果"""
+
+    def __init__(self, engine, log=None):
+        self.engine = engine
+        self.log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._current = None
+        self._job = None
+        self._work_dir = None
+
+    def prepare(self, path):
+        """开始预处理path；与当前的文件相同且未修改时什么也不做"""
+        path = os.path.abspath(path)
+        try:
+            stat_key = _stat_key(path)
+        except OSError:
+            self.discard()
+            return
+        with self._lock:
+            current = self._current
+            if current and current.path == path and current.stat_key == stat_key:
+                return
+        self.discard()
+        prepared = PreparedPDF(path, stat_key)
+        with self._lock:
+            self._current = prepared
+        threading.Thread(target=self._run, args=(prepared,), name='pdf-prep', daemon=True).start()
+
+    def get(self, path):
+        """返回path已完成且仍然有效的预处理结果，否则返回None"""
+        with self._lock:
+            prepared = self._current
+        if (prepared is None or not prepared.done
+                or prepared.path != os.path.abspath(path) or not prepared.is_current()):
+            return None
+        return prepared
+
+    def discard(self):
+        """放弃当前的预处理：结束正在运行的规范化并删除副本"""
+        with self._lock:
+            self._current = None
+            job, self._job = self._job, None
+            work_dir, self._work_dir = self._work_dir, None
+        if job is not None:
+            job.cancel()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    close = discard
+
+    def _is_active(self, prepared):
+        with self._lock:
+            return self._current is prepared
+
+    def _run(self, prepared):
+        try:
+            prepared.summary = read_pdf_summary(prepared.path)
+        except (OSError, PDFStructureError) as e:
+            prepared.error = str(e)
+
+        # 提前完成工具探测，点击生成时不再等待
+        self.engine.probe_all()
+
+        if prepared.summary is None and self._is_active(prepared):
+            self._normalize(prepared)
+        if self._is_active(prepared):
+            prepared.done = True
+            self.log(f"预处理完成: {prepared.path} (页数: {prepared.page_count or '未知'}"
+                     f"{'，已生成规范化副本' if prepared.base_pdf else ''})")
+
+    def _normalize(self, prepared):
+        """结构无法直接读取时用pdfwrite重新生成一份，原有书签保留在副本中"""
+        work_dir = tempfile.mkdtemp(prefix='pdf-bookmarker-prep-')
+        base_pdf = os.path.join(work_dir, 'base.pdf')
+        job = BookmarkJob(OP_ADD, prepared.path, base_pdf, [], keep_existing=True)
+        with self._lock:
+            if self._current is not prepared:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return
+            self._job, self._work_dir = job, work_dir
+        try:
+            self.engine.run(job, required=(CAP_REWRITE,), log=self.log)
+            summary = read_pdf_summary(base_pdf)
+        except JobCancelled:
+            return
+        except Exception as e:
+            self.log(f"无法生成规范化副本: {e}")
+            return
+        with self._lock:
+            if self._current is prepared:
+                prepared.summary = summary
+                prepared.base_pdf = base_pdf
+                self._job = None
@@ -0,0 +1,678 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF结构读取器
+使用mmap按需访问文件，解析xref表/xref流与trailer，并建立紧凑的
+页码 -> 页面对象引用索引，不加载页面内容流。
+即使是数GB的输入，也能在毫秒级回答页数、页面引用、是否已有书签等结构问题
+"""
+
+import functools
+import mmap
+import os
+import re
+import threading
+import zlib
+from array import array
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+class PDFStructureError(Exception):
+    """PDF结构无法解析（损坏、加密或使用了不支持的特性）"""
+
+
+class PDFName(str):
+    """PDF名称对象（不含前导斜杠）"""
+
+
+PDFRef = namedtuple('PDFRef', 'num gen')
+
+WHITESPACE = b'\x00\t\n\x0c\r '
+DELIMITERS = b'()<>[]{}/%'
+
+_NUMBER_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_REF_TAIL_RE = re.compile(rb'\s+(\d+)\s+R(?=[\s/<>\[\]()%]|$)')
+_NAME_RE = re.compile(rb'/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)')
+_KEYWORD_RE = re.compile(rb'[A-Za-z]+')
+_OBJ_HEADER_RE = re.compile(rb'(\d+)\s+(\d+)\s+obj')
+_STREAM_RE = re.compile(rb'\s*stream\r?\n')
+_XREF_ENTRY_RE = re.compile(rb'(\d{10})\s(\d{5})\s([nf])')
+_XREF_SUBSECTION_RE = re.compile(rb'\s*(\d+)\s+(\d+)\s*[\r\n]')
+
+_STRING_ESCAPES = {
+    ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b',
+    ord('f'): b'\f', ord('('): b'(', ord(')'): b')', ord('\\'): b'\\',
+}
+
+
+# ---------------------------------------------------------------------------
+# 词法/语法解析
+# ---------------------------------------------------------------------------
+
+def skip_whitespace(buf, pos):
+    """跳过空白字符和注释"""
+    length = len(buf)
+    while pos < length:
+        c = buf[pos]
+        if c in WHITESPACE:
+            pos += 1
+        elif c == 0x25:  # '%' 注释直到行尾
+            while pos < length and buf[pos] not in b'\r\n':
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def parse_object(buf, pos):
+    """从pos处解析一个PDF对象，返回(对象, 结束位置)"""
+    pos = skip_whitespace(buf, pos)
+    if pos >= len(buf):
+        raise PDFStructureError("解析对象时遇到文件结尾")
+    c = buf[pos]
+
+    if c == 0x3C:  # '<'
+        if buf[pos + 1:pos + 2] == b'<':
+            return _parse_dict(buf, pos + 2)
+        return _parse_hex_string(buf, pos + 1)
+    if c == 0x5B:  # '['
+        return _parse_array(buf, pos + 1)
+    if c == 0x28:  # '('
+        return _parse_literal_string(buf, pos + 1)
+    if c == 0x2F:  # '/'
+        match = _NAME_RE.match(buf, pos)
+        return PDFName(_decode_name(match.group(1))), match.end()
+
+    match = _NUMBER_RE.match(buf, pos)
+    if match:
+        token = match.group(0)
+        if b'.' in token:
+            return float(token), match.end()
+        value = int(token)
+        # 可能是间接引用 "num gen R"
+        ref = _REF_TAIL_RE.match(buf, match.end())
+        if ref and token.isdigit():
+            return PDFRef(value, int(ref.group(1))), ref.end()
+        return value, match.end()
+
+    match = _KEYWORD_RE.match(buf, pos)
+    if match:
+        word = match.group(0)
+        if word == b'true':
+            return True, match.end()
+        if word == b'false':
+            return False, match.end()
+        if word == b'null':
+            return None, match.end()
+    raise PDFStructureError(f"无法识别的PDF对象 (偏移 {pos})")
+
+
+def _decode_name(raw):
+    """解码名称中的#xx转义"""
+    if b'#' in raw:
+        raw = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), raw)
+    return raw.decode('latin-1')
+
+
+def _parse_dict(buf, pos):
+    result = {}
+    while True:
+        pos = skip_whitespace(buf, pos)
+        if buf[pos:pos + 2] == b'>>':
+            return result, pos + 2
+        key, pos = parse_object(buf, pos)
+        if not isinstance(key, PDFName):
+            raise PDFStructureError(f"字典键不是名称 (偏移 {pos})")
+        value, pos = parse_object(buf, pos)
+        result[key] = value
+
+
+def _parse_array(buf, pos):
+    result = []
+    while True:
+        pos = skip_whitespace(buf, pos)
+        if buf[pos:pos + 1] == b']':
+            return result, pos + 1
+        value, pos = parse_object(buf, pos)
+        result.append(value)
+
+
+def _parse_hex_string(buf, pos):
+    end = buf.find(b'>', pos)
+    if end < 0:
+        raise PDFStructureError("十六进制字符串未结束")
+    digits = bytes(c for c in buf[pos:end] if c not in WHITESPACE)
+    if len(digits) % 2:
+        digits += b'0'
+    return bytes.fromhex(digits.decode('ascii')), end + 1
+
+
+def _parse_literal_string(buf, pos):
+    out = bytearray()
+    depth = 1
+    length = len(buf)
+    while pos < length:
+        c = buf[pos]
+        if c == 0x5C:  # '\\'
+            pos += 1
+            c = buf[pos]
+            if c in _STRING_ESCAPES:
+                out += _STRING_ESCAPES[c]
+                pos += 1
+            elif 0x30 <= c <= 0x37:
+                digits = buf[pos:pos + 3]
+                n = 1
+                while n < len(digits) and 0x30 <= digits[n] <= 0x37:
+                    n += 1
+                out.append(int(digits[:n], 8) & 0xFF)
+                pos += n
+            elif c == 0x0D:  # 反斜杠续行
+                pos += 2 if buf[pos + 1:pos + 2] == b'\n' else 1
+            elif c == 0x0A:
+                pos += 1
+            else:
+                out.append(c)
+                pos += 1
+            continue
+        if c == 0x28:
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(out), pos + 1
+        out.append(c)
+        pos += 1
+    raise PDFStructureError("字符串未结束")
+
+
+# ---------------------------------------------------------------------------
+# 流解码
+# ---------------------------------------------------------------------------
+
+def decode_stream(stream_dict, data):
+    """解码流数据，仅支持FlateDecode及PNG/TIFF预测器"""
+    filters = stream_dict.get('Filter')
+    params = stream_dict.get('DecodeParms')
+    if filters is None:
+        return data
+    if not isinstance(filters, list):
+        filters = [filters]
+        params = [params]
+    elif not isinstance(params, list):
+        params = [params] * len(filters)
+    for name, parm in zip(filters, params):
+        if name not in ('FlateDecode', 'Fl'):
+            raise PDFStructureError(f"不支持的流过滤器: /{name}")
+        data = zlib.decompress(data)
+        if parm and parm.get('Predictor', 1) > 1:
+            data = _apply_predictor(data, parm)
+    return data
+
+
+def _apply_predictor(data, parms):
+    predictor = parms.get('Predictor', 1)
+    columns = parms.get('Columns', 1)
+    colors = parms.get('Colors', 1)
+    bpc = parms.get('BitsPerComponent', 8)
+    bpp = max(1, colors * bpc // 8)
+    row_len = (columns * colors * bpc + 7) // 8
+
+    if predictor == 2:
+        if bpc != 8:
+            raise PDFStructureError("不支持的TIFF预测器参数")
+        out = bytearray(data)
+        for start in range(0, len(out), row_len):
+            for i in range(start + bpp, start + row_len):
+                out[i] = (out[i] + out[i - bpp]) & 0xFF
+        return bytes(out)
+
+    out = bytearray()
+    prev = bytearray(row_len)
+    stride = row_len + 1
+    for start in range(0, len(data) - row_len, stride):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + stride])
+        if kind == 1:
+            for i in range(bpp, row_len):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif kind == 2:
+            for i in range(row_len):
+                row[i] = (row[i] + prev[i]) & 0xFF
+        elif kind == 3:
+            for i in range(row_len):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(row_len):
+                a = row[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                row[i] = (row[i] + pred) & 0xFF
+        out += row
+        prev = row
+    return bytes(out)
+
+
+
+# ---------------------------------------------------------------------------
+# xref段
+# ---------------------------------------------------------------------------
+
+class _XRefTableSection:
+    """经典xref表的一个子段，条目为定长记录，按需读取"""
+
+    __slots__ = ('data', 'start', 'count', 'pos', 'width', 'hybrid')
+
+    def __init__(self, data, start, count, pos, width):
+        self.data = data
+        self.start = start
+        self.count = count
+        self.pos = pos
+        self.width = width
+        # 混合格式文件中同一修订的XRefStm子段，表中标记为空闲的对象在其中查找
+        self.hybrid = ()
+
+    def lookup(self, num):
+        pos = self.pos + (num - self.start) * self.width
+        entry = _XREF_ENTRY_RE.match(self.data, pos)
+        if not entry:
+            raise PDFStructureError(f"xref条目格式错误 (偏移 {pos})")
+        if entry.group(3) == b'n':
+            return 1, int(entry.group(1)), int(entry.group(2))
+        return 0, 0, 0
+
+
+class _XRefStreamSection:
+    """xref流中/Index描述的一个子段，行数据已解码"""
+
+    __slots__ = ('rows', 'start', 'count', 'row_offset', 'widths')
+
+    def __init__(self, rows, start, count, row_offset, widths):
+        self.rows = rows
+        self.start = start
+        self.count = count
+        self.row_offset = row_offset
+        self.widths = widths
+
+    def lookup(self, num):
+        pos = (self.row_offset + num - self.start) * sum(self.widths)
+        fields = []
+        for w in self.widths:
+            fields.append(int.from_bytes(self.rows[pos:pos + w], 'big') if w else None)
+            pos += w
+        kind = 1 if fields[0] is None else fields[0]
+        return kind, fields[1] or 0, fields[2] or 0
+
+
+class PageIndex:
+    """页码 -> 页面对象引用的紧凑索引，以两个array保存对象号与代号"""
+
+    __slots__ = ('_nums', '_gens')
+
+    def __init__(self):
+        self._nums = array('L')
+        self._gens = array('H')
+
+    def append(self, ref):
+        self._nums.append(ref.num)
+        self._gens.append(ref.gen)
+
+    def __len__(self):
+        return len(self._nums)
+
+    def __getitem__(self, index):
+        return PDFRef(self._nums[index], self._gens[index])
+
+    def __iter__(self):
+        return map(PDFRef, self._nums, self._gens)
+
+
+# ---------------------------------------------------------------------------
+# 结构读取
+# ---------------------------------------------------------------------------
+
+def _structure_errors(method):
+    """把畸形输入在解析中引起的底层异常统一转换为PDFStructureError"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except PDFStructureError:
+            raise
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError, OverflowError,
+                RecursionError, zlib.error) as e:
+            raise PDFStructureError(f"PDF结构无效: {type(e).__name__}: {e}") from e
+    return wrapper
+
+
+class PDFStructure:
+    """按需读取PDF结构：xref、trailer、对象与页面树"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            # 空文件不能mmap
+            if os.fstat(f.fileno()).st_size == 0:
+                raise PDFStructureError(f"文件为空: {self.path}")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.trailer = {}
+        self.startxref = 0
+        self.xref_is_stream = False
+        self._sections = []     # 按从新到旧的顺序排列
+        self._objstm_cache = {}
+        self._page_index = None
+        try:
+            self._load_xref()
+        except PDFStructureError:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise PDFStructureError(f"无法解析PDF结构: {e}") from e
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- xref --------------------------------------------------------------
+
+    def _load_xref(self):
+        tail = self.data[-2048:]
+        idx = tail.rfind(b'startxref')
+        if idx < 0:
+            raise PDFStructureError("找不到startxref")
+        match = re.match(rb'startxref\s+(\d+)', tail[idx:])
+        if not match:
+            raise PDFStructureError("startxref格式错误")
+        self.startxref = int(match.group(1))
+
+        offset = self.startxref
+        visited = set()
+        first = True
+        while offset is not None and offset not in visited:
+            visited.add(offset)
+            table_start = len(self._sections)
+            trailer, is_stream = self._read_xref_section(offset)
+            if first:
+                self.trailer = trailer
+                self.xref_is_stream = is_stream
+                first = False
+            # 混合格式文件: 存放在对象流中的对象在表中标记为空闲，只在XRefStm中列出，
+            # XRefStm优先于Prev
+            if not is_stream and 'XRefStm' in trailer:
+                stream_start = len(self._sections)
+                self._read_xref_section(trailer['XRefStm'])
+                stream_sections = tuple(self._sections[stream_start:])
+                for section in self._sections[table_start:stream_start]:
+                    section.hybrid = stream_sections
+            prev = trailer.get('Prev')
+            offset = prev if isinstance(prev, int) else None
+
+        if 'Root' not in self.trailer:
+            raise PDFStructureError("trailer中缺少/Root")
+        if 'Encrypt' in self.trailer:
+            raise PDFStructureError("不支持加密的PDF文件")
+
+    def _read_xref_section(self, offset):
+        pos = skip_whitespace(self.data, offset)
+        if self.data[pos:pos + 4] == b'xref':
+            return self._read_xref_table(pos + 4), False
+        return self._read_xref_stream(pos), True
+
+    def _read_xref_table(self, pos):
+        """只记录各子段的位置，条目在查找时才解析"""
+        data = self.data
+        while True:
+            pos = skip_whitespace(data, pos)
+            if data[pos:pos + 7] == b'trailer':
+                trailer, _ = parse_object(data, pos + 7)
+                return trailer
+            match = _XREF_SUBSECTION_RE.match(data, pos)
+            if not match:
+                raise PDFStructureError(f"xref表格式错误 (偏移 {pos})")
+            start, count = int(match.group(1)), int(match.group(2))
+            pos = skip_whitespace(data, match.end())
+            if count == 0:
+                continue
+            # 标准条目为20字节，部分生成器只写单个换行符(19字节)
+            width = 20 if data[pos + 19:pos + 20] in (b' ', b'\r', b'\n') else 19
+            section = _XRefTableSection(data, start, count, pos, width)
+            section.lookup(start + count - 1)  # 校验最后一个条目的位置
+            self._sections.append(section)
+            pos += count * width
+
+    def _read_xref_stream(self, pos):
+        _, _, stream_dict, stream_data = self._parse_indirect_at(pos)
+        if stream_dict.get('Type') != 'XRef':
+            raise PDFStructureError(f"偏移 {pos} 处不是xref流")
+        rows = decode_stream(stream_dict, stream_data)
+        widths = tuple(stream_dict['W'])
+        index = stream_dict.get('Index', [0, stream_dict['Size']])
+        row = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            self._sections.append(_XRefStreamSection(rows, start, count, row, widths))
+            row += count
+        return stream_dict
+
+    def xref_entry(self, num):
+        """返回对象的xref条目(类型, 字段2, 字段3)，不存在时返回None"""
+        for section in self._sections:
+            if section.start <= num < section.start + section.count:
+                entry = section.lookup(num)
+                if entry[0] == 0:
+                    for extra in getattr(section, 'hybrid', ()):
+                        if extra.start <= num < extra.start + extra.count:
+                            return extra.lookup(num)
+                return entry
+        return None
+
+    # -- 对象 ----------------------------------------------------------------
+
+    def _parse_indirect_at(self, pos):
+        """解析pos处的间接对象，返回(对象号, 代号, 值, 流数据或None)"""
+        pos = skip_whitespace(self.data, pos)
+        header = _OBJ_HEADER_RE.match(self.data, pos)
+        if not header:
+            raise PDFStructureError(f"偏移 {pos} 处不是间接对象")
+        value, end = parse_object(self.data, header.end())
+        stream_data = None
+        stream = _STREAM_RE.match(self.data, end)
+        if stream and isinstance(value, dict):
+            length = value.get('Length')
+            if isinstance(length, PDFRef):
+                length = self.resolve(length)
+            start = stream.end()
+            stream_data = self.data[start:start + length]
+        return int(header.group(1)), int(header.group(2)), value, stream_data
+
+    @_structure_errors
+    def get_object(self, num):
+        """按对象号读取对象值"""
+        entry = self.xref_entry(num)
+        if entry is None or entry[0] == 0:
+            return None
+        kind, f2, f3 = entry
+        if kind == 1:
+            found, _, value, _ = self._parse_indirect_at(f2)
+            if found != num:
+                raise PDFStructureError(f"xref偏移错误: 对象{num}")
+            return value
+        return self._get_compressed_object(f2, f3)
+
+    @_structure_errors
+    def get_stream(self, num):
+        """读取流对象，返回(字典, 解码后的数据)"""
+        entry = self.xref_entry(num)
+        if entry is None or entry[0] != 1:
+            raise PDFStructureError(f"对象{num}不是流对象")
+        _, _, value, data = self._parse_indirect_at(entry[1])
+        return value, decode_stream(value, data)
+
+    def _get_compressed_object(self, stream_num, index):
+        if stream_num not in self._objstm_cache:
+            stream_dict, data = self.get_stream(stream_num)
+            count = stream_dict['N']
+            first = stream_dict['First']
+            header = data[:first].split()
+            offsets = [int(header[i * 2 + 1]) for i in range(count)]
+            self._objstm_cache[stream_num] = (data, first, offsets)
+        data, first, offsets = self._objstm_cache[stream_num]
+        value, _ = parse_object(data, first + offsets[index])
+        return value
+
+    def resolve(self, value):
+        """解析间接引用"""
+        while isinstance(value, PDFRef):
+            value = self.get_object(value.num)
+        return value
+
+    def generation(self, num):
+        entry = self.xref_entry(num)
+        return entry[2] if entry and entry[0] == 1 else 0
+
+    # -- 文档级信息 ----------------------------------------------------------
+
+    @property
+    def version(self):
+        match = re.search(rb'%PDF-(\d+\.\d+)', self.data[:1024])
+        return match.group(1).decode('ascii') if match else None
+
+    @property
+    def root_ref(self):
+        return self.trailer['Root']
+
+    @_structure_errors
+    def catalog(self):
+        return self.resolve(self.root_ref)
+
+    @property
+    @_structure_errors
+    def page_count(self):
+        """页数：直接读取页面树根节点的/Count，不遍历页面"""
+        if self._page_index is not None:
+            return len(self._page_index)
+        pages = self.resolve(self.catalog().get('Pages'))
+        count = pages.get('Count') if isinstance(pages, dict) else None
+        if isinstance(count, int) and count >= 0:
+            return count
+        return len(self.page_index)
+
+    @property
+    @_structure_errors
+    def page_index(self):
+        """页码 -> 页面对象引用索引（首次访问时遍历页面树，不读取内容流）"""
+        if self._page_index is None:
+            self._page_index = self._build_page_index()
+        return self._page_index
+
+    def page_refs(self):
+        """按顺序返回所有页面对象的引用"""
+        return list(self.page_index)
+
+    def _build_page_index(self):
+        pages_ref = self.catalog().get('Pages')
+        if not isinstance(pages_ref, PDFRef):
+            raise PDFStructureError("Catalog中缺少/Pages")
+        index = PageIndex()
+        stack = [pages_ref]
+        seen = set()
+        while stack:
+            ref = stack.pop()
+            if ref.num in seen:
+                raise PDFStructureError("页面树存在循环引用")
+            seen.add(ref.num)
+            node = self.resolve(ref)
+            if not isinstance(node, dict):
+                raise PDFStructureError(f"页面树节点{ref.num}无效")
+            kids = node.get('Kids')
+            if node.get('Type') == 'Pages' or (node.get('Type') is None and kids is not None):
+                kids = self.resolve(kids) or []
+                stack.extend(reversed(kids))
+            else:
+                index.append(ref)
+        return index
+
+    @_structure_errors
+    def outline_count(self):
+        """返回现有书签顶层条目的数量，没有书签时返回0"""
+        outlines = self.resolve(self.catalog().get('Outlines'))
+        if not isinstance(outlines, dict) or 'First' not in outlines:
+            return 0
+        count = 0
+        item_ref = outlines.get('First')
+        seen = set()
+        while isinstance(item_ref, PDFRef) and item_ref.num not in seen:
+            seen.add(item_ref.num)
+            count += 1
+            item = self.resolve(item_ref)
+            item_ref = item.get('Next') if isinstance(item, dict) else None
+        return count
+
+    def has_outlines(self):
+        return self.outline_count() > 0
+
+    @_structure_errors
+    def summary(self):
+        """返回常用结构信息"""
+        return {
+            'version': self.version,
+            'file_size': len(self.data),
+            'page_count': self.page_count,
+            'outline_count': self.outline_count(),
+            'xref_is_stream': self.xref_is_stream,
+            'object_count': self.trailer.get('Size'),
+        }
+
+
+def read_pdf_summary(path):
+    """便捷函数：读取PDF的结构信息，无法解析时抛出PDFStructureError"""
+    with PDFStructure(path) as pdf:
+        return pdf.summary()
+
+
+# read_page_count缓存的文件数量
+PAGE_COUNT_CACHE_SIZE = 64
+
+_page_counts = OrderedDict()
+_page_counts_lock = threading.Lock()
+
+
+def read_page_count(path):
+    """PDF页数：只读取trailer和页面树根节点，结构无法解析或文件无法读取时返回None
+
+    结果按(路径, 大小, mtime)缓存，同一个文件反复验证和生成时不再重复读取
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _page_counts_lock:
+        if key in _page_counts:
+            _page_counts.move_to_end(key)
+            return _page_counts[key]
+    try:
+        with PDFStructure(path) as pdf:
+            count = pdf.page_count
+    except PDFStructureError:
+        count = None
+    except OSError:
+        return None
+    with _page_counts_lock:
+        _page_counts[key] = count
+        while len(_page_counts) > PAGE_COUNT_CACHE_SIZE:
+            _page_counts.popitem(last=False)
+    return count
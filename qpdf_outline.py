@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于qpdf JSON更新模式的书签写入后端
+通过 qpdf --json 读取对象结构，构造新的/Outlines对象后用
+qpdf --update-from-json 写回。只改写对象结构，图像等内容流保持原样，
+避免Ghostscript pdfwrite的整体重新编码
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from async_runner import default_runner
+from pdf_outline_writer import outline_targets
+
+
+class QpdfBackendError(Exception):
+    """qpdf执行失败"""
+
+    def __init__(self, message, cmd=None, stdout='', stderr=''):
+        super().__init__(message)
+        self.cmd = cmd
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+def _ref(num, gen=0):
+    return f"{num} {gen} R"
+
+
+def _parse_ref(value):
+    """把qpdf JSON中的"n g R"解析为(对象号, 代号)"""
+    if not isinstance(value, str) or not value.endswith(' R'):
+        return None
+    parts = value.split()
+    return int(parts[0]), int(parts[1])
+
+
+class QpdfOutlineBackend:
+    """使用qpdf JSON更新模式写入书签"""
+
+    def __init__(self, qpdf_cmd='qpdf', timeout=120, runner=None):
+        """runner(cmd, timeout)用于替换默认的命令执行方式，返回CompletedProcess"""
+        self.qpdf_cmd = qpdf_cmd
+        self.timeout = timeout
+        self.runner = runner or self._default_runner
+
+    @staticmethod
+    def _default_runner(cmd, timeout):
+        return default_runner().run_sync(cmd, timeout)
+
+    def _run(self, args):
+        cmd = [self.qpdf_cmd] + [str(a) for a in args]
+        result = self.runner(cmd, self.timeout)
+        # qpdf退出码3表示成功但有警告
+        if result.returncode not in (0, 3):
+            raise QpdfBackendError(f"qpdf执行失败 (退出代码: {result.returncode})",
+                                   cmd, result.stdout, result.stderr)
+        return result.stdout
+
+    def _query(self, input_pdf, *json_args):
+        output = self._run(['--json=2', *json_args, input_pdf])
+        try:
+            return json.loads(output)
+        except ValueError as e:
+            raise QpdfBackendError(f"无法解析qpdf的JSON输出: {e}") from e
+
+    def _get_objects(self, input_pdf, refs):
+        args = ['--json-key=qpdf']
+        args += [f'--json-object={r}' for r in refs]
+        data = self._query(input_pdf, *args)
+        return data['qpdf'][1]
+
+    def build_update(self, input_pdf, bookmarks, offset, keep_existing=True):
+        """构造qpdf JSON更新文档，返回(更新文档, 书签数量)
+
+        不需要修改时（没有书签且保留原有书签，或原文件没有书签）更新文档为None
+        """
+        info = self._query(input_pdf, '--json-key=pages', '--json-key=qpdf',
+                           '--json-object=trailer')
+        header, objects = info['qpdf']
+        page_refs = [page['object'] for page in info['pages']]
+        root_ref = objects['trailer']['value']['/Root']
+        max_id = header['maxobjectid']
+
+        catalog = dict(self._get_objects(input_pdf, [root_ref])[f'obj:{root_ref}']['value'])
+        update = {}
+
+        def allocate():
+            nonlocal max_id
+            max_id += 1
+            return max_id
+
+        items = []
+        for title, page_index in outline_targets(bookmarks, offset, len(page_refs)):
+            item = {'/Title': 'u:' + title}
+            if page_index is not None:
+                item['/Dest'] = [page_refs[page_index], '/XYZ', None, None, None]
+            items.append((_ref(allocate()), item))
+        if not items:
+            if keep_existing or '/Outlines' not in catalog:
+                return None, 0
+            # 只从Catalog中去掉原有书签，qpdf写出时丢弃不可达的书签对象
+            del catalog['/Outlines']
+            update[f'obj:{root_ref}'] = {'value': catalog}
+            return self._document(max_id, update), 0
+
+        outlines_ref = catalog.get('/Outlines') if keep_existing else None
+        outlines = None
+        if _parse_ref(outlines_ref):
+            outlines = self._get_objects(input_pdf, [outlines_ref])[f'obj:{outlines_ref}']['value']
+        if isinstance(outlines, dict):
+            outlines = dict(outlines)
+            old_last = outlines.get('/Last')
+            if _parse_ref(old_last):
+                last_item = dict(self._get_objects(input_pdf, [old_last])[f'obj:{old_last}']['value'])
+                last_item['/Next'] = items[0][0]
+                update[f'obj:{old_last}'] = {'value': last_item}
+                items[0][1]['/Prev'] = old_last
+            else:
+                outlines['/First'] = items[0][0]
+            old_count = outlines.get('/Count', 0)
+            outlines['/Count'] = max(old_count if isinstance(old_count, int) else 0, 0) + len(items)
+            outlines['/Last'] = items[-1][0]
+        else:
+            outlines_ref = _ref(allocate())
+            outlines = {
+                '/Type': '/Outlines',
+                '/First': items[0][0],
+                '/Last': items[-1][0],
+                '/Count': len(items),
+            }
+        update[f'obj:{outlines_ref}'] = {'value': outlines}
+
+        for i, (ref, item) in enumerate(items):
+            item['/Parent'] = outlines_ref
+            if i > 0:
+                item['/Prev'] = items[i - 1][0]
+            if i + 1 < len(items):
+                item['/Next'] = items[i + 1][0]
+            update[f'obj:{ref}'] = {'value': item}
+
+        catalog['/Outlines'] = outlines_ref
+        update[f'obj:{root_ref}'] = {'value': catalog}
+        return self._document(max_id, update), len(items)
+
+    @staticmethod
+    def _document(max_id, update):
+        return {
+            'qpdf': [
+                {
+                    'jsonversion': 2,
+                    'pushedinheritedpageresources': False,
+                    'calledgetallpages': False,
+                    'maxobjectid': max_id,
+                },
+                update,
+            ]
+        }
+
+    def write(self, input_pdf, output_pdf, bookmarks, offset, keep_existing=True):
+        """写入书签并返回书签数量；没有书签时同样生成输出文件"""
+        document, count = self.build_update(input_pdf, bookmarks, offset, keep_existing)
+        if document is None:
+            shutil.copyfile(input_pdf, output_pdf)
+            return 0
+
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json',
+                                         delete=False, encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False)
+            update_file = f.name
+        try:
+            # --stream-data=preserve 保证所有流数据原样复制
+            self._run([input_pdf, f'--update-from-json={update_file}',
+                       '--stream-data=preserve', output_pdf])
+        finally:
+            try:
+                os.unlink(update_file)
+            except OSError:
+                pass
+        return count
+
+
+def write_outline_qpdf(input_pdf, output_pdf, bookmarks, offset, keep_existing=True, qpdf_cmd='qpdf'):
+    """便捷函数：使用qpdf写入书签，返回书签数量"""
+    return QpdfOutlineBackend(qpdf_cmd).write(Path(input_pdf), Path(output_pdf),
+                                              bookmarks, offset, keep_existing)
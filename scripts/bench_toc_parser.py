@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录解析器回归基准
+对比线性扫描解析器与旧的回溯正则：先校验两者在样本上的结果一致，
+再测量超长点线行和大型目录的解析耗时，超出时间上限时以非零状态退出
+
+用法: python scripts/bench_toc_parser.py [--with-regex]
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from toc_parser import parse_toc, split_toc_line  # noqa: E402
+
+OLD_PATTERN = re.compile(r'(.*?)\s*[\.\s]*(-?\d+)\s*$')
+
+# 各场景允许的最长耗时（秒），远高于线性实现的实际耗时，只用于发现回归
+LIMITS = {
+    '10k点线 + 页码': 0.05,
+    '10k点线 无页码': 0.05,
+    '10k空白点线交替 无页码': 0.05,
+    '100k行目录': 3.0,
+}
+
+SAMPLES = [
+    'Chapter 1 Introduction 1',
+    '1.2 Background .................. 15',
+    'Appendix A. . . . . . . . 201',
+    'Index -3',
+    'Section 2-5',
+    '第一章 绪论 ·········· 12',
+    'PREFACE V',
+    '   ',
+    '123',
+    '-7',
+    'Title .5',
+    'Notes\t\t18',
+    '全角页码 １２',
+]
+
+
+def old_split(line):
+    match = OLD_PATTERN.search(line)
+    if match:
+        return match.group(1).strip(), int(match.group(2))
+    return None
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def check_equivalence():
+    for line in SAMPLES:
+        line = line.strip()
+        expected, actual = old_split(line), split_toc_line(line)
+        if expected != actual:
+            print(f"❌ 结果不一致: {line!r}: 正则 {expected}, 扫描 {actual}")
+            return False
+    print(f"✓ {len(SAMPLES)} 个样本与旧正则结果一致")
+    return True
+
+
+def main():
+    with_regex = '--with-regex' in sys.argv
+    if not check_equivalence():
+        return 1
+
+    leader = '.' * 10000
+    cases = {
+        '10k点线 + 页码': ['Chapter 1' + leader + '42'],
+        '10k点线 无页码': ['Chapter 1' + leader + 'x'],
+        '10k空白点线交替 无页码': ['Chapter 1' + ' .' * 5000 + 'end'],
+        '100k行目录': ['\n'.join(f"Section {i} {'.' * 40} {i % 500 + 1}" for i in range(100000))],
+    }
+
+    failed = False
+    for name, (payload,) in cases.items():
+        if name == '100k行目录':
+            elapsed = timed(parse_toc, payload)
+        else:
+            elapsed = timed(split_toc_line, payload)
+        status = '✓' if elapsed <= LIMITS[name] else '❌'
+        failed = failed or elapsed > LIMITS[name]
+        line = f"{status} {name}: {elapsed * 1000:.1f} ms (上限 {LIMITS[name] * 1000:.0f} ms)"
+
+        # 旧正则在无页码的长行上是二次复杂度，单行场景只取前500个字符对比
+        if with_regex:
+            if name == '100k行目录':
+                lines = payload.split('\n')
+                label = '旧正则'
+            else:
+                lines = [payload[:500] + payload[-3:]]
+                label = '旧正则(500字符)'
+            old_elapsed = timed(lambda: [old_split(l.strip()) for l in lines])
+            line += f"，{label}: {old_elapsed * 1000:.1f} ms"
+        print(line)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,7 @@
 PDF书签生成器安装配置
 """
 
-from setuptools import setup, find_packages
+from setuptools import setup
 import os
 
 # 读取README文件
@@ -26,14 +26,33 @@ setup(
     long_description=read_readme(),
     long_description_content_type="text/markdown",
     url="",
-    packages=find_packages(),
+    # 平铺的模块，不是包；build_app、demo等开发脚本不安装
+    py_modules=[
+        "async_runner",
+        "batch_runner",
+        "bookmark_core",
+        "bookmark_engine",
+        "bookmark_validator",
+        "bookmarker_cli",
+        "bookmarker_server",
+        "build_cache",
+        "gs_api",
+        "job_runner",
+        "pdf_bookmarker_gs",
+        "pdf_outline_writer",
+        "pdf_prep",
+        "pdf_structure",
+        "qpdf_outline",
+        "toc_parser",
+        "tool_discovery",
+        "validation_rules",
+    ],
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: End Users/Desktop",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
@@ -43,7 +62,7 @@ setup(
         "Topic :: Software Development :: Libraries :: Python Modules",
         "Topic :: Text Processing :: Markup",
     ],
-    python_requires=">=3.7",
+    python_requires=">=3.8",
     install_requires=read_requirements(),
     extras_require={
         "dev": [
@@ -54,7 +73,10 @@ setup(
     },
     entry_points={
         "console_scripts": [
-            "pdf-bookmarker=pdf_bookmarker_gs:main",
+            "pdf-bookmarker=bookmarker_cli:main",
+        ],
+        "gui_scripts": [
+            "pdf-bookmarker-gui=pdf_bookmarker_gs:main",
         ],
     },
     include_package_data=True,
@@ -0,0 +1,136 @@
+"""
+测试用的最小PDF
+classic为经典xref表，xref_stream为压缩的xref流，hybrid为经典xref表加/XRefStm，
+页面对象存放在对象流中、在xref表里标记为空闲
+"""
+
+import zlib
+
+from pdf_structure import PDFRef, PDFStructure
+
+LAYOUTS = ('classic', 'xref_stream', 'hybrid')
+
+
+def _page(num_pages_obj):
+    return b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 200 200] >>' % num_pages_obj
+
+
+def build_pdf(path, pages=5, layout='classic', outline=()):
+    """写入一个pages页的PDF，outline为原有顶层书签的标题，返回path"""
+    page_nums = list(range(3, 3 + pages))
+    outline_num = 3 + pages
+    item_nums = list(range(outline_num + 1, outline_num + 1 + len(outline)))
+    next_num = item_nums[-1] + 1 if item_nums else outline_num
+
+    catalog = b'<< /Type /Catalog /Pages 2 0 R'
+    if outline:
+        catalog += b' /Outlines %d 0 R' % outline_num
+    catalog += b' >>'
+    objects = {
+        1: catalog,
+        2: b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % n for n in page_nums), pages),
+    }
+    if outline:
+        objects[outline_num] = b'<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>' % (
+            item_nums[0], item_nums[-1], len(item_nums))
+        for i, (num, title) in enumerate(zip(item_nums, outline)):
+            item = b'<< /Title (%s) /Parent %d 0 R /Dest [%d 0 R /XYZ null null null]' % (
+                title.encode('ascii'), outline_num, page_nums[0])
+            if i:
+                item += b' /Prev %d 0 R' % item_nums[i - 1]
+            if i + 1 < len(item_nums):
+                item += b' /Next %d 0 R' % item_nums[i + 1]
+            objects[num] = item + b' >>'
+
+    compressed = {}
+    if layout == 'hybrid':
+        compressed = {num: _page(2) for num in page_nums}
+    else:
+        for num in page_nums:
+            objects[num] = _page(2)
+
+    out = bytearray(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+
+    def write(num, body, stream=None):
+        offsets[num] = len(out)
+        out.extend(b'%d 0 obj\n' % num + body)
+        if stream is not None:
+            out.extend(b'\nstream\n' + stream + b'\nendstream')
+        out.extend(b'\nendobj\n')
+
+    for num in sorted(objects):
+        write(num, objects[num])
+
+    objstm_num = None
+    if compressed:
+        objstm_num = next_num
+        next_num += 1
+        header = bytearray()
+        body = bytearray()
+        for num in sorted(compressed):
+            header += b'%d %d ' % (num, len(body))
+            body += compressed[num] + b'\n'
+        data = zlib.compress(bytes(header) + bytes(body))
+        write(objstm_num, b'<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>' % (
+            len(compressed), len(header), len(data)), data)
+
+    size = next_num
+    if layout == 'classic':
+        xref_pos = len(out)
+        out.extend(b'xref\n0 %d\n0000000000 65535 f\r\n' % size)
+        for num in range(1, size):
+            out.extend(b'%010d 00000 n\r\n' % offsets[num])
+        out.extend(b'trailer\n<< /Size %d /Root 1 0 R >>\n' % size)
+    elif layout == 'xref_stream':
+        xref_num = size
+        xref_pos = len(out)
+        offsets[xref_num] = xref_pos
+        rows = b'\x00' + (0).to_bytes(4, 'big') + b'\xff\xff'
+        for num in range(1, xref_num + 1):
+            rows += b'\x01' + offsets[num].to_bytes(4, 'big') + b'\x00\x00'
+        data = zlib.compress(rows)
+        write(xref_num, b'<< /Type /XRef /Size %d /W [1 4 2] /Root 1 0 R /Filter /FlateDecode /Length %d >>' % (
+            xref_num + 1, len(data)), data)
+    else:
+        # XRefStm只列出对象流中的对象，xref表中这些对象标记为空闲
+        stm_num = size
+        stm_pos = len(out)
+        rows = b''
+        for index, num in enumerate(sorted(compressed)):
+            rows += b'\x02' + objstm_num.to_bytes(4, 'big') + index.to_bytes(2, 'big')
+        write(stm_num, b'<< /Type /XRef /Size %d /W [1 4 2] /Index [%d %d] /Length %d >>' % (
+            stm_num + 1, page_nums[0], len(page_nums), len(rows)), rows)
+        xref_pos = len(out)
+        out.extend(b'xref\n0 %d\n0000000000 65535 f\r\n' % size)
+        for num in range(1, size):
+            if num in compressed:
+                out.extend(b'0000000000 00001 f\r\n')
+            else:
+                out.extend(b'%010d 00000 n\r\n' % offsets[num])
+        out.extend(b'trailer\n<< /Size %d /Root 1 0 R /XRefStm %d >>\n' % (stm_num + 1, stm_pos))
+    out.extend(b'startxref\n%d\n%%%%EOF\n' % xref_pos)
+
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+
+def read_outline(path):
+    """返回[(标题, 目标页码或None)]，页码从1开始"""
+    with PDFStructure(path) as pdf:
+        pages = {ref.num: i + 1 for i, ref in enumerate(pdf.page_index)}
+        outlines = pdf.resolve(pdf.catalog().get('Outlines'))
+        items = []
+        ref = outlines.get('First') if isinstance(outlines, dict) else None
+        while isinstance(ref, PDFRef):
+            item = pdf.resolve(ref)
+            title = item['Title']
+            if isinstance(title, bytes):
+                title = (title[2:].decode('utf-16-be') if title.startswith(b'\xfe\xff')
+                         else title.decode('latin-1'))
+            dest = item.get('Dest')
+            items.append((title, pages.get(dest[0].num) if dest else None))
+            ref = item.get('Next')
+        return items
@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+from concurrent.futures import CancelledError
+
+import asyncio
+
+import pytest
+
+import async_runner
+from async_runner import AsyncProcessRunner
+
+SLEEPER = [sys.executable, '-c', "import os, time; print(os.getpid(), flush=True); time.sleep(30)"]
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="用os.kill(pid, 0)检查进程是否已被回收")
+def test_cancelled_run_sync_returns_after_child_is_reaped(monkeypatch):
+    kill = async_runner._kill
+
+    async def slow_kill(process):
+        # 模拟结束进程较慢的情况
+        await asyncio.sleep(0.3)
+        await kill(process)
+    monkeypatch.setattr(async_runner, '_kill', slow_kill)
+
+    runner = AsyncProcessRunner()
+    cancel_event = threading.Event()
+    pids = []
+
+    def on_stdout(line):
+        pids.append(int(line))
+        cancel_event.set()
+
+    with pytest.raises(CancelledError):
+        runner.run_sync(SLEEPER, timeout=30, cancel_event=cancel_event, on_stdout=on_stdout)
+    # 已回收的进程连僵尸进程都不存在
+    with pytest.raises(ProcessLookupError):
+        os.kill(pids[0], 0)
+
+
+def test_run_sync_with_cancel_event_returns_result():
+    runner = AsyncProcessRunner()
+    result = runner.run_sync([sys.executable, '-c', "print('ok')"], cancel_event=threading.Event())
+    assert result.returncode == 0
+    assert result.stdout.strip() == 'ok'
@@ -0,0 +1,79 @@
+import pytest
+
+from batch_runner import STATUS_DONE, STATUS_FAILED, BatchItem, BatchJournal, load_manifest, process_item
+from pdf_samples import build_pdf, read_outline
+
+
+@pytest.fixture
+def item(tmp_path):
+    pdf = build_pdf(tmp_path / 'book.pdf', pages=3)
+    toc = tmp_path / 'book.toc.txt'
+    toc.write_text("A 1\n", encoding='utf-8')
+    output = tmp_path / 'book_with_bookmarks.pdf'
+    output.write_bytes(pdf.read_bytes())
+    return BatchItem(pdf, toc, output, offset=1)
+
+
+def finish(journal_path, item, operation):
+    journal = BatchJournal(journal_path)
+    journal.append({'key': item.key, **item.to_dict(), 'operation': operation,
+                    'settings': item.settings(operation), 'fingerprint': item.fingerprint(),
+                    'status': STATUS_DONE})
+    journal.close()
+
+
+def test_unchanged_item_is_skipped(tmp_path, item):
+    finish(tmp_path / 'journal.jsonl', item, 'add')
+    assert BatchJournal(tmp_path / 'journal.jsonl').is_finished(item, 'add')
+
+
+@pytest.mark.parametrize('changed, operation', [
+    ({'offset': 3}, 'add'),
+    ({}, 'replace'),
+    ({'output': 'other.pdf'}, 'add'),
+    ({'encoding': 'gbk'}, 'add'),
+])
+def test_changed_settings_are_not_skipped(tmp_path, item, changed, operation):
+    finish(tmp_path / 'journal.jsonl', item, 'add')
+    values = {**item.to_dict(), **changed}
+    if 'output' in changed:
+        values['output'] = tmp_path / changed['output']
+        values['output'].write_bytes(b'%PDF')
+    assert not BatchJournal(tmp_path / 'journal.jsonl').is_finished(BatchItem(**values), operation)
+
+
+def test_changed_input_or_missing_output_is_not_skipped(tmp_path, item):
+    finish(tmp_path / 'journal.jsonl', item, 'add')
+    item.toc.write_text("A 1\nB 2\n", encoding='utf-8')
+    assert not BatchJournal(tmp_path / 'journal.jsonl').is_finished(item, 'add')
+
+    finish(tmp_path / 'journal.jsonl', item, 'add')
+    item.output.unlink()
+    assert not BatchJournal(tmp_path / 'journal.jsonl').is_finished(item, 'add')
+
+
+def test_record_without_settings_is_not_skipped(tmp_path, item):
+    # 旧版本写的日志没有记录参数，无法确认是否相同
+    journal = BatchJournal(tmp_path / 'journal.jsonl')
+    journal.append({'key': item.key, **item.to_dict(), 'operation': 'add',
+                    'fingerprint': item.fingerprint(), 'status': STATUS_DONE})
+    journal.close()
+    assert not BatchJournal(tmp_path / 'journal.jsonl').is_finished(item, 'add')
+
+
+def test_toc_is_read_with_item_encoding(tmp_path):
+    pdf = build_pdf(tmp_path / 'book.pdf', pages=3)
+    toc = tmp_path / 'book.toc.txt'
+    toc.write_text("第一章 1\n第二章 2\n", encoding='gbk')
+    manifest = tmp_path / 'manifest.jsonl'
+    manifest.write_text('{"pdf": "book.pdf", "toc": "book.toc.txt"}\n', encoding='utf-8')
+
+    item, = load_manifest(manifest, encoding='gbk')
+    record = process_item(item.to_dict(), 'add', preferred='incremental', use_cache=False)
+    assert record['status'] == STATUS_DONE, record.get('error')
+    assert [title for title, *_ in read_outline(item.output)] == ['第一章', '第二章']
+
+    item.encoding = 'utf-8'
+    record = process_item(item.to_dict(), 'add', preferred='incremental', use_cache=False)
+    assert record['status'] == STATUS_FAILED
+    assert 'UnicodeDecodeError' in record['error']
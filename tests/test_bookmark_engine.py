@@ -0,0 +1,272 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import async_runner
+import bookmark_engine
+from bookmark_core import BookmarkTable
+from bookmark_engine import (CAP_ADD_OUTLINE, CAP_REPLACE_OUTLINE, CAP_REWRITE, OP_ADD, OP_REPLACE, Backend,
+                             BackendError, BookmarkEngine, BookmarkJob, ChunkedGhostscriptBackend, EngineError,
+                             GhostscriptBackend, GhostscriptErrorWatcher, JobCancelled, page_ranges)
+from build_cache import BuildCache
+from pdf_outline_writer import write_outline_incremental
+from pdf_samples import build_pdf, read_outline
+from pdf_structure import read_pdf_summary
+
+
+class FakeRewriteBackend(Backend):
+    """代替Ghostscript的重写后端：用增量写入器生成输出，并记录收到的任务"""
+
+    name = 'fake_rewrite'
+    label = 'Fake rewrite'
+    capabilities = frozenset({CAP_ADD_OUTLINE, CAP_REPLACE_OUTLINE, CAP_REWRITE})
+
+    def __init__(self):
+        super().__init__()
+        self.jobs = []
+
+    def probe(self):
+        return 'fake', '1'
+
+    def add_outline(self, job, keep_existing=None):
+        self.jobs.append(job)
+        if keep_existing is None:
+            keep_existing = job.keep_existing
+        return write_outline_incremental(job.input_pdf, job.output_pdf, job.bookmarks, job.offset,
+                                         keep_existing=keep_existing)
+
+    def replace_outline(self, job):
+        return self.add_outline(job, keep_existing=False)
+
+
+class NoOutputBackend(FakeRewriteBackend):
+    name = 'no_output'
+
+    def add_outline(self, job, keep_existing=None):
+        self.jobs.append(job)
+        return 0
+
+
+@pytest.fixture
+def sample(tmp_path):
+    return build_pdf(tmp_path / 'in.pdf', pages=5, outline=['Old'])
+
+
+def make_engine(tmp_path, *backends):
+    return BookmarkEngine(backends=list(backends), cache=BuildCache(tmp_path / 'cache'), stats_path=False)
+
+
+@pytest.mark.parametrize('operation, keep_existing, expected', [
+    (OP_ADD, True, [('Old', 1)]),
+    (OP_REPLACE, True, []),
+])
+def test_cache_with_empty_bookmarks_writes_output(tmp_path, sample, operation, keep_existing, expected):
+    backend = FakeRewriteBackend()
+    engine = make_engine(tmp_path, backend)
+    out = tmp_path / 'out.pdf'
+    result = engine.run(BookmarkJob(operation, sample, out, BookmarkTable(), keep_existing=keep_existing))
+    assert result.count == 0
+    assert out.is_file()
+    assert read_pdf_summary(out)['page_count'] == 5
+    assert read_outline(out) == expected
+
+
+def test_cached_base_is_reused_for_new_toc(tmp_path, sample):
+    backend = FakeRewriteBackend()
+    engine = make_engine(tmp_path, backend)
+    out = tmp_path / 'out.pdf'
+    engine.run(BookmarkJob(OP_REPLACE, sample, out, BookmarkTable.from_text("A 1\n")))
+    assert len(backend.jobs) == 1
+    # 规范化副本不含新书签
+    assert backend.jobs[0].bookmarks == []
+
+    engine.run(BookmarkJob(OP_REPLACE, sample, out, BookmarkTable.from_text("B 2\nC 3\n")))
+    assert len(backend.jobs) == 1
+    assert read_outline(out) == [('B', 2), ('C', 3)]
+
+
+def test_preferred_rewrite_backend_receives_bookmarks(tmp_path, sample):
+    backend = FakeRewriteBackend()
+    engine = make_engine(tmp_path, backend)
+    out = tmp_path / 'out.pdf'
+    bookmarks = BookmarkTable.from_text("A 1\n")
+    engine.run(BookmarkJob(OP_REPLACE, sample, out, bookmarks), preferred=backend.name)
+    assert backend.jobs[-1].bookmarks is bookmarks
+    assert read_outline(out) == [('A', 1)]
+
+
+def test_preferred_backend_does_not_reuse_other_backends_results(tmp_path, sample):
+    class OtherBackend(FakeRewriteBackend):
+        name = 'other'
+
+    first, other = FakeRewriteBackend(), OtherBackend()
+    engine = make_engine(tmp_path, first, other)
+    out = tmp_path / 'out.pdf'
+    bookmarks = BookmarkTable.from_text("A 1\n")
+    assert engine.run(BookmarkJob(OP_REPLACE, sample, out, bookmarks), preferred=first.name).backend is first
+
+    result = engine.run(BookmarkJob(OP_REPLACE, sample, out, bookmarks), preferred=other.name)
+    assert result.backend is other and not result.cached
+    assert len(other.jobs) == 1
+    assert engine.run(BookmarkJob(OP_REPLACE, sample, out, bookmarks), preferred=other.name).cached
+
+
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_missing_output_is_a_failure(tmp_path, sample, use_cache):
+    backend = NoOutputBackend()
+    engine = BookmarkEngine(backends=[backend], cache=BuildCache(tmp_path / 'cache') if use_cache else None,
+                            stats_path=False)
+    with pytest.raises(EngineError):
+        engine.run(BookmarkJob(OP_ADD, sample, tmp_path / 'out.pdf', BookmarkTable.from_text("A 1\n")))
+
+
+class PartialOutputBackend(FakeRewriteBackend):
+    """写入一部分输出后失败，cancel为True时模拟在写入过程中被取消"""
+
+    name = 'partial_output'
+
+    def __init__(self, cancel=False):
+        super().__init__()
+        self.cancel = cancel
+
+    def add_outline(self, job, keep_existing=None):
+        self.jobs.append(job)
+        job.output_pdf.write_bytes(b'%PDF-1.4 partial')
+        if self.cancel:
+            job.cancel()
+            return 1
+        raise BackendError("写入中断")
+
+
+@pytest.mark.parametrize('cancel, error', [(False, EngineError), (True, JobCancelled)])
+def test_failure_keeps_existing_output(tmp_path, sample, cancel, error):
+    out = tmp_path / 'out.pdf'
+    out.write_bytes(b'previous output')
+    engine = BookmarkEngine(backends=[PartialOutputBackend(cancel)], cache=None, stats_path=False)
+    with pytest.raises(error):
+        engine.run(BookmarkJob(OP_ADD, sample, out, BookmarkTable.from_text("A 1\n")))
+    assert out.read_bytes() == b'previous output'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['in.pdf', 'out.pdf']
+
+
+def test_out_of_range_bookmarks_fail_before_any_backend(tmp_path, sample):
+    backend = FakeRewriteBackend()
+    engine = make_engine(tmp_path, backend)
+    with pytest.raises(EngineError, match='不存在的页面'):
+        engine.run(BookmarkJob(OP_ADD, sample, tmp_path / 'out.pdf', BookmarkTable.from_text("A 1\nB 6\n")))
+    assert backend.jobs == []
+
+
+# Ghostscript修复一个损坏的xref时的典型输出，文件仍能正常处理
+GS_ROUTINE_REPAIR = """\
+   **** Error:  An error occurred while reading an XREF table.
+   **** The file has been damaged.  This may have been caused
+   **** by a problem while converting or transfering the file.
+   **** Ghostscript will attempt to recover the data.
+   **** However, the output may be incorrect.
+   **** Warning: File has an invalid xref entry:  17.  Rebuilding xref table.
+   **** Error:  xref table entry for object 17 is not valid.
+Processing pages 1 through 5.
+Page 1
+"""
+
+
+def test_watcher_ignores_routine_xref_repair():
+    watcher = GhostscriptErrorWatcher()
+    assert [watcher(line) for line in GS_ROUTINE_REPAIR.splitlines(True)] == [None] * 9
+    assert watcher.xref_repairs == 2
+
+
+def test_watcher_stops_on_repeated_or_failed_repair():
+    watcher = GhostscriptErrorWatcher()
+    reasons = [watcher("   **** Ghostscript will attempt to recover the data.\n") for _ in range(3)]
+    assert reasons[:2] == [None, None] and 'xref' in reasons[2]
+    assert 'xref' in GhostscriptErrorWatcher()("   **** Error: Failed to repair the xref table.\n")
+
+
+@pytest.mark.parametrize('pages, qpdf_output', [
+    (1, None),          # 自带解析器读出的页数
+    (None, '0\n'),      # qpdf统计的页数
+    (None, 'error'),    # qpdf的输出无法解析
+    (None, BackendError("qpdf执行失败")),
+])
+def test_chunked_falls_back_to_single_process(tmp_path, sample, monkeypatch, pages, qpdf_output):
+    calls = []
+    monkeypatch.setattr(GhostscriptBackend, 'add_outline',
+                        lambda self, job, keep_existing=None: calls.append(keep_existing) or 7)
+
+    def run_command(self, cmd, job, *args, **kwargs):
+        if isinstance(qpdf_output, Exception):
+            raise qpdf_output
+        return subprocess.CompletedProcess(cmd, 0, qpdf_output, '')
+    monkeypatch.setattr(ChunkedGhostscriptBackend, '_run_command', run_command)
+    monkeypatch.setattr(bookmark_engine, 'page_ranges', None)
+
+    backend = ChunkedGhostscriptBackend(workers=2)
+    backend._probed = True
+    backend._qpdf = 'qpdf'
+    job = BookmarkJob(OP_REPLACE, sample, tmp_path / 'out.pdf', BookmarkTable.from_text("A 1\n"),
+                      page_count=pages or 0)
+    assert backend.replace_outline(job) == 7
+    assert calls == [False]
+
+
+def test_page_ranges():
+    assert page_ranges(5, 2) == [(1, 3), (4, 5)]
+    assert page_ranges(2, 8) == [(1, 1), (2, 2)]
+    with pytest.raises(ValueError):
+        page_ranges(0, 2)
+
+
+def test_empty_input_fails_with_engine_error(tmp_path):
+    empty = tmp_path / 'empty.pdf'
+    empty.write_bytes(b'')
+    engine = make_engine(tmp_path, FakeRewriteBackend())
+    with pytest.raises(EngineError):
+        engine.run(BookmarkJob(OP_ADD, empty, tmp_path / 'out.pdf', BookmarkTable.from_text("A 1\n")))
+
+
+FAKE_GS = """\
+import os, sys, time
+first = next(arg for arg in sys.argv if arg.startswith('-dFirstPage='))
+output = next(arg for arg in sys.argv if arg.startswith('-sOutputFile='))[len('-sOutputFile='):]
+with open(output + '.pid', 'w') as f:
+    f.write(str(os.getpid()))
+if first == '-dFirstPage=1':
+    # 等其他块都已启动
+    time.sleep(0.5)
+    sys.exit(1)
+time.sleep(30)
+"""
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="用os.kill(pid, 0)检查进程是否已被回收")
+def test_chunk_failure_reaps_other_chunks(tmp_path, monkeypatch):
+    kill = async_runner._kill
+
+    async def slow_kill(process):
+        await asyncio.sleep(0.3)
+        await kill(process)
+    monkeypatch.setattr(async_runner, '_kill', slow_kill)
+
+    script = tmp_path / 'fake_gs.py'
+    script.write_text(FAKE_GS)
+    backend = ChunkedGhostscriptBackend(workers=3)
+    backend._probed = True
+    backend._command = sys.executable
+    monkeypatch.setattr(bookmark_engine, 'pdfwrite_args',
+                        lambda output, **kwargs: [str(script), '-sOutputFile=' + str(output)])
+    job = BookmarkJob(OP_REPLACE, tmp_path / 'in.pdf', tmp_path / 'out.pdf', BookmarkTable.from_text("A 1\n"))
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    with pytest.raises(BackendError):
+        backend._render_chunks(job, [(1, 10), (11, 20), (21, 30)], str(work_dir))
+    pids = [int(path.read_text()) for path in work_dir.glob('*.pid')]
+    assert len(pids) == 3
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from bookmarker_server import validate_toc
+
+
+def test_validate_toc(tmp_path, capsys):
+    toc = tmp_path / 'toc.txt'
+    toc.write_text("第一章 0\n没有页码\n第二章 2\n", encoding='utf-8')
+    result = validate_toc(toc, 1)
+    assert not result['ok']
+    assert result['count'] == 2
+    assert result['issues'] == ["第1行: 页码为0: 第一章"]
+    assert result['warnings'] == ["第2行: 无法解析: '没有页码' (缺少页码)"]
+    assert {'severity': 'error', 'message': "页码为0: 第一章", 'line': 1} in result['details']
+    assert capsys.readouterr().out == ''
+
+
+def test_validate_toc_concurrently(tmp_path):
+    # 每个目录都有不同数量的警告，结果不能在线程之间串
+    paths = []
+    for i in range(8):
+        path = tmp_path / f'toc{i}.txt'
+        path.write_text("A 1\n" * (i + 1), encoding='utf-8')
+        paths.append(path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(validate_toc, paths * 10, [1] * 80))
+    for i, result in enumerate(results):
+        assert result['ok']
+        assert len(result['warnings']) == i % 8
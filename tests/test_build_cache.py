@@ -0,0 +1,69 @@
+import os
+from types import SimpleNamespace
+
+import build_cache
+from build_cache import BuildCache, file_digest
+
+
+def test_input_digest_is_shared_between_instances(tmp_path, monkeypatch):
+    src = tmp_path / 'a.pdf'
+    src.write_bytes(b'%PDF a')
+    digest = BuildCache(tmp_path / 'cache').input_digest(src)
+    assert digest == file_digest(src)
+
+    def fail(path):
+        raise AssertionError("不应再次计算哈希")
+    monkeypatch.setattr(build_cache, 'file_digest', fail)
+    # 另一个进程（新的实例）直接读取哈希记录
+    assert BuildCache(tmp_path / 'cache').input_digest(src) == digest
+
+
+def test_workers_do_not_overwrite_each_others_hashes(tmp_path):
+    inputs = []
+    for name in 'abc':
+        path = tmp_path / f'{name}.pdf'
+        path.write_bytes(b'%PDF ' + name.encode())
+        inputs.append(path)
+    # 多个实例各自只见过一部分输入，写入后所有记录都在
+    for path in inputs:
+        BuildCache(tmp_path / 'cache').input_digest(path)
+    cache = BuildCache(tmp_path / 'cache')
+    assert all(cache._read_hash(str(path.resolve())) for path in inputs)
+
+
+def test_evict_prunes_stale_hashes(tmp_path):
+    kept, changed, deleted = (tmp_path / f'{name}.pdf' for name in ('kept', 'changed', 'deleted'))
+    for path in (kept, changed, deleted):
+        path.write_bytes(b'%PDF')
+    cache = BuildCache(tmp_path / 'cache')
+    for path in (kept, changed, deleted):
+        cache.input_digest(path)
+
+    changed.write_bytes(b'%PDF changed')
+    os.utime(changed, ns=(0, 0))
+    deleted.unlink()
+    cache.evict()
+
+    assert len(list((tmp_path / 'cache' / 'hashes').iterdir())) == 1
+    assert cache._read_hash(str(kept.resolve()))
+    assert cache.input_digest(changed) == file_digest(changed)
+
+
+def test_store_scans_cache_only_when_over_limit(tmp_path, monkeypatch):
+    cache = BuildCache(tmp_path / 'cache', max_bytes=10 * 1024)
+    scans = []
+    entries = BuildCache.entries
+    monkeypatch.setattr(BuildCache, 'entries', lambda self: scans.append(1) or entries(self))
+    result = SimpleNamespace(count=1, backend=SimpleNamespace(name='fake'), duration=0.1)
+    output = tmp_path / 'out.pdf'
+    output.write_bytes(b'x' * 1024)
+
+    for i in range(9):
+        cache.store(f'{i:064x}', output, result)
+    # 第一次保存时扫描一次，之后只累加
+    assert len(scans) == 1
+
+    for i in range(9, 12):
+        cache.store(f'{i:064x}', output, result)
+    assert len(scans) > 1
+    assert sum(size for _, size, _ in entries(cache)) <= 10 * 1024
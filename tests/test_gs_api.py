@@ -0,0 +1,146 @@
+import ctypes
+
+import pytest
+
+from bookmark_core import BookmarkTable
+from bookmark_engine import OP_ADD, BackendError, BookmarkJob, GhostscriptAPIBackend, JobCancelled
+from gs_api import GhostscriptLibrary
+
+
+class FakeGhostscript:
+    """模拟libgs的gsapi函数：先逐页输出进度，再读完stdin；任何回调返回负值即中止"""
+
+    def __init__(self, pages=3, stderr_lines=()):
+        self.pages = pages
+        self.stderr_lines = stderr_lines
+        self.written = 0
+        self.received = b''
+        self.on_finish = None
+
+    def gsapi_new_instance(self, instance, handle):
+        return 0
+
+    def gsapi_delete_instance(self, instance):
+        pass
+
+    def gsapi_set_stdio(self, instance, stdin, stdout, stderr):
+        self.stdin, self.stdout, self.stderr = stdin, stdout, stderr
+        return 0
+
+    def gsapi_set_arg_encoding(self, instance, encoding):
+        return 0
+
+    def gsapi_init_with_args(self, instance, argc, argv):
+        for line in self.stderr_lines:
+            if self.stderr(None, ctypes.create_string_buffer(line), len(line)) < 0:
+                return -100
+        for page in range(1, self.pages + 1):
+            data = b'Page %d\n' % page
+            if self.stdout(None, ctypes.create_string_buffer(data), len(data)) < 0:
+                return -100
+            self.written = page
+        buf = ctypes.create_string_buffer(64)
+        while True:
+            length = self.stdin(None, buf, 64)
+            if length < 0:
+                return -100
+            if length == 0:
+                break
+            self.received += buf.raw[:length]
+        if self.on_finish:
+            self.on_finish()
+        return 0
+
+    def gsapi_exit(self, instance):
+        return 0
+
+
+def fake_library(fake):
+    library = object.__new__(GhostscriptLibrary)
+    library.path = 'fake'
+    library.lib = fake
+    library.has_poll = False
+    return library
+
+
+def test_run_collects_output_and_feeds_stdin():
+    fake = FakeGhostscript()
+    lines = []
+    stdout, _ = fake_library(fake).run([], [b'abc', b'def'], on_stdout=lines.append)
+    assert lines == ['Page 1\n', 'Page 2\n', 'Page 3\n']
+    assert stdout == ''.join(lines)
+    assert fake.received == b'abcdef'
+
+
+def test_exception_in_stdin_iterator_aborts_and_is_reraised():
+    def chunks():
+        yield b'abc'
+        raise KeyError('stop')
+
+    fake = FakeGhostscript()
+    with pytest.raises(KeyError):
+        fake_library(fake).run([], chunks())
+    assert fake.written == 3
+
+
+def test_exception_in_output_callback_aborts():
+    def on_stdout(line):
+        raise ValueError(line)
+
+    fake = FakeGhostscript()
+    with pytest.raises(ValueError):
+        fake_library(fake).run([], b'', on_stdout=on_stdout)
+    assert fake.written == 0
+
+
+@pytest.fixture
+def gsapi_backend():
+    fake = FakeGhostscript()
+    backend = GhostscriptAPIBackend()
+    backend._library = fake_library(fake)
+    backend._probed = True
+    return backend, fake
+
+
+def make_job(tmp_path):
+    return BookmarkJob(OP_ADD, tmp_path / 'in.pdf', tmp_path / 'out.pdf',
+                       BookmarkTable.from_text("A 1\nB 2\n"), page_count=3)
+
+
+def test_cancel_during_run_stops_ghostscript(tmp_path, gsapi_backend):
+    backend, fake = gsapi_backend
+    job = make_job(tmp_path)
+    job.on_progress = lambda progress: job.cancel()
+    with pytest.raises(JobCancelled):
+        backend.add_outline(job)
+    # 第一页的进度回调中取消，之后的回调都返回负值
+    assert fake.written == 1
+    assert fake.received == b''
+
+
+def test_cancel_after_last_callback_is_not_reported_as_success(tmp_path, gsapi_backend):
+    backend, fake = gsapi_backend
+    job = make_job(tmp_path)
+    fake.on_finish = job.cancel
+    with pytest.raises(JobCancelled):
+        backend.add_outline(job)
+
+
+def test_fatal_stderr_output_aborts(tmp_path, gsapi_backend):
+    backend, fake = gsapi_backend
+    fake.stderr_lines = [b'   **** Error: Failed to repair the xref table.\n']
+    with pytest.raises(BackendError, match='已提前终止') as info:
+        backend.add_outline(make_job(tmp_path))
+    assert 'Failed to repair' in info.value.stderr
+    assert fake.written == 0
+
+
+def test_time_budget_aborts(tmp_path, gsapi_backend, monkeypatch):
+    backend, fake = gsapi_backend
+    job = make_job(tmp_path)
+    job.time_budget = 5.0
+    clock = iter(range(0, 100, 4))
+    monkeypatch.setattr('bookmark_engine.time.monotonic', lambda: next(clock))
+    with pytest.raises(BackendError, match='超过时间上限'):
+        backend.add_outline(job)
+    assert fake.written < 3
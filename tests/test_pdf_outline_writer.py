@@ -0,0 +1,50 @@
+import pytest
+
+from bookmark_core import BookmarkTable
+from pdf_outline_writer import write_outline_incremental
+from pdf_samples import build_pdf, read_outline
+from pdf_structure import read_pdf_summary
+
+LAYOUTS = ['classic', 'xref_stream', 'hybrid']
+
+TOC = "第一章 1\nSection 2.1 3\n附录 5\n"
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_write_outline(tmp_path, layout):
+    src = build_pdf(tmp_path / 'in.pdf', pages=5, layout=layout)
+    out = tmp_path / 'out.pdf'
+    count = write_outline_incremental(src, out, BookmarkTable.from_text(TOC), 1)
+    assert count == 3
+    assert read_outline(out) == [('第一章', 1), ('Section 2.1', 3), ('附录', 5)]
+    # 增量更新：原文件内容原样保留在输出的开头
+    assert out.read_bytes().startswith(src.read_bytes())
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_offset_and_out_of_range(tmp_path, layout):
+    src = build_pdf(tmp_path / 'in.pdf', pages=5, layout=layout)
+    out = tmp_path / 'out.pdf'
+    write_outline_incremental(src, out, BookmarkTable.from_text("A 1\nB 5\n"), 2)
+    assert read_outline(out) == [('A', 2), ('B', None)]
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('keep_existing', [True, False])
+def test_existing_outline(tmp_path, layout, keep_existing):
+    src = build_pdf(tmp_path / 'in.pdf', pages=3, layout=layout, outline=['Old'])
+    out = tmp_path / 'out.pdf'
+    write_outline_incremental(src, out, BookmarkTable.from_text("New 2\n"), 1, keep_existing=keep_existing)
+    expected = [('Old', 1), ('New', 2)] if keep_existing else [('New', 2)]
+    assert read_outline(out) == expected
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('keep_existing', [True, False])
+def test_empty_toc_still_writes_output(tmp_path, layout, keep_existing):
+    src = build_pdf(tmp_path / 'in.pdf', pages=3, layout=layout, outline=['Old'])
+    out = tmp_path / 'out.pdf'
+    assert write_outline_incremental(src, out, BookmarkTable(), 1, keep_existing=keep_existing) == 0
+    assert out.is_file()
+    assert read_pdf_summary(out)['page_count'] == 3
+    assert read_outline(out) == ([('Old', 1)] if keep_existing else [])
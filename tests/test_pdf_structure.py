@@ -0,0 +1,85 @@
+import pytest
+
+import pdf_structure
+from pdf_samples import LAYOUTS, build_pdf
+from pdf_structure import PDFStructure, PDFStructureError, read_page_count, read_pdf_summary
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_summary(tmp_path, layout):
+    path = build_pdf(tmp_path / 'in.pdf', pages=4, layout=layout, outline=['A', 'B'])
+    summary = read_pdf_summary(path)
+    assert summary['page_count'] == 4
+    assert summary['outline_count'] == 2
+    assert summary['xref_is_stream'] == (layout == 'xref_stream')
+
+
+def test_hybrid_objects_in_object_stream(tmp_path):
+    # 页面对象在xref表中标记为空闲，只能通过XRefStm找到
+    path = build_pdf(tmp_path / 'in.pdf', pages=3, layout='hybrid')
+    with PDFStructure(path) as pdf:
+        assert [ref.num for ref in pdf.page_index] == [3, 4, 5]
+        for ref in pdf.page_index:
+            assert pdf.resolve(ref)['Type'] == 'Page'
+        assert pdf.get_object(0) is None
+
+
+def _replace(path, old, new):
+    data = path.read_bytes()
+    assert old in data
+    # 保持长度不变，xref偏移仍然有效
+    path.write_bytes(data.replace(old, new.ljust(len(old))))
+
+
+@pytest.mark.parametrize('old, new', [
+    (b'/Kids [3 0 R', b'/Kids 7'),                      # 页面树节点不是数组
+    (b'/Kids [3 0 R 4 0 R]', b'/Kids [1 2]'),           # 子节点不是引用
+    (b'<< /Type /Catalog /Pages 2 0 R >>', b'[1 2]'),   # Catalog不是字典
+])
+def test_malformed_structure_raises_structure_error(tmp_path, old, new):
+    path = build_pdf(tmp_path / 'in.pdf', pages=2)
+    _replace(path, old, new)
+    with PDFStructure(path) as pdf:
+        with pytest.raises(PDFStructureError):
+            pdf.summary()
+            pdf.page_index
+
+
+def test_read_page_count_returns_none_for_malformed_input(tmp_path):
+    path = build_pdf(tmp_path / 'in.pdf', pages=2)
+    _replace(path, b'<< /Type /Catalog /Pages 2 0 R >>', b'[1 2]')
+    assert read_page_count(path) is None
+
+
+def test_corrupt_object_stream_raises_structure_error(tmp_path):
+    path = build_pdf(tmp_path / 'in.pdf', pages=2, layout='hybrid')
+    data = bytearray(path.read_bytes())
+    start = data.index(b'stream\n', data.index(b'/Type /ObjStm')) + len(b'stream\n')
+    data[start:start + 8] = b'\x00' * 8
+    path.write_bytes(bytes(data))
+    with PDFStructure(path) as pdf:
+        with pytest.raises(PDFStructureError):
+            pdf.page_index
+
+
+def test_read_page_count_is_cached_per_file_version(tmp_path, monkeypatch):
+    path = build_pdf(tmp_path / 'in.pdf', pages=3)
+    assert read_page_count(path) == 3
+
+    def fail(*args):
+        raise AssertionError("不应再次解析")
+    monkeypatch.setattr(pdf_structure, 'PDFStructure', fail)
+    assert read_page_count(path) == 3
+
+    monkeypatch.undo()
+    build_pdf(path, pages=6)
+    assert read_page_count(path) == 6
+
+
+@pytest.mark.parametrize('data', [b'', b'%PDF'])
+def test_empty_or_truncated_file(tmp_path, data):
+    path = tmp_path / 'empty.pdf'
+    path.write_bytes(data)
+    with pytest.raises(PDFStructureError):
+        PDFStructure(path)
+    assert read_page_count(path) is None
@@ -0,0 +1,67 @@
+import json
+import subprocess
+
+import pytest
+
+from bookmark_core import BookmarkTable
+from qpdf_outline import QpdfOutlineBackend
+
+CATALOG = {'/Type': '/Catalog', '/Pages': '2 0 R', '/Outlines': '6 0 R'}
+
+
+class FakeQpdf:
+    """按参数返回qpdf --json=2的输出，记录--update-from-json的更新文档"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.updates = []
+
+    def __call__(self, cmd, timeout):
+        if '--json=2' in cmd:
+            if '--json-key=pages' in cmd:
+                data = {'pages': [{'object': f'{n} 0 R'} for n in (3, 4, 5)],
+                        'qpdf': [{'maxobjectid': 8}, {'trailer': {'value': {'/Root': '1 0 R'}}}]}
+            else:
+                data = {'qpdf': [{}, {'obj:1 0 R': {'value': self.catalog}}]}
+            return subprocess.CompletedProcess(cmd, 0, json.dumps(data), '')
+        update = next(arg for arg in cmd if arg.startswith('--update-from-json='))
+        with open(update.split('=', 1)[1], encoding='utf-8') as f:
+            self.updates.append(json.load(f))
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'%PDF updated')
+        return subprocess.CompletedProcess(cmd, 0, '', '')
+
+
+@pytest.mark.parametrize('catalog', [CATALOG, {'/Type': '/Catalog', '/Pages': '2 0 R'}])
+def test_empty_toc_keeping_bookmarks_copies_input(tmp_path, catalog):
+    src = tmp_path / 'in.pdf'
+    src.write_bytes(b'%PDF original')
+    out = tmp_path / 'out.pdf'
+    fake = FakeQpdf(catalog)
+    assert QpdfOutlineBackend(runner=fake).write(src, out, BookmarkTable(), 1, keep_existing=True) == 0
+    assert out.read_bytes() == b'%PDF original'
+    assert fake.updates == []
+
+
+def test_empty_toc_without_keeping_bookmarks_removes_outline(tmp_path):
+    src = tmp_path / 'in.pdf'
+    src.write_bytes(b'%PDF original')
+    out = tmp_path / 'out.pdf'
+    fake = FakeQpdf(CATALOG)
+    assert QpdfOutlineBackend(runner=fake).write(src, out, BookmarkTable(), 1, keep_existing=False) == 0
+    assert out.read_bytes() == b'%PDF updated'
+    (update,) = fake.updates
+    assert update['qpdf'][1] == {'obj:1 0 R': {'value': {'/Type': '/Catalog', '/Pages': '2 0 R'}}}
+
+
+def test_bookmarks_are_written(tmp_path):
+    src = tmp_path / 'in.pdf'
+    src.write_bytes(b'%PDF original')
+    fake = FakeQpdf({'/Type': '/Catalog', '/Pages': '2 0 R'})
+    count = QpdfOutlineBackend(runner=fake).write(src, tmp_path / 'out.pdf',
+                                                  BookmarkTable.from_text("A 1\nB 3\n"), 1)
+    assert count == 2
+    objects = fake.updates[0]['qpdf'][1]
+    assert objects['obj:1 0 R']['value']['/Outlines'] == '11 0 R'
+    assert objects['obj:9 0 R']['value']['/Dest'][0] == '3 0 R'
+    assert objects['obj:10 0 R']['value']['/Dest'][0] == '5 0 R'
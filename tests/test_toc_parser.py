@@ -0,0 +1,91 @@
+import random
+import re
+
+import pytest
+
+from toc_parser import iter_lines, parse_toc, split_toc_line
+
+
+def old_parse_toc(toc_text):
+    """user-008之前GUI和BookmarkValidator中的解析循环（基于正则），用于对照"""
+    lines = toc_text.strip().split('\n')
+    bookmarks = []
+    messages = []
+    current_offset = 0
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        offset_match = re.search(r'<!---\s*offset\s*([+-]?\d+)\s*--->', line)
+        if offset_match:
+            current_offset += int(offset_match.group(1))
+            messages.append(f"第{line_num}行: 检测到偏移指令 '{line.strip()}'，当前偏移调整为: {current_offset}")
+            continue
+        match = re.search(r'(.*?)\s*[\.\s]*(-?\d+)\s*$', line)
+        if match:
+            adjusted_page = int(match.group(2)) + current_offset
+            bookmarks.append((match.group(1).strip(), adjusted_page, current_offset))
+    return bookmarks, messages
+
+
+def new_parse_toc(toc_text):
+    messages = []
+    return parse_toc(toc_text, log=messages.append), messages
+
+
+@pytest.mark.parametrize('line', [
+    "第一章 绪论 1",
+    "1.1 背景 ........................ 12",
+    "Chapter 10.....-3",
+    "附录　　 ・・ 99",
+    "Index\t\t. . . 1234  ",
+    "2024",
+    "-5",
+    "没有页码",
+    "标题 12a",
+    "..... 7",
+    "Part ٣٤",           # 阿拉伯-印度数字
+    "A -",
+    "A --5",
+    "x" + "." * 30,
+])
+def test_split_toc_line_matches_old_regex(line):
+    match = re.search(r'(.*?)\s*[\.\s]*(-?\d+)\s*$', line.strip())
+    expected = (match.group(1).strip(), int(match.group(2))) if match else None
+    assert split_toc_line(line.strip()) == expected
+
+
+def test_parse_toc_matches_old_parser():
+    toc = """
+
+    第一章 1
+    <!---offset +10--->
+    1.1 小节 ........ 2
+    没有页码的行
+      <!--- offset -3 --->
+    附录 A .. . 5
+
+
+    索引 -1
+    """
+    assert new_parse_toc(toc) == old_parse_toc(toc)
+
+
+def test_parse_toc_matches_old_parser_on_random_text():
+    rng = random.Random(8)
+    alphabet = ['a', 'Z', '章', ' ', ' ', '\t', '　', '\xa0', '.', '.', '-', '+', '0', '1', '9',
+                '٣', '<!---offset +2--->', '<!--- offset -1 --->', '<!---', '\n', '\n', '\r\n']
+    for _ in range(2000):
+        toc = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(200)))
+        assert new_parse_toc(toc) == old_parse_toc(toc), repr(toc)
+
+
+def test_long_leader_without_page_is_linear():
+    # 旧正则在这样的行上回溯的时间与长度的立方成正比
+    assert split_toc_line("x" + ". " * 200000) is None
+    assert split_toc_line("x" + "." * 200000 + "5") == ('x', 5)
+
+
+def test_iter_lines():
+    assert list(iter_lines("a\nb\n")) == ['a', 'b', '']
+    assert list(iter_lines("")) == ['']
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录文本解析
+每行用一次从右向左的线性扫描拆分为 标题 / 引导符(点线或空白) / 页码，
+结果与原来的正则 (.*?)\\s*[\\.\\s]*(-?\\d+)\\s*$ 完全一致，
+但不会在超长点线或没有页码的行上回溯
+"""
+
+import re
+
+# 偏移指令，格式: <!---offset +/-数字--->
+OFFSET_PATTERN = re.compile(r'<!---\s*offset\s*([+-]?\d+)\s*--->')
+
+# scan_toc产出的行类型
+LINE_ENTRY = 'entry'      # 书签行
+LINE_OFFSET = 'offset'    # 偏移指令
+LINE_INVALID = 'invalid'  # 缺少页码，无法解析
+
+_ASCII_LEADER = '. \t'
+
+
+def parse_offset_directive(line):
+    """解析偏移指令，返回偏移变化量；不是偏移指令时返回None"""
+    if '<!---' not in line:
+        return None
+    match = OFFSET_PATTERN.search(line)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def split_toc_line(line):
+    """把一行拆分为(标题, 页码)；行尾没有页码时返回None
+
+    从行尾依次跳过空白、数字、可选的负号和点线/空白引导符，
+    每个字符最多访问一次
+    """
+    end = len(line)
+    while end and line[end - 1].isspace():
+        end -= 1
+
+    pos = end
+    while pos and line[pos - 1].isdecimal():
+        pos -= 1
+    if pos == end:
+        return None
+    if pos and line[pos - 1] == '-':
+        pos -= 1
+    page = int(line[pos:end])
+
+    # 常见的ASCII引导符先用rstrip在C层跳过，剩余的Unicode空白逐个处理
+    pos = len(line[:pos].rstrip(_ASCII_LEADER))
+    while pos and (line[pos - 1] == '.' or line[pos - 1].isspace()):
+        pos -= 1
+    return line[:pos].strip(), page
+
+
+def iter_lines(text):
+    """按'\n'逐行切分字符串，不一次性生成整个行列表"""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def scan_toc_lines(lines):
+    """逐行扫描目录，产出(类型, 行号, 行内容, 值, 当前偏移)
+
+    lines可以是任何行迭代器（文件、标准输入、文本框分块等），行尾换行符会被去掉。
+    类型为LINE_ENTRY时值为(标题, 调整后页码)，LINE_OFFSET时为偏移变化量，
+    LINE_INVALID时为None。行号从第一个非空行开始计数，空行不产出
+    """
+    current_offset = 0
+    first_index = None
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        if first_index is None:
+            first_index = index
+        line_num = index - first_index + 1
+
+        offset_change = parse_offset_directive(line)
+        if offset_change is not None:
+            current_offset += offset_change
+            yield LINE_OFFSET, line_num, line, offset_change, current_offset
+            continue
+
+        parsed = split_toc_line(line)
+        if parsed is None:
+            yield LINE_INVALID, line_num, line, None, current_offset
+        else:
+            title, page = parsed
+            yield LINE_ENTRY, line_num, line, (title, page + current_offset), current_offset
+
+
+def scan_toc(toc_text):
+    """逐行扫描目录文本，结果同scan_toc_lines"""
+    return scan_toc_lines(iter_lines(toc_text))
+
+
+def iter_bookmarks(lines, log=None):
+    """从行迭代器中逐个产出(标题, 调整后页码, 当前偏移)
+
+    log用于输出偏移指令的提示信息，例如print
+    """
+    for kind, line_num, line, value, current_offset in scan_toc_lines(lines):
+        if kind == LINE_ENTRY:
+            title, adjusted_page = value
+            yield title, adjusted_page, current_offset
+        elif kind == LINE_OFFSET and log:
+            log(f"第{line_num}行: 检测到偏移指令 '{line}'，当前偏移调整为: {current_offset}")
+
+
+def parse_toc(toc_text, log=None):
+    """解析目录文本，返回(标题, 调整后页码, 当前偏移)列表"""
+    return list(iter_bookmarks(iter_lines(toc_text), log))
+
+
+class TocFile:
+    """以文件为来源的书签序列
+
+    每次迭代都重新打开文件逐行解析，内存占用与目录大小无关，
+    并且可以被多个后端（例如引擎回退时）重复读取
+    """
+
+    def __init__(self, path, encoding='utf-8', log=None):
+        self.path = path
+        self.encoding = encoding
+        self.log = log
+
+    def __iter__(self):
+        with open(self.path, encoding=self.encoding, newline='') as f:
+            yield from iter_bookmarks(f, self.log)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+外部工具发现与缓存
+gs/qpdf的路径、版本和能力保存在用户缓存目录的JSON文件中，并记录可执行文件的
+mtime和大小；文件未变化时直接使用缓存，不运行任何子进程。
+需要重新探测时，所有候选命令通过共享的AsyncProcessRunner并发执行，每个都有较短的超时
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+from async_runner import default_runner
+
+# 单个候选命令的探测超时（秒）
+PROBE_TIMEOUT = 5
+
+# 缓存文件格式版本，格式变化时旧缓存自动失效
+CACHE_VERSION = 1
+
+# 在程序目录下查找随程序分发的Ghostscript时的搜索范围
+BUNDLED_SEARCH_DEPTH = 3
+BUNDLED_SEARCH_MAX_DIRS = 500
+
+GS_NAMES = ['gs', 'gswin64c', 'gswin32c']
+QPDF_NAMES = ['qpdf', 'qpdf.exe']
+
+# 工具能力
+CAP_PDFWRITE = 'pdfwrite'   # Ghostscript包含pdfwrite设备
+CAP_JSON_V2 = 'json_v2'     # qpdf支持 --json=2 和 --update-from-json（11.0及以上）
+
+
+def default_cache_path():
+    """工具缓存文件的默认位置"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'pdf-bookmarker', 'tools.json')
+
+
+def _app_directory():
+    if getattr(sys, 'frozen', False):
+        # 打包后的可执行文件
+        return os.path.dirname(sys.executable)
+    # 开发环境
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _find_bundled(base_path, names):
+    """在base_path下按层查找names中的文件，深度和目录数都有上限"""
+    found = []
+    level = [base_path]
+    visited = 0
+    for depth in range(BUNDLED_SEARCH_DEPTH + 1):
+        next_level = []
+        for directory in level:
+            visited += 1
+            if visited > BUNDLED_SEARCH_MAX_DIRS:
+                return found
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.name.lower() in names:
+                        found.append(entry.path)
+                    elif (depth < BUNDLED_SEARCH_DEPTH and not entry.name.startswith('.')
+                          and entry.is_dir(follow_symlinks=False)):
+                        next_level.append(entry.path)
+                except OSError:
+                    continue
+        level = next_level
+    return found
+
+
+def get_common_ghostscript_paths():
+    """获取常见的Ghostscript安装路径"""
+    names = set(GS_NAMES) | {name + '.exe' for name in GS_NAMES}
+    paths = _find_bundled(_app_directory(), names)
+
+    # Windows常见路径
+    if os.name == 'nt':
+        program_files = os.environ.get('PROGRAMFILES', 'C:\\Program Files')
+        program_files_x86 = os.environ.get('PROGRAMFILES(X86)', 'C:\\Program Files (x86)')
+
+        gs_paths = [
+            os.path.join(program_files, 'gs', 'gs*', 'bin', 'gswin64c.exe'),
+            os.path.join(program_files_x86, 'gs', 'gs*', 'bin', 'gswin32c.exe'),
+            os.path.join(program_files, 'gs', 'gs*', 'bin', 'gs.exe'),
+            os.path.join(program_files_x86, 'gs', 'gs*', 'bin', 'gs.exe'),
+        ]
+
+        for pattern in gs_paths:
+            paths.extend(glob.glob(pattern))
+
+    # macOS常见路径
+    elif sys.platform == 'darwin':
+        paths.extend([
+            '/usr/local/bin/gs',
+            '/opt/homebrew/bin/gs',
+            '/usr/bin/gs'
+        ])
+
+    # Linux常见路径
+    elif sys.platform.startswith('linux'):
+        paths.extend([
+            '/usr/bin/gs',
+            '/usr/local/bin/gs',
+            '/opt/gs/bin/gs'
+        ])
+
+    return paths
+
+
+def get_common_qpdf_paths():
+    """获取常见的qpdf安装路径"""
+    if os.name == 'nt':
+        program_files = os.environ.get('PROGRAMFILES', 'C:\\Program Files')
+        return glob.glob(os.path.join(program_files, 'qpdf*', 'bin', 'qpdf.exe'))
+    if sys.platform == 'darwin':
+        return ['/opt/homebrew/bin/qpdf', '/usr/local/bin/qpdf', '/usr/bin/qpdf']
+    return ['/usr/bin/qpdf', '/usr/local/bin/qpdf']
+
+
+def resolve_executable(cmd):
+    """把命令名解析为可执行文件的绝对路径，找不到时返回None；不运行子进程"""
+    if os.path.dirname(cmd):
+        return os.path.abspath(cmd) if os.path.isfile(cmd) else None
+    return shutil.which(cmd)
+
+
+def _version_from(result):
+    if isinstance(result, subprocess.CompletedProcess) and result.returncode == 0:
+        return result.stdout.strip()
+    return None
+
+
+def probe_version(cmd, timeout=PROBE_TIMEOUT):
+    """运行 cmd --version，成功时返回版本字符串"""
+    return _version_from(default_runner().run_all([[cmd, '--version']], timeout)[0])
+
+
+def _version_tuple(version):
+    match = re.search(r'(\d+)\.(\d+)', version or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def _gs_capabilities(path, version, timeout):
+    result = default_runner().run_all([[path, '-h']], timeout)[0]
+    if not isinstance(result, subprocess.CompletedProcess):
+        return [CAP_PDFWRITE]
+    # 无法识别帮助输出时按支持处理，避免误判
+    if 'Available devices' in result.stdout and 'pdfwrite' not in result.stdout:
+        return []
+    return [CAP_PDFWRITE]
+
+
+def _qpdf_capabilities(path, version, timeout):
+    parsed = _version_tuple(version)
+    if parsed is None or parsed >= (11, 0):
+        return [CAP_JSON_V2]
+    return []
+
+
+class ToolInfo:
+    """已发现的外部工具"""
+
+    def __init__(self, name, path, version, capabilities=(), fingerprint=None):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.capabilities = list(capabilities)
+        self.fingerprint = fingerprint
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'capabilities': self.capabilities,
+            'fingerprint': self.fingerprint,
+        }
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, data['path'], data.get('version'), data.get('capabilities', ()),
+                   data.get('fingerprint'))
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class ToolDiscovery:
+    """带磁盘缓存的工具发现
+
+    TOOLS中的每个工具由候选命令列表和能力探测函数描述
+    """
+
+    TOOLS = {
+        'ghostscript': (lambda: GS_NAMES + get_common_ghostscript_paths(), _gs_capabilities),
+        'qpdf': (lambda: QPDF_NAMES + get_common_qpdf_paths(), _qpdf_capabilities),
+    }
+
+    def __init__(self, cache_path=None, timeout=PROBE_TIMEOUT):
+        self.cache_path = cache_path or default_cache_path()
+        self.timeout = timeout
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def lookup(self, name, refresh=False):
+        """返回ToolInfo，找不到时返回None；refresh为True时忽略缓存重新探测"""
+        with self._lock:
+            entries = self._load()
+            cached = entries.get(name)
+        if cached and not refresh:
+            info = ToolInfo.from_dict(name, cached)
+            if self._is_current(info):
+                return info
+
+        info = self._discover(name)
+        with self._lock:
+            if info:
+                self._entries[name] = info.to_dict()
+            else:
+                self._entries.pop(name, None)
+            self._save()
+        return info
+
+    def forget(self, name=None):
+        """删除缓存的探测结果；name为None时清空全部"""
+        with self._lock:
+            entries = self._load()
+            if name is None:
+                entries.clear()
+            else:
+                entries.pop(name, None)
+            self._save()
+
+    @staticmethod
+    def _is_current(info):
+        try:
+            return _fingerprint(info.path) == info.fingerprint
+        except (OSError, TypeError):
+            return False
+
+    def _candidates(self, name):
+        """候选命令解析为绝对路径，按优先级去重，不存在的直接跳过"""
+        candidates_func, _ = self.TOOLS[name]
+        paths = []
+        for cmd in candidates_func():
+            path = resolve_executable(cmd)
+            if path and path not in paths:
+                paths.append(path)
+        return paths
+
+    def _discover(self, name):
+        _, capabilities_func = self.TOOLS[name]
+        paths = self._candidates(name)
+        if not paths:
+            return None
+
+        # 并发探测所有候选的版本，按候选顺序取第一个可用的，只为它探测能力
+        results = default_runner().run_all([[path, '--version'] for path in paths], self.timeout)
+        for path, result in zip(paths, results):
+            version = _version_from(result)
+            if not version:
+                continue
+            try:
+                fingerprint = _fingerprint(path)
+            except OSError:
+                continue
+            return ToolInfo(name, path, version, capabilities_func(path, version, self.timeout), fingerprint)
+        return None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.cache_path, encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != CACHE_VERSION:
+                    raise ValueError
+                self._entries = dict(data.get('tools', {}))
+            except (OSError, ValueError, AttributeError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        data = {'version': CACHE_VERSION, 'tools': self._entries}
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # 缓存只是加速手段，写入失败不影响使用
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+_default_discovery = None
+_default_lock = threading.Lock()
+
+
+def default_discovery():
+    """进程内共享的ToolDiscovery"""
+    global _default_discovery
+    with _default_lock:
+        if _default_discovery is None:
+            _default_discovery = ToolDiscovery()
+        return _default_discovery
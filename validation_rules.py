@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+书签验证规则
+所有规则在一次遍历中逐个检查书签，每条规则只保存少量状态（上一个页码、
+已出现过的标题和页码），不排序也不重复遍历。每个问题都带有它在目录中的行号。
+GUI的预览窗口和bookmark_validator共用同一组规则
+"""
+
+ERROR = 'error'
+WARNING = 'warning'
+
+MAX_TITLE_LENGTH = 100
+
+# 写入pdfmarks时需要转义的字符
+SPECIAL_CHARACTERS = '()\\'
+
+
+class Issue:
+    """一个验证问题；line_num为目录中的行号，与具体某一行无关的问题为None"""
+
+    __slots__ = ('severity', 'message', 'line_num')
+
+    def __init__(self, severity, message, line_num=None):
+        self.severity = severity
+        self.message = message
+        self.line_num = line_num
+
+    def __str__(self):
+        if self.line_num is None:
+            return self.message
+        return f"第{self.line_num}行: {self.message}"
+
+    def __repr__(self):
+        return f"Issue({self.severity!r}, {self.message!r}, line_num={self.line_num})"
+
+
+class ValidationContext:
+    """一次验证的参数：offset为书签第1页对应的PDF页码，page_count为PDF页数（未知时为None）"""
+
+    def __init__(self, offset=1, page_count=None):
+        self.offset = offset
+        self.page_count = page_count
+
+
+class Rule:
+    """规则基类
+
+    begin在遍历书签之前调用一次，用于检查与单个书签无关的内容并重置状态；
+    check对每个书签调用一次。两者都返回问题的可迭代对象，可以是生成器
+    """
+
+    def begin(self, table, context):
+        return ()
+
+    def check(self, bookmark, final_page, context):
+        return ()
+
+
+class OffsetRule(Rule):
+    """页面偏移设置"""
+
+    def begin(self, table, context):
+        if context.offset < 1:
+            yield Issue(ERROR, "页面偏移小于1，可能导致页码错误")
+        elif context.page_count is not None and context.offset > context.page_count:
+            yield Issue(ERROR, f"页面偏移超出PDF页数 (共{context.page_count}页)")
+
+
+class UnparsedLineRule(Rule):
+    """缺少页码、无法解析的行"""
+
+    def begin(self, table, context):
+        for line_num, line in table.invalid_lines:
+            yield Issue(WARNING, f"无法解析: '{line}' (缺少页码)", line_num)
+
+
+class PageRule(Rule):
+    """页码为0、换算后小于1或超出PDF页数（页数未知时不检查上限）"""
+
+    def check(self, bookmark, final_page, context):
+        if bookmark.page == 0:
+            yield Issue(ERROR, f"页码为0: {bookmark.title}", bookmark.line_num)
+        elif final_page < 1:
+            yield Issue(ERROR, f"页码小于1 ({bookmark.page} -> PDF第{final_page}页): {bookmark.title}",
+                        bookmark.line_num)
+        elif context.page_count is not None and final_page > context.page_count:
+            yield Issue(ERROR, f"页码超出PDF页数 ({bookmark.page} -> PDF第{final_page}页，"
+                               f"共{context.page_count}页): {bookmark.title}", bookmark.line_num)
+
+
+class TitleRule(Rule):
+    """标题为空或过长"""
+
+    def check(self, bookmark, final_page, context):
+        title = bookmark.title
+        if not title.strip():
+            yield Issue(ERROR, "标题为空", bookmark.line_num)
+        elif len(title) > MAX_TITLE_LENGTH:
+            yield Issue(WARNING, f"标题过长 ({len(title)}字符): {title[:50]}...", bookmark.line_num)
+
+
+class SpecialCharacterRule(Rule):
+    """标题中需要转义的字符"""
+
+    def check(self, bookmark, final_page, context):
+        found = [char for char in dict.fromkeys(bookmark.title) if char in SPECIAL_CHARACTERS]
+        if found:
+            yield Issue(WARNING, f"包含特殊字符 {' '.join(found)}", bookmark.line_num)
+
+
+class OrderRule(Rule):
+    """页码比上一个书签小"""
+
+    def begin(self, table, context):
+        self.previous = None
+        return ()
+
+    def check(self, bookmark, final_page, context):
+        previous = self.previous
+        self.previous = (final_page, bookmark.line_num)
+        if previous and final_page < previous[0]:
+            yield Issue(WARNING, f"页码顺序不正确 (PDF第{final_page}页排在第{previous[1]}行的"
+                                 f"第{previous[0]}页之后)，建议按页码排序", bookmark.line_num)
+
+
+class DuplicateRule(Rule):
+    """标题和页码都与前面某个书签相同"""
+
+    def begin(self, table, context):
+        self.seen = {}
+        return ()
+
+    def check(self, bookmark, final_page, context):
+        key = (bookmark.title.strip(), final_page)
+        if key in self.seen:
+            yield Issue(WARNING, f"与第{self.seen[key]}行重复: {bookmark.title}", bookmark.line_num)
+        else:
+            self.seen[key] = bookmark.line_num
+
+
+def default_rules():
+    """创建一组新的内置规则（规则带有遍历状态，不要在并发的验证之间共用）"""
+    return [OffsetRule(), UnparsedLineRule(), PageRule(), TitleRule(), SpecialCharacterRule(),
+            OrderRule(), DuplicateRule()]
+
+
+def validate_bookmarks(table, offset=1, page_count=None, rules=None):
+    """用rules（默认为default_rules()）一次遍历BookmarkTable，返回Issue列表
+
+    与单个书签无关的问题在前，其余按书签在目录中的顺序排列
+    """
+    context = ValidationContext(offset, page_count)
+    rules = default_rules() if rules is None else rules
+    issues = []
+    for rule in rules:
+        issues.extend(rule.begin(table, context))
+    for bookmark in table.records():
+        final_page = bookmark.final_page(offset)
+        for rule in rules:
+            issues.extend(rule.check(bookmark, final_page, context))
+    return issues
+
+
+def page_range_errors(table, offset, page_count):
+    """只检查书签是否指向1..page_count之内的页面，返回ERROR级别的Issue列表"""
+    return [issue for issue in validate_bookmarks(table, offset, page_count, [PageRule()])
+            if issue.severity == ERROR]